@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Alert Deduplication
+Fingerprints alerts by rule and key and keeps the open ones in memory, so an
+incident writes one Alert row no matter how often it repeats. Repeats only
+bump a counter and last-seen time, persisted in batches to alert_fingerprints,
+and a global cap on new rows per minute folds alert storms into one summary.
+"""
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, select
+
+import metrics
+
+STORM_TYPE = 'alert_storm'
+
+# Flushes a new alert may fail individually before it is dropped
+MAX_WRITE_ATTEMPTS = 5
+
+
+def fingerprint(alert_type, key):
+    return hashlib.sha1(f"{alert_type}|{key}".encode('utf-8')).hexdigest()
+
+
+class OpenAlert:
+    def __init__(self, fingerprint, alert_type, key, alert, now, alert_id=None, count=1):
+        self.fingerprint = fingerprint
+        self.type = alert_type
+        self.key = key
+        self.alert = alert
+        self.alert_id = alert_id
+        self.count = count
+        self.first_seen = now
+        self.last_seen = now
+        self.dirty = alert_id is None
+        self.attempts = 0
+
+
+class AlertDeduplicator:
+    def __init__(self, db, alert_table, reopen_after=3600, storm_limit=100, flush_interval=10, max_open=50000):
+        self.db = db
+        self.alerts = alert_table
+        self.reopen_after = timedelta(seconds=reopen_after)
+        self.storm_limit = storm_limit
+        self.flush_interval = flush_interval
+        self.max_open = max_open
+        # Called with the newly persisted alert rows after each flush
+        self.listeners = []
+        self.table = Table(
+            'alert_fingerprints', MetaData(),
+            Column('fingerprint', String(40), primary_key=True),
+            Column('alert_id', Integer, index=True, nullable=False),
+            Column('type', String(50), nullable=False),
+            Column('key', String(255)),
+            Column('count', Integer, nullable=False),
+            Column('first_seen', DateTime, nullable=False),
+            Column('last_seen', DateTime, nullable=False, index=True)
+        )
+
+        self._open = {}
+        self._pending_new = []
+        self._minute = None
+        self._new_this_minute = 0
+        self._suppressed = 0
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+        self.created = metrics.REGISTRY.counter('alerts_total', 'Alert submissions', labels={'result': 'new'})
+        self.coalesced = metrics.REGISTRY.counter('alerts_total', 'Alert submissions', labels={'result': 'coalesced'})
+        self.suppressed = metrics.REGISTRY.counter('alerts_total', 'Alert submissions',
+                                                   labels={'result': 'suppressed'})
+        self.open_gauge = metrics.REGISTRY.gauge('alerts_open_fingerprints', 'Open alert fingerprints in memory')
+
+    def ensure_table(self):
+        self.table.create(self.db.engine, checkfirst=True)
+
+    def load_open(self):
+        """Rebuild the open-alert index from fingerprints still inside reopen_after"""
+        since = datetime.now() - self.reopen_after
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(select(self.table).where(self.table.c.last_seen >= since)).all()
+        with self._lock:
+            for row in rows:
+                entry = OpenAlert(row.fingerprint, row.type, row.key, None, row.first_seen,
+                                  alert_id=row.alert_id, count=row.count)
+                entry.last_seen = row.last_seen
+                self._open[row.fingerprint] = entry
+            self.open_gauge.set(len(self._open))
+
+    def submit(self, alert, key):
+        """Register one alert occurrence; returns 'new', 'coalesced' or 'suppressed'"""
+        now = alert.get('created_at') or datetime.now()
+        alert_type = alert['type']
+        digest = fingerprint(alert_type, key)
+        with self._lock:
+            entry = self._open.get(digest)
+            if entry is not None and now - entry.last_seen < self.reopen_after:
+                entry.count += 1
+                entry.last_seen = max(entry.last_seen, now)
+                entry.dirty = True
+                self.coalesced.inc()
+                return 'coalesced'
+
+            if alert_type != STORM_TYPE and not self._admit(now):
+                self._suppressed += 1
+                self.suppressed.inc()
+                return 'suppressed'
+
+            entry = OpenAlert(digest, alert_type, str(key)[:255], alert, now)
+            self._open[digest] = entry
+            self._pending_new.append(entry)
+            self.created.inc()
+            self._evict(now)
+            self.open_gauge.set(len(self._open))
+            return 'new'
+
+    def _admit(self, now):
+        """Per-minute cap on new alert rows across all fingerprints"""
+        minute = now.replace(second=0, microsecond=0)
+        if minute != self._minute:
+            self._minute = minute
+            self._new_this_minute = 0
+        if self._new_this_minute >= self.storm_limit:
+            return False
+        self._new_this_minute += 1
+        return True
+
+    def _evict(self, now):
+        if len(self._open) <= self.max_open:
+            return
+        # Closed incidents first, then the least recently seen
+        for digest, entry in sorted(self._open.items(), key=lambda item: item[1].last_seen):
+            if len(self._open) <= self.max_open:
+                break
+            if entry.alert_id is not None and not entry.dirty:
+                del self._open[digest]
+
+    def flush(self, force=False):
+        """Persist new alerts now and counter updates at most every flush_interval"""
+        with self._lock:
+            if self._suppressed:
+                suppressed, self._suppressed = self._suppressed, 0
+            else:
+                suppressed = 0
+        if suppressed:
+            self.submit({
+                'type': STORM_TYPE,
+                'severity': 'HIGH',
+                'message': f"Alert storm: new alerts capped at {self.storm_limit}/min, "
+                           f"further alerts are being suppressed",
+                'created_at': datetime.now(),
+                'resolved': False
+            }, 'global')
+            with self._lock:
+                self._open[fingerprint(STORM_TYPE, 'global')].count += suppressed - 1
+
+        due = force or time.monotonic() - self._last_flush >= self.flush_interval
+        with self._lock:
+            new_entries, self._pending_new = self._pending_new, []
+            updates = [entry for entry in self._open.values()
+                       if due and entry.dirty and entry.alert_id is not None]
+            # Counts as of this flush; repeats arriving meanwhile stay dirty
+            new_rows = [self._fingerprint_row(entry) for entry in new_entries]
+            update_rows = [{'fp': entry.fingerprint, 'new_count': entry.count, 'new_last_seen': entry.last_seen}
+                           for entry in updates]
+            for entry in new_entries + updates:
+                entry.dirty = False
+            self._expire()
+        if not new_entries and not updates:
+            return 0
+
+        new_pairs = list(zip(new_entries, new_rows))
+        update_pairs = list(zip(updates, update_rows))
+        try:
+            with self.db.engine.begin() as connection:
+                self._write(connection, new_pairs, update_rows)
+            failed_new, failed_updates = [], []
+        except Exception as e:
+            print(f"Alert flush error: {e}")
+            # Write one at a time so a single bad row cannot hold back the rest
+            failed_new = [pair for pair in new_pairs if not self._write_alone([pair], [])]
+            failed_updates = [pair for pair in update_pairs if not self._write_alone([], [pair[1]])]
+
+        if failed_new or failed_updates:
+            with self._lock:
+                retry = []
+                for entry, _ in failed_new:
+                    entry.attempts += 1
+                    if entry.attempts < MAX_WRITE_ATTEMPTS:
+                        retry.append(entry)
+                    else:
+                        print(f"Dropping alert {entry.type} for {entry.key} after {entry.attempts} failed writes")
+                        if self._open.get(entry.fingerprint) is entry:
+                            del self._open[entry.fingerprint]
+                # Retry on the next flush
+                self._pending_new = retry + self._pending_new
+                for entry, _ in failed_updates:
+                    entry.dirty = True
+            new_pairs = [pair for pair in new_pairs if pair not in failed_new]
+
+        self._last_flush = time.monotonic()
+        created = [dict(entry.alert, id=row['alert_id']) for entry, row in new_pairs]
+        with self._lock:
+            for entry, row in new_pairs:
+                entry.alert_id = row['alert_id']
+                entry.alert = None
+                # Repeats that arrived while the row was being written
+                entry.dirty = entry.dirty or entry.count != row['count']
+        if created:
+            for listener in self.listeners:
+                try:
+                    listener(created)
+                except Exception as e:
+                    print(f"Alert listener error: {e}")
+        return len(new_pairs) + len(update_pairs) - len(failed_updates)
+
+    def _write(self, connection, new_pairs, update_rows):
+        if new_pairs:
+            ids = connection.execute(
+                self.alerts.insert().returning(self.alerts.c.id, sort_by_parameter_order=True),
+                [entry.alert for entry, _ in new_pairs]
+            ).scalars().all()
+            for (_, row), alert_id in zip(new_pairs, ids):
+                row['alert_id'] = alert_id
+            self._upsert_fingerprints(connection, [row for _, row in new_pairs])
+        if update_rows:
+            connection.execute(
+                self.table.update().where(self.table.c.fingerprint == bindparam('fp')).values(
+                    count=bindparam('new_count'), last_seen=bindparam('new_last_seen')),
+                update_rows
+            )
+
+    def _write_alone(self, new_pairs, update_rows):
+        try:
+            with self.db.engine.begin() as connection:
+                self._write(connection, new_pairs, update_rows)
+            return True
+        except Exception as e:
+            print(f"Alert write error: {e}")
+            return False
+
+    def _upsert_fingerprints(self, connection, rows):
+        """Insert fingerprint rows, replacing the row of an incident that reopened"""
+        replaced = ('alert_id', 'type', 'key', 'count', 'first_seen', 'last_seen')
+        dialect = connection.dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            if dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert
+            statement = insert(self.table)
+            statement = statement.on_conflict_do_update(
+                index_elements=['fingerprint'],
+                set_={name: statement.excluded[name] for name in replaced}
+            )
+            connection.execute(statement, rows)
+            return
+        connection.execute(self.table.delete().where(
+            self.table.c.fingerprint.in_([row['fingerprint'] for row in rows])))
+        connection.execute(self.table.insert(), rows)
+
+    def _expire(self):
+        """Forget incidents that have been quiet for reopen_after and are persisted"""
+        cutoff = datetime.now() - self.reopen_after
+        for digest in [key for key, entry in self._open.items()
+                          if entry.last_seen < cutoff and not entry.dirty and entry.alert_id is not None]:
+            del self._open[digest]
+        self.open_gauge.set(len(self._open))
+
+    @staticmethod
+    def _fingerprint_row(entry):
+        return {
+            'fingerprint': entry.fingerprint,
+            'alert_id': entry.alert_id,
+            'type': entry.type,
+            'key': entry.key,
+            'count': entry.count,
+            'first_seen': entry.first_seen,
+            'last_seen': entry.last_seen
+        }
@@ -1,19 +1,45 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from datetime import datetime, timedelta
+import math
 import os
 import json
 import pandas as pd
 import plotly.graph_objs as go
 import plotly.utils
 from dotenv import load_dotenv
+from sqlalchemy import select, func
 from log_processor import LogProcessor
 from alert_manager import AlertManager
 from database import init_db
 from models import LogEntry, Alert, Dashboard
-import threading
-import time
+import metrics
+import log_export
+from search_cache import SearchCache, normalize_query
+from scheduler import TaskScheduler
+from partitions import PartitionManager
+from bloom_index import PartitionBloomIndex
+from ingest_buffer import IngestBuffer, enable_sqlite_wal
+from pattern_matcher import MultiPatternMatcher, DEFAULT_RULES
+from hot_window import HotWindow
+from directory_ingest import DirectoryIngestor
+from timestamp_parser import TimestampParser
+from log_query import QueryCompiler, QueryError, parse_query
+from correlation import CorrelationEngine
+from line_parser import LineParser
+from chunked_upload import ChunkedUploadManager, UploadCheckpoints, UploadError
+from alert_dedup import AlertDeduplicator
+from http_analytics import HttpAnalytics
+from metric_extraction import MetricExtractor
+from sessionizer import Sessionizer
+from live_updates import LiveHub
+from log_archive import LogArchive
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 # Load environment variables
 load_dotenv()
@@ -25,12 +51,183 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
 
+# Columns returned by the log listing and search endpoints
+LOG_COLUMNS = ['id', 'timestamp', 'level', 'source', 'message', 'ip_address', 'user_agent']
+
+# Rows fetched per round trip when streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 5000))
+
 db = SQLAlchemy(app)
 CORS(app)
 
 # Initialize components
 log_processor = LogProcessor()
 alert_manager = AlertManager()
+timestamp_parser = TimestampParser()
+search_cache = SearchCache(
+    max_entries=int(os.getenv('SEARCH_CACHE_SIZE', 512)),
+    serve_stale=os.getenv('SEARCH_CACHE_SERVE_STALE', 'False').lower() == 'true'
+)
+partition_manager = PartitionManager(
+    db, LogEntry,
+    interval_hours=int(os.getenv('LOG_PARTITION_HOURS', 24)),
+    enabled=os.getenv('LOG_PARTITIONING', 'True').lower() == 'true'
+)
+bloom_index = PartitionBloomIndex(db, partition_manager)
+query_compiler = QueryCompiler(db, partition_manager, bloom_index)
+ingest_buffer = IngestBuffer(
+    app, db, LogEntry.__table__,
+    max_rows=int(os.getenv('INGEST_BATCH_ROWS', 1000)),
+    max_delay_ms=int(os.getenv('INGEST_BATCH_DELAY_MS', 200))
+)
+ingest_buffer.flush_listeners.append(lambda rows: search_cache.bump_watermark())
+# Late rows for sealed PostgreSQL partitions are added to their Bloom filters
+ingest_buffer.flush_listeners.append(bloom_index.observe)
+
+# Columnar cache of the most recent window for dashboard aggregations
+hot_window = None
+if os.getenv('HOT_WINDOW', 'True').lower() == 'true':
+    hot_window = HotWindow(
+        db, partition_manager,
+        window_hours=int(os.getenv('HOT_WINDOW_HOURS', 24)),
+        max_rows=int(os.getenv('HOT_WINDOW_MAX_ROWS', 5000000))
+    )
+
+# Alert and tagging rules, evaluated once per line as rows are flushed
+if os.getenv('ALERT_RULES_FILE'):
+    rule_matcher = MultiPatternMatcher.from_file(os.getenv('ALERT_RULES_FILE'))
+else:
+    rule_matcher = MultiPatternMatcher(DEFAULT_RULES)
+
+# Cross-source sequence rules, advanced inline with the same rule matches
+correlation_max_keys = int(os.getenv('CORRELATION_MAX_KEYS', 10000))
+if os.getenv('CORRELATION_RULES_FILE'):
+    correlation_engine = CorrelationEngine.from_file(os.getenv('CORRELATION_RULES_FILE'),
+                                                     max_keys_per_rule=correlation_max_keys)
+else:
+    correlation_engine = CorrelationEngine(max_keys_per_rule=correlation_max_keys)
+
+# Repeats of an open incident bump a counter instead of writing Alert rows
+alert_dedup = AlertDeduplicator(
+    db, Alert.__table__,
+    reopen_after=int(os.getenv('ALERT_REOPEN_AFTER', 3600)),
+    storm_limit=int(os.getenv('ALERT_STORM_LIMIT', 100)),
+    flush_interval=int(os.getenv('ALERT_FLUSH_INTERVAL', 10))
+)
+
+def evaluate_rules(rows):
+    """Match freshly ingested rows against every rule in a single pass"""
+    with metrics.stage_timer('alert', len(rows)):
+        for row in rows:
+            matched = rule_matcher.match(row['message'])
+            for alert, key in correlation_engine.observe(row, matched):
+                alert_dedup.submit(alert, key)
+            for rule_id in matched:
+                metrics.REGISTRY.counter('rule_matches_total', 'Log lines matched per rule',
+                                         labels={'rule': rule_id}).inc()
+                rule = rule_matcher.rules[rule_id]
+                if rule.alert:
+                    alert_dedup.submit({
+                        'type': rule_id,
+                        'severity': rule.severity,
+                        'message': f"[{row['source']}] {row['message']}",
+                        'created_at': datetime.now(),
+                        'resolved': False
+                    }, row['source'])
+    alert_dedup.flush()
+
+ingest_buffer.flush_listeners.append(evaluate_rules)
+
+# Typed request rows and endpoint x status-class minute rollups for access logs
+http_analytics = HttpAnalytics(
+    db,
+    store_requests=os.getenv('HTTP_STORE_REQUESTS', 'True').lower() == 'true',
+    minute_retention_hours=int(os.getenv('HTTP_MINUTE_RETENTION_HOURS', 48)),
+    request_retention_days=int(os.getenv('HTTP_REQUEST_RETENTION_DAYS', 30)),
+    hour_retention_days=int(os.getenv('HTTP_HOUR_RETENTION_DAYS', 90))
+)
+ingest_buffer.flush_listeners.append(http_analytics.observe)
+
+# Numeric samples pulled from messages into per-minute histograms
+metric_retention = {
+    'minute_retention_hours': int(os.getenv('METRIC_MINUTE_RETENTION_HOURS', 48)),
+    'hour_retention_days': int(os.getenv('METRIC_HOUR_RETENTION_DAYS', 90)),
+}
+if os.getenv('METRIC_RULES_FILE'):
+    metric_extractor = MetricExtractor.from_file(db, os.getenv('METRIC_RULES_FILE'), **metric_retention)
+else:
+    metric_extractor = MetricExtractor(db, **metric_retention)
+ingest_buffer.flush_listeners.append(metric_extractor.observe)
+
+def suspicious_session(session, reasons):
+    """Raise a deduplicated alert for a session that looks like abuse"""
+    alert_dedup.submit({
+        'type': 'suspicious_session',
+        'severity': 'HIGH',
+        'message': f"Suspicious session for {session.key_type} {session.client} "
+                   f"({session.start.isoformat()} - {session.end.isoformat()}): {'; '.join(reasons)}",
+        'created_at': datetime.now(),
+        'resolved': False
+    }, f"{session.key_type}:{session.client}")
+
+# Client sessions from access logs, summarized into client_sessions when they close
+sessionizer = Sessionizer(
+    db,
+    gap_seconds=int(os.getenv('SESSION_GAP_SECONDS', 1800)),
+    max_sessions=int(os.getenv('SESSION_MAX_OPEN', 100000)),
+    on_suspicious=suspicious_session
+)
+
+def sessionize(rows):
+    sessionizer.observe(rows)
+    alert_dedup.flush()
+
+ingest_buffer.flush_listeners.append(sessionize)
+
+# Deltas pushed to connected dashboards instead of each one polling
+live_hub = LiveHub(
+    max_fps=float(os.getenv('LIVE_MAX_FPS', 2)),
+    max_frames=int(os.getenv('LIVE_MAX_QUEUED_FRAMES', 32))
+)
+# Raw rows -> gzip NDJSON segments + hour rollups -> day rollups
+log_archive = LogArchive(
+    db, partition_manager, os.getenv('LOG_ARCHIVE_FOLDER', 'archive'),
+    raw_days=int(os.getenv('LOG_RAW_RETENTION_DAYS', 0)),
+    hour_days=int(os.getenv('LOG_HOUR_RETENTION_DAYS', 90)),
+    day_days=int(os.getenv('LOG_DAY_RETENTION_DAYS', 0)),
+    interval_hours=int(os.getenv('LOG_PARTITION_HOURS', 24))
+)
+
+LIVE_PING_SECONDS = int(os.getenv('LIVE_PING_SECONDS', 20))
+ingest_buffer.flush_listeners.append(live_hub.observe)
+alert_dedup.listeners.append(live_hub.publish_alerts)
+
+upload_checkpoints = UploadCheckpoints(db)
+
+def ingest_rows_durably(rows, checkpoint=None):
+    """Queue parsed rows and return once they are committed, together with an upload checkpoint"""
+    writes = [lambda connection: upload_checkpoints.write(connection, checkpoint)] if checkpoint else None
+    if not ingest_buffer.wait(ingest_buffer.add_many(rows, writes), timeout=300):
+        raise TimeoutError('Ingest buffer did not flush within 300s')
+
+# Uploaded and dropped-in files are parsed here and go through the ingest
+# buffer, so alerts, analytics, sessions and live updates see their rows too
+directory_ingestor = DirectoryIngestor(
+    app, db, log_processor,
+    max_workers=int(os.getenv('INGEST_CONCURRENCY', 4)),
+    line_parser=LineParser(timestamp_parser), sink=ingest_rows_durably
+)
+
+# Resumable chunked uploads live in a subdirectory the directory scan skips
+chunked_uploads = ChunkedUploadManager(
+    os.path.join(app.config['UPLOAD_FOLDER'], '.chunked'),
+    LineParser(timestamp_parser), ingest_rows_durably,
+    chunk_size=int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)),
+    checkpoints=upload_checkpoints
+)
+
+with app.app_context():
+    enable_sqlite_wal(db.engine)
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -44,19 +241,21 @@ def dashboard():
 def get_stats():
     """Get overall statistics"""
     try:
-        # Get recent log entries
-        recent_logs = LogEntry.query.filter(
-            LogEntry.timestamp >= datetime.now() - timedelta(hours=24)
-        ).all()
+        # Count recent log entries by level and source
+        since = datetime.now() - timedelta(hours=24)
+        counts = level_source_counts(since)
         
         # Calculate statistics
-        total_logs = len(recent_logs)
-        error_logs = len([log for log in recent_logs if log.level == 'ERROR'])
-        warning_logs = len([log for log in recent_logs if log.level == 'WARNING'])
-        info_logs = len([log for log in recent_logs if log.level == 'INFO'])
+        level_counts = {}
+        for level, _, count in counts:
+            level_counts[level] = level_counts.get(level, 0) + count
+        total_logs = sum(level_counts.values())
+        error_logs = level_counts.get('ERROR', 0)
+        warning_logs = level_counts.get('WARNING', 0)
+        info_logs = level_counts.get('INFO', 0)
         
         # Get unique sources
-        sources = list(set([log.source for log in recent_logs]))
+        sources = list(set([source for _, source, _ in counts]))
         
         # Get recent alerts
         recent_alerts = Alert.query.filter(
@@ -84,28 +283,23 @@ def get_logs():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 50, type=int)
-        level = request.args.get('level', '')
-        source = request.args.get('source', '')
-        
-        # Build query
-        query = LogEntry.query
-        
-        if level:
-            query = query.filter(LogEntry.level == level)
-        if source:
-            query = query.filter(LogEntry.source == source)
-        
-        # Order by timestamp descending
-        query = query.order_by(LogEntry.timestamp.desc())
         
-        # Paginate
-        logs = query.paginate(
-            page=page, per_page=per_page, error_out=False
+        # Build query over the partitions the time range touches
+        logs = partition_manager.source(*parse_time_range(request.args))
+        query = select(*[logs.c[name] for name in LOG_COLUMNS]).where(
+            *build_log_filters(request.args, logs.c)
         )
+        total = db.session.execute(select(func.count()).select_from(query.subquery())).scalar()
+        
+        # Order by timestamp descending and paginate
+        page = max(page, 1)
+        rows = db.session.execute(
+            query.order_by(logs.c.timestamp.desc()).limit(per_page).offset((page - 1) * per_page)
+        ).all()
         
         # Convert to JSON
         log_data = []
-        for log in logs.items:
+        for log in rows:
             log_data.append({
                 'id': log.id,
                 'timestamp': log.timestamp.isoformat(),
@@ -119,15 +313,43 @@ def get_logs():
         return jsonify({
             'logs': log_data,
             'pagination': {
-                'page': logs.page,
-                'per_page': logs.per_page,
-                'total': logs.total,
-                'pages': logs.pages
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': math.ceil(total / per_page) if per_page else 0
             }
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/logs/export')
+def export_logs():
+    """Stream all matching log entries as NDJSON or CSV"""
+    try:
+        fmt = request.args.get('format', 'ndjson').lower()
+        compress = request.args.get('gzip', 'false').lower() in ('1', 'true', 'yes')
+        if fmt not in log_export.FORMATS:
+            return jsonify({'error': f'Unsupported export format: {fmt}'}), 400
+        
+        # Column-only query streamed through a server-side cursor
+        logs = partition_manager.source(*parse_time_range(request.args))
+        query = db.session.execute(
+            select(*[logs.c[name] for name in log_export.EXPORT_COLUMNS])
+            .where(*build_log_filters(request.args, logs.c))
+            .order_by(logs.c.timestamp.desc())
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        
+        chunks, mimetype, extension = log_export.export_stream(query, fmt, compress)
+        filename = f"logs-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/upload', methods=['POST'])
 def upload_log_file():
     """Upload and process log file"""
@@ -142,10 +364,17 @@ def upload_log_file():
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            with metrics.stage_timer('read'):
+                file.save(filepath)
             
-            # Process the file
-            results = log_processor.process_file(filepath)
+            # Process the file unless identical content was ingested before
+            results = directory_ingestor.ingest_file(filepath)
+            if results['status'] == 'duplicate':
+                return jsonify({
+                    'message': 'File already ingested; skipped duplicate content',
+                    'results': results
+                })
+            search_cache.bump_watermark()
             
             return jsonify({
                 'message': 'File uploaded and processed successfully',
@@ -157,6 +386,129 @@ def upload_log_file():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Start a chunked upload: {filename, size, chunk_size?, sha256?}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename', '')
+        if not filename or not allowed_file(filename):
+            return jsonify({'error': 'Invalid file type'}), 400
+        
+        sha256 = (data.get('sha256') or '').lower() or None
+        if sha256 and directory_ingestor.is_ingested(sha256):
+            return jsonify({'message': 'File already ingested; skipped duplicate content', 'status': 'duplicate'})
+        
+        session = chunked_uploads.create(filename, int(data.get('size', 0)),
+                                         chunk_size=data.get('chunk_size'), sha256=sha256)
+        return jsonify(session.to_dict()), 201
+    except (UploadError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    """Chunks received and missing, for resuming an interrupted upload"""
+    try:
+        return jsonify(chunked_uploads.get(upload_id).to_dict())
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def upload_chunk(upload_id, index):
+    """Store one chunk; chunks may arrive in any order and in parallel"""
+    try:
+        with metrics.stage_timer('read'):
+            data = request.get_data(cache=False)
+        session = chunked_uploads.put_chunk(upload_id, index, data)
+        return jsonify({'upload_id': upload_id, 'chunk': index, 'missing_chunks': len(session.missing()),
+                        'error': session.error})
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Finish parsing, verify the checksum and record the file as ingested"""
+    try:
+        session = chunked_uploads.finalize(upload_id)
+        content_hash = session.content_hash
+        if session.sha256 and session.sha256 != content_hash:
+            return jsonify({'error': f'Checksum mismatch: expected {session.sha256}, got {content_hash}'}), 400
+        
+        results = session.to_dict()
+        results['content_hash'] = content_hash
+        recorded = directory_ingestor.record_file(session.path, session.filename, content_hash=content_hash)
+        chunked_uploads.remove(upload_id)
+        search_cache.bump_watermark()
+        
+        if not recorded:
+            # Only known once the last chunk is hashed, after its rows were stored
+            directory_ingestor.duplicates.inc()
+            results['status'] = 'duplicate'
+            return jsonify({
+                'message': 'File content was already ingested; pass sha256 when creating the upload '
+                           'to skip duplicates before sending them',
+                'results': results
+            })
+        results['status'] = 'ingested'
+        return jsonify({'message': 'File uploaded and processed successfully', 'results': results})
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+    except UploadError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    """Abandon a chunked upload and delete its partial file"""
+    try:
+        chunked_uploads.remove(upload_id)
+        return jsonify({'message': 'Upload aborted'})
+    except KeyError:
+        return jsonify({'error': 'Unknown upload'}), 404
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest_entries():
+    """Accept a JSON array of log entries and queue them for group commit"""
+    try:
+        entries = request.get_json(silent=True)
+        if isinstance(entries, dict):
+            entries = [entries]
+        if not isinstance(entries, list) or not entries:
+            return jsonify({'error': 'Expected a JSON log entry or array of entries'}), 400
+        
+        rows = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not entry.get('message'):
+                return jsonify({'error': 'Every entry needs a message'}), 400
+            timestamp = entry.get('timestamp')
+            if 'timestamp' in entry and not isinstance(timestamp, str):
+                return jsonify({'error': 'timestamp must be a string'}), 400
+            rows.append({
+                'timestamp': timestamp_parser.parse_any(timestamp) if timestamp else datetime.now(),
+                'level': entry.get('level', 'INFO'),
+                'source': entry.get('source', 'api'),
+                'message': entry['message'],
+                'ip_address': entry.get('ip_address') or request.remote_addr,
+                'user_agent': entry.get('user_agent')
+            })
+        
+        ticket = ingest_buffer.add_many(rows)
+        if request.args.get('wait', 'false').lower() == 'true':
+            ingest_buffer.wait(ticket, timeout=30)
+        
+        return jsonify({'message': 'Entries queued', 'accepted': len(rows)}), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/charts/timeline')
 def get_timeline_chart():
     """Get timeline chart data"""
@@ -165,18 +517,11 @@ def get_timeline_chart():
         
         # Get logs from the last N hours
         since = datetime.now() - timedelta(hours=hours)
-        logs = LogEntry.query.filter(LogEntry.timestamp >= since).all()
         
         # Group by hour and level
-        df = pd.DataFrame([{
-            'timestamp': log.timestamp,
-            'level': log.level
-        } for log in logs])
-        
-        if not df.empty:
-            df['hour'] = df['timestamp'].dt.floor('h')
-            grouped = df.groupby(['hour', 'level']).size().reset_index(name='count')
-            
+        grouped = hourly_level_counts(since)
+        
+        if not grouped.empty:
             # Create plotly chart
             fig = go.Figure()
             
@@ -211,12 +556,9 @@ def get_sources_chart():
     try:
         # Get logs from the last 24 hours
         since = datetime.now() - timedelta(hours=24)
-        logs = LogEntry.query.filter(LogEntry.timestamp >= since).all()
         
         # Count by source
-        source_counts = {}
-        for log in logs:
-            source_counts[log.source] = source_counts.get(log.source, 0) + 1
+        source_counts = source_counts_since(since)
         
         if source_counts:
             fig = go.Figure(data=[go.Pie(
@@ -239,7 +581,13 @@ def get_sources_chart():
 def get_alerts():
     """Get recent alerts"""
     try:
-        alerts = Alert.query.order_by(Alert.created_at.desc()).limit(10).all()
+        alerts_table = Alert.__table__
+        fingerprints = alert_dedup.table
+        alerts = db.session.execute(
+            select(alerts_table, fingerprints.c.count, fingerprints.c.last_seen)
+            .outerjoin(fingerprints, fingerprints.c.alert_id == alerts_table.c.id)
+            .order_by(alerts_table.c.created_at.desc()).limit(10)
+        ).all()
         
         alert_data = []
         for alert in alerts:
@@ -249,25 +597,213 @@ def get_alerts():
                 'severity': alert.severity,
                 'message': alert.message,
                 'created_at': alert.created_at.isoformat(),
-                'resolved': alert.resolved
+                'resolved': alert.resolved,
+                'count': alert.count or 1,
+                'last_seen': (alert.last_seen or alert.created_at).isoformat()
             })
         
         return jsonify({'alerts': alert_data})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/http/routes')
+def http_routes():
+    """Traffic and error rates per endpoint from the HTTP rollups"""
+    try:
+        since, until = parse_window(request.args)
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({'routes': http_analytics.route_stats(since, until, limit=limit)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/http/timeline')
+def http_timeline():
+    """Requests per minute by status class, optionally for one endpoint"""
+    try:
+        since, until = parse_window(request.args)
+        endpoint = request.args.get('endpoint', '')
+        return jsonify({'timeline': http_analytics.timeline(since, until, endpoint=endpoint or None)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/http/requests')
+def http_requests():
+    """Recent typed request rows, filtered by status and/or endpoint"""
+    try:
+        since, _ = parse_window(request.args)
+        requests = http_analytics.recent_requests(
+            since,
+            status=request.args.get('status', type=int),
+            endpoint=request.args.get('endpoint', '') or None,
+            limit=min(request.args.get('limit', 100, type=int), 1000)
+        )
+        return jsonify({'requests': requests})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics/summary')
+def metric_summary():
+    """Count, mean and p50/p95/p99 per extracted metric and source"""
+    try:
+        since, until = parse_window(request.args)
+        results = metric_extractor.summary(
+            since, until,
+            metric=request.args.get('metric', '') or None,
+            source=request.args.get('source', '') or None
+        )
+        return jsonify({'metrics': results})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/metrics/series')
+def metric_series():
+    """Per-minute percentiles of one extracted metric"""
+    try:
+        metric = request.args.get('metric', '')
+        if not metric:
+            return jsonify({'error': 'No metric provided'}), 400
+        since, until = parse_window(request.args)
+        series = metric_extractor.series(metric, since, until, source=request.args.get('source', '') or None)
+        return jsonify({'metric': metric, 'unit': metric_extractor.units().get(metric, ''), 'series': series})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sessions')
+def client_sessions():
+    """Session summaries for a client (user or IP), open sessions included"""
+    try:
+        since, _ = parse_window(request.args, default_minutes=24 * 60)
+        client = request.args.get('client', '') or None
+        suspicious = request.args.get('suspicious', 'false').lower() == 'true'
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        sessions = sessionizer.sessions(since, client=client, suspicious=suspicious, limit=limit)
+        if client and not suspicious:
+            sessions = sessionizer.open_sessions(client) + sessions
+        return jsonify({'sessions': sessions})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws/live')
+    def live_updates(ws):
+        """Push dashboard deltas to one client until it disconnects"""
+        subscriber = live_hub.subscribe()
+        try:
+            ws.send(live_hub.hello())
+            while True:
+                frame = subscriber.next(timeout=LIVE_PING_SECONDS)
+                ws.send(frame if frame is not None else '{"type": "ping"}')
+        finally:
+            live_hub.unsubscribe(subscriber)
+else:
+    app.logger.warning("flask-sock is not installed; /ws/live is disabled and dashboards must poll")
+
+@app.route('/api/archive/search')
+def archive_search():
+    """Scan archived segments overlapping the window; slower than /api/logs"""
+    try:
+        since, until = parse_window(request.args, default_minutes=24 * 60)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        logs = log_archive.scan(
+            since, until,
+            level=request.args.get('level', '') or None,
+            source=request.args.get('source', '') or None,
+            contains=request.args.get('q', '') or None,
+            limit=limit
+        )
+        return jsonify({'logs': logs, 'segments': len(log_archive.list_segments(since, until))})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/archive/counts')
+def archive_counts():
+    """Level x source counts of archived data from the hour or day rollups"""
+    try:
+        since, until = parse_window(request.args, default_minutes=7 * 24 * 60)
+        resolution = request.args.get('resolution', 'hour')
+        if resolution not in ('hour', 'day'):
+            return jsonify({'error': 'resolution must be hour or day'}), 400
+        return jsonify({'resolution': resolution, 'counts': log_archive.counts(since, until, resolution)})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/archive/segments')
+def archive_segments():
+    """Archive segments on disk with their time ranges"""
+    try:
+        segments = log_archive.list_segments()
+        for segment in segments:
+            for name in ('start', 'end', 'min_timestamp', 'max_timestamp', 'archived_at'):
+                segment[name] = segment[name].isoformat()
+        return jsonify({'segments': segments})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/search')
 def search_logs():
-    """Search logs by query"""
+    """Search logs with the query language, e.g. level:ERROR source:nginx "timeout" after:-2h"""
     try:
         query = request.args.get('q', '')
         if not query:
             return jsonify({'error': 'No search query provided'}), 400
         
-        # Search in message field
-        logs = LogEntry.query.filter(
-            LogEntry.message.contains(query)
-        ).order_by(LogEntry.timestamp.desc()).limit(100).all()
+        filters = {key: request.args.get(key, '') for key in ('level', 'source', 'since', 'until')}
+        parsed = parse_query(query, filters)
+        strict = request.args.get('strict', os.getenv('SEARCH_REJECT_FULL_SCANS', 'False')).lower() == 'true'
+        plan = query_compiler.check(parsed, strict=strict)
+        
+        # Plan inspection: show how the query would run without running it
+        if request.args.get('explain', 'false').lower() == 'true':
+            statement = query_compiler.compile(parsed, LOG_COLUMNS)
+            plan['database_plan'] = query_compiler.explain(statement)
+            return jsonify({'plan': plan})
+        
+        def run_search():
+            with app.app_context():
+                return search_log_entries(parsed)
+        
+        if parsed.relative:
+            # after:-2h names a different window on every request; caching it
+            # under its text would keep serving the window it was first run for
+            log_data = run_search()
+        else:
+            log_data = search_cache.get_or_compute(normalize_query(query, filters), run_search)
+        
+        return jsonify({'logs': log_data, 'warnings': plan['warnings']})
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/lookup')
+def lookup_logs():
+    """Find every log line for an IP address and/or user"""
+    try:
+        ip = request.args.get('ip', '')
+        user = request.args.get('user', '')
+        days = request.args.get('days', 30, type=int)
+        if not ip and not user:
+            return jsonify({'error': 'Provide an ip or user to look up'}), 400
+        
+        logs, stats = bloom_index.lookup(ip=ip or None, user=user or None, days=days)
         
         log_data = []
         for log in logs:
@@ -280,10 +816,118 @@ def search_logs():
                 'ip_address': log.ip_address
             })
         
-        return jsonify({'logs': log_data})
+        return jsonify({'logs': log_data, 'stats': stats})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Expose pipeline metrics in Prometheus text format"""
+    metrics.queue_depth('upload_dir').set(count_pending_files(app.config['UPLOAD_FOLDER']))
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def count_pending_files(directory):
+    """Count files waiting in the upload directory"""
+    try:
+        return sum(1 for entry in os.scandir(directory) if entry.is_file())
+    except OSError:
+        return 0
+
+def search_log_entries(parsed):
+    """Run a parsed query and return serialized matches"""
+    logs = db.session.execute(query_compiler.compile(parsed, LOG_COLUMNS, limit=100)).all()
+    
+    log_data = []
+    for log in logs:
+        log_data.append({
+            'id': log.id,
+            'timestamp': log.timestamp.isoformat(),
+            'level': log.level,
+            'source': log.source,
+            'message': log.message,
+            'ip_address': log.ip_address
+        })
+    return log_data
+
+def use_hot_window(since):
+    """Whether the hot window can answer a query starting at since"""
+    if hot_window is None:
+        return False
+    hot_window.refresh()
+    if hot_window.covers(since):
+        return True
+    hot_window.fallbacks.inc()
+    return False
+
+def level_source_counts(since):
+    """Return [(level, source, count)] for entries at or after since"""
+    if use_hot_window(since):
+        return hot_window.level_source_counts(since)
+    logs = partition_manager.source(since)
+    return db.session.execute(
+        select(logs.c.level, logs.c.source, func.count())
+        .where(logs.c.timestamp >= since)
+        .group_by(logs.c.level, logs.c.source)
+    ).all()
+
+def source_counts_since(since):
+    """Return {source: count} for entries at or after since"""
+    if use_hot_window(since):
+        return hot_window.source_counts(since)
+    logs = partition_manager.source(since)
+    rows = db.session.execute(
+        select(logs.c.source, func.count()).where(logs.c.timestamp >= since).group_by(logs.c.source)
+    ).all()
+    return {source: count for source, count in rows}
+
+def hourly_level_counts(since):
+    """Return a DataFrame of hour, level and count for entries at or after since"""
+    if use_hot_window(since):
+        return pd.DataFrame(hot_window.hourly_level_counts(since), columns=['hour', 'level', 'count'])
+    logs = partition_manager.source(since)
+    rows = db.session.execute(
+        select(logs.c.timestamp, logs.c.level).where(logs.c.timestamp >= since)
+    ).all()
+    df = pd.DataFrame(rows, columns=['timestamp', 'level'])
+    if df.empty:
+        return pd.DataFrame(columns=['hour', 'level', 'count'])
+    df['hour'] = df['timestamp'].dt.floor('h')
+    return df.groupby(['hour', 'level']).size().reset_index(name='count')
+
+def parse_time_range(args):
+    """Return the (since, until) datetimes requested, either may be None"""
+    since = args.get('since', '')
+    until = args.get('until', '')
+    return (
+        datetime.fromisoformat(since) if since else None,
+        datetime.fromisoformat(until) if until else None
+    )
+
+def parse_window(args, default_minutes=60):
+    """Return (since, until) from since/until or a trailing minutes= window"""
+    since, until = parse_time_range(args)
+    if since is None:
+        minutes = args.get('minutes', default_minutes, type=int)
+        since = (until or datetime.now()) - timedelta(minutes=minutes)
+    return since, until
+
+def build_log_filters(args, columns):
+    """Build log filter criteria from request arguments"""
+    filters = []
+    level = args.get('level', '')
+    source = args.get('source', '')
+    since, until = parse_time_range(args)
+    
+    if level:
+        filters.append(columns.level == level)
+    if source:
+        filters.append(columns.source == source)
+    if since:
+        filters.append(columns.timestamp >= since)
+    if until:
+        filters.append(columns.timestamp < until)
+    return filters
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     ALLOWED_EXTENSIONS = {'log', 'txt', 'json'}
@@ -296,30 +940,156 @@ def secure_filename(filename):
     filename = re.sub(r'[^\w\s-]', '', filename).strip()
     return re.sub(r'[-\s]+', '-', filename)
 
-def background_processor():
-    """Background task to process logs continuously"""
-    while True:
-        try:
-            # Process any new log files
-            log_processor.process_directory(app.config['UPLOAD_FOLDER'])
-            
-            # Check for alerts
+def ingest_uploads():
+    """Process any new log files in the upload directory"""
+    with app.app_context():
+        metrics.queue_depth('upload_dir').set(count_pending_files(app.config['UPLOAD_FOLDER']))
+        results = directory_ingestor.process_directory(app.config['UPLOAD_FOLDER'])
+        if any(result['status'] in ('ingested', 'appended') for result in results):
+            search_cache.bump_watermark()
+
+def evaluate_alerts():
+    """Run alert rules against recent log entries"""
+    with app.app_context():
+        with metrics.stage_timer('alert'):
             alert_manager.check_alerts()
-            
-            # Sleep for processing interval
-            time.sleep(int(os.getenv('PROCESSING_INTERVAL', 30)))
-        except Exception as e:
-            print(f"Background processing error: {e}")
-            time.sleep(60)  # Wait longer on error
+
+# Callables that fold fine-grained rollups into coarser ones; modules that
+# maintain rollup tables register themselves here
+ROLLUP_COMPACTORS = [http_analytics.compact, metric_extractor.compact]
+
+def compact_rollups():
+    """Run every registered rollup compactor"""
+    with app.app_context():
+        for compactor in ROLLUP_COMPACTORS:
+            compactor()
+
+def maintain_partitions():
+    """Seal completed partitions or pre-create upcoming ones"""
+    with app.app_context():
+        partition_manager.maintain()
+
+# Callables that delete rows past their retention from tables derived from
+# the logs; modules that keep such tables register themselves here
+RETENTION_POLICIES = [http_analytics.expire, metric_extractor.expire]
+
+def enforce_retention():
+    """Archive and downsample by tier, or drop data older than LOG_RETENTION_DAYS (0 keeps everything)"""
+    with app.app_context():
+        for policy in RETENTION_POLICIES:
+            policy()
+    if log_archive.enabled:
+        with app.app_context():
+            log_archive.run()
+            search_cache.bump_watermark()
+        return
+    retention_days = int(os.getenv('LOG_RETENTION_DAYS', 0))
+    if retention_days <= 0:
+        return
+    with app.app_context():
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        if partition_manager.enabled:
+            partition_manager.drop_before(cutoff)
+        else:
+            LogEntry.query.filter(LogEntry.timestamp < cutoff).delete(synchronize_session=False)
+            db.session.commit()
+        search_cache.bump_watermark()
+
+def expire_uploads():
+    """Drop chunked uploads idle for longer than UPLOAD_SESSION_TTL_HOURS"""
+    with app.app_context():
+        chunked_uploads.expire(int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24)) * 3600)
+
+def flush_alert_counters():
+    """Persist coalesced alert counts and last-seen times"""
+    with app.app_context():
+        alert_dedup.flush(force=True)
+
+def sweep_sessions():
+    """Close sessions that have been idle longer than the session gap"""
+    with app.app_context():
+        sessionizer.sweep()
+        alert_dedup.flush()
+
+def create_scheduler():
+    """Register the background jobs, each with its own cadence"""
+    task_scheduler = TaskScheduler(max_workers=int(os.getenv('SCHEDULER_WORKERS', 4)))
+    task_scheduler.add_task(
+        'ingest', ingest_uploads,
+        interval=int(os.getenv('PROCESSING_INTERVAL', 30)), jitter=2,
+        timeout=int(os.getenv('INGEST_TIMEOUT', 300))
+    )
+    task_scheduler.add_task(
+        'alerts', evaluate_alerts,
+        interval=int(os.getenv('ALERT_INTERVAL', 15)), jitter=1,
+        timeout=int(os.getenv('ALERT_TIMEOUT', 60))
+    )
+    task_scheduler.add_task(
+        'alert_flush', flush_alert_counters,
+        interval=int(os.getenv('ALERT_FLUSH_INTERVAL', 10)), jitter=1,
+        timeout=int(os.getenv('ALERT_FLUSH_TIMEOUT', 60)), run_immediately=False
+    )
+    task_scheduler.add_task(
+        'sessions', sweep_sessions,
+        interval=int(os.getenv('SESSION_SWEEP_INTERVAL', 60)), jitter=5,
+        timeout=int(os.getenv('SESSION_SWEEP_TIMEOUT', 120)), run_immediately=False
+    )
+    task_scheduler.add_task(
+        'rollup_compaction', compact_rollups,
+        interval=int(os.getenv('ROLLUP_INTERVAL', 300)), jitter=30,
+        timeout=int(os.getenv('ROLLUP_TIMEOUT', 600)), run_immediately=False
+    )
+    task_scheduler.add_task(
+        'partitions', maintain_partitions,
+        interval=int(os.getenv('PARTITION_INTERVAL', 600)), jitter=30,
+        timeout=int(os.getenv('PARTITION_TIMEOUT', 1800))
+    )
+    task_scheduler.add_task(
+        'retention', enforce_retention,
+        interval=int(os.getenv('RETENTION_INTERVAL', 3600)), jitter=60,
+        timeout=int(os.getenv('RETENTION_TIMEOUT', 1800)), run_immediately=False
+    )
+    task_scheduler.add_task(
+        'upload_expiry', expire_uploads,
+        interval=int(os.getenv('UPLOAD_EXPIRY_INTERVAL', 3600)), jitter=60,
+        timeout=int(os.getenv('UPLOAD_EXPIRY_TIMEOUT', 300)), run_immediately=False
+    )
+    return task_scheduler
+
+task_scheduler = create_scheduler()
+
+@app.route('/api/scheduler')
+def scheduler_status():
+    """Get the state of each background task"""
+    return jsonify({'tasks': task_scheduler.status()})
 
 if __name__ == '__main__':
     # Initialize database
     with app.app_context():
         init_db()
+        directory_ingestor.ensure_table()
+        alert_dedup.ensure_table()
+        http_analytics.ensure_tables()
+        metric_extractor.ensure_tables()
+        sessionizer.ensure_table()
+        log_archive.ensure_tables()
+        upload_checkpoints.ensure_table()
+        alert_dedup.load_open()
+        chunked_uploads.load_sessions()
+        live_hub.seed_sources(source_counts_since(datetime.now() - timedelta(hours=24)))
     
-    # Start background processor
-    bg_thread = threading.Thread(target=background_processor, daemon=True)
-    bg_thread.start()
+    # Start background tasks
+    ingest_buffer.start()
+    live_hub.start()
+    task_scheduler.start()
     
     # Run the app
-    app.run(debug=os.getenv('DEBUG', 'True').lower() == 'true', host='0.0.0.0', port=5000)
+    try:
+        app.run(debug=os.getenv('DEBUG', 'True').lower() == 'true', host='0.0.0.0', port=5000)
+    finally:
+        task_scheduler.stop()
+        ingest_buffer.stop()
+        live_hub.stop()
+        with app.app_context():
+            sessionizer.flush_all()
+        flush_alert_counters()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Partition Bloom Index
+Compact Bloom filters over IP addresses and usernames for each sealed log
+partition, so needle lookups only open partitions that may hold the key
+"""
+
+import hashlib
+import math
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, LargeBinary, MetaData, String, Table, or_, select
+
+import metrics
+
+# Username mentions in the message templates and access-log formats we ingest
+USERNAME_PATTERNS = [
+    re.compile(r'\buser (\w[\w.-]*)'),
+    re.compile(r'\bby (\w[\w.-]*)'),
+    re.compile(r'\bfor (\w[\w.-]*)@'),
+    re.compile(r'^\S+ - (\w[\w.-]*) \['),
+]
+
+
+def extract_usernames(message):
+    """Return the set of usernames mentioned in a log message"""
+    if not message:
+        return set()
+    names = set()
+    for pattern in USERNAME_PATTERNS:
+        names.update(pattern.findall(message))
+    names.discard('-')
+    return names
+
+
+class BloomFilter:
+    def __init__(self, capacity=10000, error_rate=0.01, bits=None, num_hashes=None):
+        capacity = max(capacity, 1)
+        self.size = len(bits) * 8 if bits is not None else \
+            max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = num_hashes or max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Kirsch-Mitzenmacher double hashing from a single digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.num_hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class PartitionBloomIndex:
+    def __init__(self, db, partition_manager, error_rate=0.01):
+        self.db = db
+        self.partitions = partition_manager
+        self.error_rate = error_rate
+        self._filters = {}
+        self.table = Table(
+            'log_partition_blooms', MetaData(),
+            Column('partition', String(128), primary_key=True),
+            Column('num_hashes', Integer, nullable=False),
+            Column('items', Integer, nullable=False),
+            Column('bits', LargeBinary, nullable=False)
+        )
+
+        self.checked = metrics.REGISTRY.counter('bloom_partitions_checked_total',
+                                                'Partitions tested against a Bloom filter')
+        self.skipped = metrics.REGISTRY.counter('bloom_partitions_skipped_total',
+                                                'Partitions skipped because the Bloom filter ruled them out')
+
+        partition_manager.seal_listeners.append(self.build)
+        partition_manager.drop_listeners.append(self.discard)
+
+    @staticmethod
+    def ip_key(ip):
+        return f"ip:{ip}"
+
+    @staticmethod
+    def user_key(user):
+        return f"user:{user.lower()}"
+
+    @staticmethod
+    def normalize_key(key):
+        """Usernames are stored lower-cased, so user: keys are looked up that way too"""
+        if key.startswith('user:'):
+            return key[:5] + key[5:].lower()
+        return key
+
+    def build(self, name, partition):
+        """(Re)build the filter for a sealed partition"""
+        rows = self.db.session.execute(select(partition.c.ip_address, partition.c.message)).all()
+        keys = set()
+        for ip_address, message in rows:
+            if ip_address:
+                keys.add(self.ip_key(ip_address))
+            for user in extract_usernames(message):
+                keys.add(self.user_key(user))
+
+        bloom = BloomFilter(capacity=len(keys), error_rate=self.error_rate)
+        for key in keys:
+            bloom.add(key)
+
+        self.table.create(self.db.session.connection(), checkfirst=True)
+        self.db.session.execute(self.table.delete().where(self.table.c.partition == name))
+        self.db.session.execute(self.table.insert().values(
+            partition=name, num_hashes=bloom.num_hashes, items=len(keys), bits=bytes(bloom.bits)
+        ))
+        self.db.session.commit()
+        self._filters[name] = bloom
+        return bloom
+
+    def observe(self, rows):
+        """Flush listener: add late rows' keys to the filters of sealed partitions
+
+        Only needed on PostgreSQL, where a late row lands in its partition;
+        on SQLite it goes to the head table, which is always read.
+        """
+        if not self.partitions.enabled or self.partitions.dialect != 'postgresql':
+            return
+        open_after = datetime.now() - self.partitions.seal_grace
+        late = {}
+        for row in rows:
+            timestamp = row.get('timestamp')
+            if timestamp is None:
+                continue
+            start = self.partitions.partition_start(timestamp)
+            if start + self.partitions.interval > open_after:
+                continue
+            keys = late.setdefault(self.partitions.partition_name(start), set())
+            if row.get('ip_address'):
+                keys.add(self.ip_key(row['ip_address']))
+            for user in extract_usernames(row.get('message')):
+                keys.add(self.user_key(user))
+        for name, keys in late.items():
+            if keys:
+                self._extend(name, keys)
+
+    def _extend(self, name, keys):
+        with self.db.engine.begin() as connection:
+            self.table.create(connection, checkfirst=True)
+            # c.items is ColumnCollection.items(), hence the subscript
+            row = connection.execute(
+                select(self.table.c.num_hashes, self.table.c['items'], self.table.c.bits)
+                .where(self.table.c.partition == name)
+            ).first()
+            if row is None:
+                # Never built; the first lookup builds it from every row
+                self._filters.pop(name, None)
+                return
+            num_hashes, items, bits = row
+            bloom = BloomFilter(bits=bits, num_hashes=num_hashes)
+            for key in keys:
+                bloom.add(key)
+            connection.execute(self.table.update().where(self.table.c.partition == name).values(
+                items=items + len(keys), bits=bytes(bloom.bits)
+            ))
+        self._filters[name] = bloom
+
+    def contains(self, name, key):
+        """Whether a partition may hold key"""
+        return self.normalize_key(key) in self.get(name)
+
+    def discard(self, name):
+        self._filters.pop(name, None)
+        self.table.create(self.db.session.connection(), checkfirst=True)
+        self.db.session.execute(self.table.delete().where(self.table.c.partition == name))
+
+    def get(self, name):
+        """Load a partition's filter, building it if it has never been built"""
+        bloom = self._filters.get(name)
+        if bloom is None:
+            self.table.create(self.db.session.connection(), checkfirst=True)
+            row = self.db.session.execute(
+                select(self.table.c.num_hashes, self.table.c.bits).where(self.table.c.partition == name)
+            ).first()
+            if row is not None:
+                bloom = BloomFilter(bits=row.bits, num_hashes=row.num_hashes)
+                self._filters[name] = bloom
+            else:
+                bloom = self.build(name, self.partitions.table(name))
+        return bloom
+
+    def candidate_tables(self, keys, since=None, until=None):
+        """Open partitions plus every sealed partition in range whose filter may contain a key"""
+        keys = [self.normalize_key(key) for key in keys]
+        postgres = self.partitions.dialect == 'postgresql'
+        # On SQLite the head table holds everything not yet sealed; on PostgreSQL
+        # the parent spans every partition, so partitions are read individually
+        tables = [] if postgres else [self.partitions.base_table]
+        open_after = datetime.now() - self.partitions.seal_grace
+        scanned = 0
+        for start, name in self.partitions.list_partitions():
+            end = start + self.partitions.interval
+            if (since is not None and end <= since) or (until is not None and start >= until):
+                continue
+            if end > open_after:
+                # Still receiving rows, so a filter would go stale
+                tables.append(self.partitions.table(name))
+                scanned += 1
+                continue
+            self.checked.inc()
+            bloom = self.get(name)
+            if any(key in bloom for key in keys):
+                tables.append(self.partitions.table(name))
+                scanned += 1
+            else:
+                self.skipped.inc()
+        return tables, scanned
+
+    def lookup(self, ip=None, user=None, days=30, limit=1000):
+        """Find log lines for an IP and/or user over the last N days"""
+        until = datetime.now()
+        since = until - timedelta(days=days)
+        keys = []
+        if ip:
+            keys.append(self.ip_key(ip))
+        if user:
+            keys.append(self.user_key(user))
+
+        tables, scanned = self.candidate_tables(keys, since, until)
+        results = []
+        for table in tables:
+            criteria = []
+            if ip:
+                criteria.append(table.c.ip_address == ip)
+            if user:
+                criteria.append(table.c.message.contains(user))
+            rows = self.db.session.execute(
+                select(table).where(table.c.timestamp >= since, or_(*criteria))
+            ).all()
+            for row in rows:
+                # Substring matches on the username are confirmed against the extractor
+                if ip and row.ip_address == ip or \
+                        user and user.lower() in {name.lower() for name in extract_usernames(row.message)}:
+                    results.append(row)
+
+        results.sort(key=lambda row: row.timestamp, reverse=True)
+        return results[:limit], {'partitions_scanned': scanned, 'tables_read': len(tables)}
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Chunked Uploads
+Resumable upload sessions for log files too large for one request: the client
+creates a session, PUTs fixed-size chunks in any order (in parallel, retrying
+whatever was lost), then finalizes. Chunks are written in place into a
+preallocated file and parsing follows the contiguous prefix as it arrives, so
+the start of a multi-GB file is searchable long before its last byte lands.
+The parse position is checkpointed in the same transaction as the rows each
+chunk produced, so a resumed session neither loses nor repeats rows, and the
+content hash is built up as the prefix is parsed instead of re-reading the file.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import BigInteger, Column, Integer, MetaData, String, Table, select
+
+import metrics
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 32 * 1024 * 1024
+
+
+class UploadError(ValueError):
+    pass
+
+
+class UploadSession:
+    def __init__(self, upload_id, filename, size, chunk_size, path, sha256=None,
+                 received=None, next_chunk=0, parsed_offset=0, lines_parsed=0, created_at=None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.path = path
+        self.sha256 = sha256
+        self.total_chunks = max(1, math.ceil(size / chunk_size))
+        self.received = set(received or [])
+        self.next_chunk = next_chunk
+        self.parsed_offset = parsed_offset
+        self.lines_parsed = lines_parsed
+        self.created_at = created_at or time.time()
+        self.updated_at = time.time()
+        self.carry = b''
+        self.digest = hashlib.sha256()
+        self.error = None
+        self.lock = threading.Lock()
+        self.parse_lock = threading.Lock()
+
+    @property
+    def meta_path(self):
+        return self.path + '.json'
+
+    def chunk_length(self, index):
+        if index == self.total_chunks - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+    @property
+    def content_hash(self):
+        """SHA-256 of the file once every chunk has been parsed"""
+        if self.next_chunk < self.total_chunks:
+            return None
+        return self.digest.hexdigest()
+
+    def missing(self):
+        with self.lock:
+            return [index for index in range(self.total_chunks) if index not in self.received]
+
+    def save(self):
+        data = {
+            'upload_id': self.upload_id, 'filename': self.filename, 'size': self.size,
+            'chunk_size': self.chunk_size, 'path': self.path, 'sha256': self.sha256,
+            'received': sorted(self.received), 'next_chunk': self.next_chunk,
+            'parsed_offset': self.parsed_offset, 'lines_parsed': self.lines_parsed,
+            'created_at': self.created_at,
+        }
+        temp_path = self.meta_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.meta_path)
+
+    def to_dict(self):
+        missing = self.missing()
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'total_chunks': self.total_chunks,
+            'received_chunks': self.total_chunks - len(missing),
+            'missing_chunks': missing,
+            'parsed_bytes': self.parsed_offset,
+            'lines_parsed': self.lines_parsed,
+            'error': self.error,
+        }
+
+
+class UploadCheckpoints:
+    """Last committed parse position per upload"""
+
+    def __init__(self, db):
+        self.db = db
+        self.table = Table(
+            'upload_checkpoints', MetaData(),
+            Column('upload_id', String(32), primary_key=True),
+            Column('chunk', Integer, nullable=False),
+            Column('parsed_offset', BigInteger, nullable=False),
+            Column('lines_parsed', BigInteger, nullable=False)
+        )
+
+    def ensure_table(self):
+        self.table.create(self.db.engine, checkfirst=True)
+
+    def write(self, connection, checkpoint):
+        """Record a checkpoint inside the caller's transaction"""
+        connection.execute(self.table.delete().where(self.table.c.upload_id == checkpoint['upload_id']))
+        connection.execute(self.table.insert().values(**checkpoint))
+
+    def load(self, upload_id):
+        with self.db.engine.connect() as connection:
+            row = connection.execute(select(self.table).where(self.table.c.upload_id == upload_id)).first()
+        return dict(row._mapping) if row is not None else None
+
+    def delete(self, upload_id):
+        with self.db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.upload_id == upload_id))
+
+
+class ChunkedUploadManager:
+    def __init__(self, directory, line_parser, sink, chunk_size=DEFAULT_CHUNK_SIZE, parse_workers=2,
+                 checkpoints=None):
+        """sink(rows, checkpoint) must return once the rows are durable
+
+        With checkpoints, sink must commit checkpoint (see UploadCheckpoints.write)
+        in the same transaction as the rows. Call load_sessions() to resume
+        sessions left by a previous process.
+        """
+        self.directory = directory
+        self.line_parser = line_parser
+        self.sink = sink
+        self.checkpoints = checkpoints
+        self.chunk_size = chunk_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix='upload-parse')
+        os.makedirs(directory, exist_ok=True)
+
+        self.chunks = metrics.REGISTRY.counter('upload_chunks_total', 'Upload chunks received')
+        self.chunk_bytes = metrics.REGISTRY.counter('upload_chunk_bytes_total', 'Bytes received in upload chunks')
+        self.active = metrics.REGISTRY.gauge('upload_sessions_active', 'Open chunked upload sessions')
+
+    def load_sessions(self):
+        """Pick up sessions left open by a previous process so clients can resume"""
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.part.json'):
+                continue
+            try:
+                with open(entry.path, 'r') as f:
+                    session = UploadSession(**json.load(f))
+            except (OSError, ValueError, TypeError) as e:
+                print(f"Skipping unreadable upload session {entry.name}: {e}")
+                continue
+            checkpoint = self.checkpoints.load(session.upload_id) if self.checkpoints else None
+            if checkpoint is not None and checkpoint['chunk'] >= session.next_chunk:
+                # Rows were committed but the process stopped before the session file was saved
+                session.next_chunk = checkpoint['chunk'] + 1
+                session.parsed_offset = checkpoint['parsed_offset']
+                session.lines_parsed = checkpoint['lines_parsed']
+            parsed_end = min(session.size, session.next_chunk * session.chunk_size)
+            with open(session.path, 'rb') as f:
+                # Hash state cannot be saved; rebuild it over the parsed prefix
+                for chunk in iter(lambda: f.read(min(session.chunk_size, parsed_end - f.tell())), b''):
+                    session.digest.update(chunk)
+                if session.parsed_offset:
+                    # Unparsed bytes after the last complete line become the carry again
+                    f.seek(session.parsed_offset)
+                    session.carry = f.read(parsed_end - session.parsed_offset)
+            self._sessions[session.upload_id] = session
+            if session.next_chunk in session.received:
+                self._executor.submit(self._advance, session)
+        self.active.set(len(self._sessions))
+
+    def create(self, filename, size, chunk_size=None, sha256=None):
+        chunk_size = chunk_size or self.chunk_size
+        if size <= 0:
+            raise UploadError("size must be positive")
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise UploadError(f"chunk_size must be between 1 and {MAX_CHUNK_SIZE} bytes")
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, f"{upload_id}.part")
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        session = UploadSession(upload_id, filename, size, chunk_size, path, sha256)
+        session.save()
+        with self._lock:
+            self._sessions[upload_id] = session
+            self.active.set(len(self._sessions))
+        return session
+
+    def get(self, upload_id):
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            raise KeyError(upload_id)
+        return session
+
+    def put_chunk(self, upload_id, index, data):
+        """Write one chunk in place; repeated PUTs of the same chunk are harmless"""
+        session = self.get(upload_id)
+        if not 0 <= index < session.total_chunks:
+            raise UploadError(f"Chunk index {index} out of range 0..{session.total_chunks - 1}")
+        expected = session.chunk_length(index)
+        if len(data) != expected:
+            raise UploadError(f"Chunk {index} must be {expected} bytes, got {len(data)}")
+
+        fd = os.open(session.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, data, index * session.chunk_size)
+        finally:
+            os.close(fd)
+        with session.lock:
+            session.received.add(index)
+            session.updated_at = time.time()
+            ready = index == session.next_chunk
+        self.chunks.inc()
+        self.chunk_bytes.inc(len(data))
+        if ready:
+            self._executor.submit(self._advance, session)
+        return session
+
+    def _advance(self, session):
+        """Parse the contiguous prefix; whoever holds parse_lock does the work"""
+        while True:
+            if not session.parse_lock.acquire(blocking=False):
+                return
+            try:
+                self._parse_ready(session)
+            except Exception as e:
+                # Reported by the status and chunk responses; finalize retries
+                session.error = str(e)
+                print(f"Upload parse error ({session.filename}): {e}")
+                return
+            finally:
+                session.parse_lock.release()
+            with session.lock:
+                # A chunk may have completed the prefix while the lock was held
+                if session.next_chunk not in session.received:
+                    return
+
+    def _parse_ready(self, session):
+        # Unbuffered: chunks land through other file descriptors while this one
+        # is open, and a read-ahead buffer would still hold the zeros
+        with open(session.path, 'rb', buffering=0) as f:
+            while True:
+                with session.lock:
+                    index = session.next_chunk
+                    if index not in session.received:
+                        return
+                f.seek(index * session.chunk_size)
+                chunk = f.read(session.chunk_length(index))
+                data = session.carry + chunk
+                last_chunk = index == session.total_chunks - 1
+                cut = len(data) if last_chunk else data.rfind(b'\n') + 1
+                lines = data[:cut].decode('utf-8', errors='replace').splitlines()
+                with metrics.stage_timer('parse', len(lines)):
+                    rows = self.line_parser.parse_lines(lines)
+                carry = data[cut:]
+                parsed_offset = (index + 1) * session.chunk_size - len(carry) if not last_chunk else session.size
+                if rows:
+                    self.sink(rows, {
+                        'upload_id': session.upload_id, 'chunk': index,
+                        'parsed_offset': parsed_offset, 'lines_parsed': session.lines_parsed + len(rows)
+                    })
+                session.digest.update(chunk)
+                session.carry = carry
+                session.parsed_offset = parsed_offset
+                session.lines_parsed += len(rows)
+                session.error = None
+                with session.lock:
+                    session.next_chunk = index + 1
+                    session.save()
+
+    def finalize(self, upload_id):
+        """Finish parsing once every chunk is in"""
+        session = self.get(upload_id)
+        missing = session.missing()
+        if missing:
+            raise UploadError(f"{len(missing)} chunks still missing, first: {missing[0]}")
+        with session.parse_lock:
+            try:
+                self._parse_ready(session)
+            except Exception as e:
+                session.error = str(e)
+                raise UploadError(f"Parsing stopped at chunk {session.next_chunk}: {e}")
+        return session
+
+    def remove(self, upload_id):
+        """Forget a session and delete its files"""
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+            self.active.set(len(self._sessions))
+        if session is None:
+            raise KeyError(upload_id)
+        with session.parse_lock:
+            for path in (session.path, session.meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            if self.checkpoints is not None:
+                self.checkpoints.delete(upload_id)
+
+    def expire(self, max_idle_seconds):
+        """Drop sessions with no chunk activity for max_idle_seconds"""
+        cutoff = time.time() - max_idle_seconds
+        with self._lock:
+            stale = [upload_id for upload_id, session in self._sessions.items() if session.updated_at < cutoff]
+        for upload_id in stale:
+            self.remove(upload_id)
+        return len(stale)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Event Correlation Engine
+Evaluates declarative sequence rules across sources as rows are ingested, for
+example a burst of failed logins followed by a privilege escalation attempt
+from the same IP within five minutes. Partial matches live in bounded keyed
+state with TTL eviction, so memory stays capped however many distinct IPs or
+users an attacker sprays.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import metrics
+from bloom_index import extract_usernames
+
+# Sequences built from the pattern_matcher rule ids
+DEFAULT_CORRELATION_RULES = [
+    {
+        'id': 'failed_auth_then_escalation_ip',
+        'key': 'ip',
+        'within': 300,
+        'severity': 'CRITICAL',
+        'steps': [{'rule': 'failed_authentication', 'count': 3}, {'rule': 'privilege_escalation'}],
+    },
+    {
+        'id': 'failed_auth_then_escalation_user',
+        'key': 'user',
+        'within': 300,
+        'severity': 'CRITICAL',
+        'steps': [{'rule': 'failed_authentication', 'count': 3}, {'rule': 'privilege_escalation'}],
+    },
+    {
+        'id': 'unauthorized_access_then_exfiltration',
+        'key': 'ip',
+        'within': 600,
+        'severity': 'CRITICAL',
+        'steps': [{'rule': 'unauthorized_access'}, {'rule': 'data_exfiltration'}],
+    },
+]
+
+
+class Step:
+    def __init__(self, rule=None, source=None, level=None, count=1):
+        if rule is None and source is None and level is None:
+            raise ValueError("A correlation step needs a rule, source or level")
+        self.rule = rule
+        self.source = source
+        self.level = level
+        self.count = count
+
+    def matches(self, row, matched_rules):
+        if self.rule is not None and self.rule not in matched_rules:
+            return False
+        if self.source is not None and row.get('source') != self.source:
+            return False
+        if self.level is not None and row.get('level') != self.level:
+            return False
+        return True
+
+
+class CorrelationRule:
+    def __init__(self, id, steps, key='ip', within=300, severity='HIGH'):
+        if key not in ('ip', 'user', 'source'):
+            raise ValueError(f"Unknown correlation key: {key}")
+        if not steps:
+            raise ValueError(f"Correlation rule {id} has no steps")
+        self.id = id
+        self.steps = [step if isinstance(step, Step) else Step(**step) for step in steps]
+        self.key = key
+        self.within = timedelta(seconds=within)
+        self.severity = severity
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def keys(self, row):
+        """Correlation keys an event belongs to"""
+        if self.key == 'ip':
+            return [row['ip_address']] if row.get('ip_address') else []
+        if self.key == 'user':
+            return sorted(extract_usernames(row.get('message')))
+        return [row['source']] if row.get('source') else []
+
+
+class KeyedState:
+    """Partial matches per key, oldest first, bounded by count and age
+
+    A match's window ('started' to 'expires') is in event time; memory is
+    reclaimed on the monotonic clock ('evict_at'), so a single far-future or
+    far-past timestamp cannot flush or pin the whole state.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.entries = OrderedDict()
+
+    def expire(self, clock=None):
+        """Drop partial matches held longer than their window; returns how many"""
+        clock = time.monotonic() if clock is None else clock
+        expired = 0
+        while self.entries:
+            key, state = next(iter(self.entries.items()))
+            if state['evict_at'] > clock:
+                break
+            del self.entries[key]
+            expired += 1
+        return expired
+
+    def start(self, key, now, within):
+        evicted = 0
+        while len(self.entries) >= self.max_keys:
+            # The oldest partial match is the closest to expiring anyway
+            self.entries.popitem(last=False)
+            evicted += 1
+        self.entries[key] = {'step': 0, 'count': 0, 'started': now, 'expires': now + within,
+                             'evict_at': time.monotonic() + within.total_seconds()}
+        return self.entries[key], evicted
+
+
+class CorrelationEngine:
+    def __init__(self, rules=None, max_keys_per_rule=10000):
+        self.rules = []
+        self.max_keys_per_rule = max_keys_per_rule
+        self._states = {}
+        self._lock = threading.Lock()
+        for rule in DEFAULT_CORRELATION_RULES if rules is None else rules:
+            self.add_rule(rule if isinstance(rule, CorrelationRule) else CorrelationRule.from_dict(rule))
+
+        self.matches = metrics.REGISTRY.counter('correlation_matches_total', 'Correlation rule matches')
+        self.evictions = metrics.REGISTRY.counter('correlation_state_evictions_total',
+                                                  'Partial matches evicted to stay under the key cap')
+        self.expirations = metrics.REGISTRY.counter('correlation_state_expirations_total',
+                                                    'Partial matches whose window closed')
+        self.keys_gauge = metrics.REGISTRY.gauge('correlation_state_keys', 'Partial matches held in memory')
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path, 'r') as f:
+            return cls(json.load(f), **kwargs)
+
+    def add_rule(self, rule):
+        if any(existing.id == rule.id for existing in self.rules):
+            raise ValueError(f"Duplicate correlation rule id: {rule.id}")
+        self.rules.append(rule)
+        self._states[rule.id] = KeyedState(self.max_keys_per_rule)
+
+    def observe(self, row, matched_rules):
+        """Advance every rule with one event; returns (Alert row, key) for completed sequences"""
+        now = row.get('timestamp') or datetime.now()
+        alerts = []
+        with self._lock:
+            clock = time.monotonic()
+            for rule in self.rules:
+                state = self._states[rule.id]
+                self.expirations.inc(state.expire(clock))
+                for key in rule.keys(row):
+                    alert = self._advance(rule, state, key, row, matched_rules, now)
+                    if alert is not None:
+                        alerts.append(alert)
+            self.keys_gauge.set(sum(len(state.entries) for state in self._states.values()))
+        return alerts
+
+    def _advance(self, rule, state, key, row, matched_rules, now):
+        progress = state.entries.get(key)
+        if progress is not None and not progress['started'] <= now <= progress['expires']:
+            # Outside the window of the sequence in progress: start over
+            del state.entries[key]
+            self.expirations.inc()
+            progress = None
+        if progress is None:
+            if not rule.steps[0].matches(row, matched_rules):
+                return None
+            progress, evicted = state.start(key, now, rule.within)
+            self.evictions.inc(evicted)
+
+        step = rule.steps[progress['step']]
+        if not step.matches(row, matched_rules):
+            return None
+        progress['count'] += 1
+        if progress['count'] < step.count:
+            return None
+        progress['step'] += 1
+        progress['count'] = 0
+        if progress['step'] < len(rule.steps):
+            return None
+
+        del state.entries[key]
+        self.matches.inc()
+        elapsed = int((now - progress['started']).total_seconds())
+        alert = {
+            'type': rule.id,
+            'severity': rule.severity,
+            'message': f"Correlated sequence {rule.id} for {rule.key} {key} over {elapsed}s: "
+                       f"[{row.get('source')}] {row.get('message')}",
+            'created_at': datetime.now(),
+            'resolved': False
+        }
+        return alert, f"{rule.key}:{key}"
+
+    def state_size(self):
+        with self._lock:
+            return {rule_id: len(state.entries) for rule_id, state in self._states.items()}
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Directory Ingestion
+Ingests the files in a directory concurrently and deduplicates them by content:
+whole files by a streaming SHA-256, and grown copies of a file already seen by
+matching its first block and the block where the earlier copy ended, so only
+the new tail is processed. Given a line parser and a sink, files are parsed
+here and handed to the sink in batches, so rows take the same path (and reach
+the same flush listeners) as every other ingest.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from sqlalchemy import BigInteger, Column, DateTime, MetaData, String, Table, or_, select
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+
+BLOCK_SIZE = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Lines parsed and handed to the sink per batch
+PARSE_BATCH_LINES = 5000
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE, size=None):
+    """Streaming SHA-256 of a whole file, or of its first size bytes"""
+    digest = hashlib.sha256()
+    remaining = size
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def hash_block(f, offset, size=BLOCK_SIZE):
+    """SHA-256 of the block that ends at offset (or starts at 0 for the head)"""
+    start = max(0, offset - size)
+    f.seek(start)
+    return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+
+class DirectoryIngestor:
+    def __init__(self, app, db, processor, max_workers=4, allowed_extensions=('log', 'txt', 'json'),
+                 line_parser=None, sink=None, batch_lines=PARSE_BATCH_LINES):
+        """sink(rows) must return once the rows are durable; without one, files go to processor.process_file"""
+        self.app = app
+        self.db = db
+        self.processor = processor
+        self.line_parser = line_parser
+        self.sink = sink
+        self.batch_lines = batch_lines
+        self.max_workers = max_workers
+        self.allowed_extensions = allowed_extensions
+        self._seen = {}
+        self._seen_lock = threading.Lock()
+        self.table = Table(
+            'ingested_files', MetaData(),
+            Column('content_hash', String(64), primary_key=True),
+            Column('head_hash', String(64), index=True, nullable=False),
+            Column('tail_hash', String(64), nullable=False),
+            Column('size', BigInteger, nullable=False),
+            Column('filename', String(255)),
+            Column('ingested_at', DateTime, nullable=False)
+        )
+
+        self.ingested = metrics.REGISTRY.counter('ingest_files_total', 'Files ingested', labels={'result': 'new'})
+        self.appended = metrics.REGISTRY.counter('ingest_files_total', 'Files ingested',
+                                                 labels={'result': 'appended'})
+        self.duplicates = metrics.REGISTRY.counter('ingest_files_total', 'Files ingested',
+                                                   labels={'result': 'duplicate'})
+        self.bytes_hashed = metrics.REGISTRY.counter('ingest_bytes_hashed_total', 'Bytes read for content hashing')
+
+    def ensure_table(self):
+        self.table.create(self.db.engine, checkfirst=True)
+
+    def _candidate_files(self, directory):
+        """Files not already handled at their current size and mtime"""
+        candidates = []
+        for entry in os.scandir(directory):
+            if not entry.is_file() or entry.name.rsplit('.', 1)[-1].lower() not in self.allowed_extensions:
+                continue
+            stat = entry.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+            with self._seen_lock:
+                if self._seen.get(entry.path) == signature:
+                    continue
+            candidates.append((entry.path, signature))
+        return candidates
+
+    def process_directory(self, directory):
+        """Ingest every new or grown file in directory, up to max_workers at a time"""
+        candidates = self._candidate_files(directory)
+        metrics.queue_depth('directory_ingest').set(len(candidates))
+        results = []
+        if not candidates:
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._ingest_in_context, path): path for path, _ in candidates}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    print(f"Error ingesting {path}: {e}")
+                    results.append({'file': path, 'status': 'error', 'error': str(e)})
+        metrics.queue_depth('directory_ingest').set(0)
+        return results
+
+    def _ingest_in_context(self, path):
+        with self.app.app_context():
+            return self.ingest_file(path)
+
+    def ingest_file(self, path):
+        """Ingest one file unless its content (or its prefix) was ingested before"""
+        stat = os.stat(path)
+        size = stat.st_size
+        with open(path, 'rb') as f:
+            head = f.read(BLOCK_SIZE)
+            head_hash = hashlib.sha256(head).hexdigest()
+            tail_hash = hash_block(f, size)
+            # Copies shorter than one block were keyed by a shorter head, so
+            # they are matched against the same number of leading bytes instead
+            candidates = self.db.session.execute(
+                select(self.table).where(
+                    or_(self.table.c.head_hash == head_hash,
+                        (self.table.c.size > 0) & (self.table.c.size < len(head))))
+            ).all()
+            short_heads = {}
+            previous = None
+            for candidate in candidates:
+                if candidate.size >= size or (previous is not None and candidate.size <= previous.size):
+                    continue
+                if candidate.size < BLOCK_SIZE:
+                    if candidate.size not in short_heads:
+                        short_heads[candidate.size] = hashlib.sha256(head[:candidate.size]).hexdigest()
+                    matched = short_heads[candidate.size] == candidate.tail_hash
+                else:
+                    matched = hash_block(f, candidate.size) == candidate.tail_hash
+                if matched:
+                    # Same beginning and same bytes where the old copy ended: a grown file
+                    previous = candidate
+        self.bytes_hashed.inc(min(size, 2 * BLOCK_SIZE))
+
+        with metrics.stage_timer('read'):
+            content_hash = hash_file(path)
+        self.bytes_hashed.inc(size)
+
+        if not self._claim(content_hash, head_hash, tail_hash, size, path):
+            self.duplicates.inc()
+            self._mark_seen(path, stat)
+            return {'file': path, 'status': 'duplicate', 'content_hash': content_hash}
+
+        # Byte offset up to which rows have reached the sink
+        start = previous.size if previous is not None else 0
+        progress = {'offset': start}
+        try:
+            if previous is not None:
+                results = self._process_tail(path, previous.size, progress)
+                self.appended.inc()
+                status = 'appended'
+            elif self.sink is not None:
+                with open(path, 'rb') as f:
+                    results = self._parse_into_sink(f, progress)
+                self.ingested.inc()
+                status = 'ingested'
+            else:
+                with metrics.stage_timer('process'):
+                    results = self.processor.process_file(path)
+                self.ingested.inc()
+                status = 'ingested'
+        except Exception:
+            self._release(content_hash, path, progress['offset'] if progress['offset'] > start else None)
+            raise
+        self._mark_seen(path, stat)
+        return {'file': path, 'status': status, 'content_hash': content_hash, 'results': results}
+
+    def is_ingested(self, content_hash):
+        return self.db.session.execute(
+            select(self.table.c.content_hash).where(self.table.c.content_hash == content_hash)
+        ).first() is not None
+
+    def record_file(self, path, filename=None, content_hash=None):
+        """Add a file ingested by other means to the manifest; False if already there"""
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            head_hash = hash_block(f, min(size, BLOCK_SIZE))
+            tail_hash = hash_block(f, size)
+        self.bytes_hashed.inc(min(size, 2 * BLOCK_SIZE))
+        if content_hash is None:
+            content_hash = hash_file(path)
+            self.bytes_hashed.inc(size)
+        return self._claim(content_hash, head_hash, tail_hash, size, filename or path)
+
+    def _mark_seen(self, path, stat):
+        with self._seen_lock:
+            self._seen[path] = (stat.st_size, stat.st_mtime_ns)
+
+    def _claim(self, content_hash, head_hash, tail_hash, size, path):
+        """Record the file before processing; the primary key makes this race-free"""
+        try:
+            with self.db.engine.begin() as connection:
+                connection.execute(self.table.insert().values(
+                    content_hash=content_hash, head_hash=head_hash, tail_hash=tail_hash,
+                    size=size, filename=os.path.basename(path), ingested_at=datetime.now()
+                ))
+            return True
+        except IntegrityError:
+            return False
+
+    def _release(self, content_hash, path=None, committed=None):
+        """Drop a claim after a failure
+
+        When rows up to the committed byte offset already reached the sink,
+        the claim is replaced by one for that prefix, so a retry takes the
+        grown-file path and only ingests what is left.
+        """
+        prefix = None
+        if committed is not None:
+            with open(path, 'rb') as f:
+                head_hash = hash_block(f, min(committed, BLOCK_SIZE))
+                tail_hash = hash_block(f, committed)
+            prefix = {'content_hash': hash_file(path, size=committed), 'head_hash': head_hash,
+                      'tail_hash': tail_hash, 'size': committed, 'filename': os.path.basename(path),
+                      'ingested_at': datetime.now()}
+        with self.db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.content_hash == content_hash))
+            if prefix is not None and connection.execute(
+                    select(self.table.c.content_hash).where(self.table.c.content_hash == prefix['content_hash'])
+            ).first() is None:
+                connection.execute(self.table.insert().values(**prefix))
+
+    def _parse_into_sink(self, f, progress=None):
+        """Parse the rest of an open file in batches of lines and sink the rows
+
+        progress['offset'] is advanced past each batch once the sink returns.
+        """
+        lines = entries = 0
+        batch = []
+        batch_bytes = 0
+        for raw in f:
+            batch.append(raw.decode('utf-8', errors='replace'))
+            batch_bytes += len(raw)
+            if len(batch) >= self.batch_lines:
+                entries += self._sink_lines(batch)
+                lines += len(batch)
+                if progress is not None:
+                    progress['offset'] += batch_bytes
+                batch = []
+                batch_bytes = 0
+        if batch:
+            entries += self._sink_lines(batch)
+            lines += len(batch)
+            if progress is not None:
+                progress['offset'] += batch_bytes
+        return {'lines': lines, 'entries': entries}
+
+    def _sink_lines(self, lines):
+        with metrics.stage_timer('parse', len(lines)):
+            rows = self.line_parser.parse_lines(lines)
+        if rows:
+            self.sink(rows)
+        return len(rows)
+
+    @staticmethod
+    def _skip_line(f, chunk_size=BLOCK_SIZE):
+        """Advance past the next newline without reading a long line in one piece"""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            newline = chunk.find(b'\n')
+            if newline >= 0:
+                f.seek(newline + 1 - len(chunk), os.SEEK_CUR)
+                return
+
+    def _process_tail(self, path, offset, progress=None):
+        """Process only the bytes after offset, starting at a line boundary"""
+        if self.sink is not None:
+            with open(path, 'rb') as source:
+                source.seek(offset - 1)
+                if source.read(1) != b'\n':
+                    # The earlier copy ended mid-line and that partial line was already ingested
+                    self._skip_line(source)
+                    if progress is not None:
+                        progress['offset'] = source.tell()
+                return self._parse_into_sink(source, progress)
+        suffix = os.path.splitext(path)[1]
+        handle, tail_path = tempfile.mkstemp(prefix='tail-', suffix=suffix)
+        try:
+            with open(path, 'rb') as source, os.fdopen(handle, 'wb') as f:
+                source.seek(offset - 1)
+                if source.read(1) != b'\n':
+                    # The earlier copy ended mid-line and that partial line was already ingested
+                    self._skip_line(source)
+                shutil.copyfileobj(source, f, HASH_CHUNK_SIZE)
+            with metrics.stage_timer('process'):
+                return self.processor.process_file(tail_path)
+        finally:
+            os.remove(tail_path)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Columnar Hot Window
+In-process NumPy columns for the most recent window of log entries so that
+dashboard aggregations are vectorized array operations instead of SQL
+round trips. Anything older than the window falls back to the database.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import func, select
+
+import metrics
+
+# Timestamps are stored as naive seconds since this epoch, so hour buckets line
+# up with the naive local datetimes stored in the database
+EPOCH = datetime(1970, 1, 1)
+
+
+def _seconds(timestamp):
+    return (timestamp - EPOCH).total_seconds()
+
+
+def _host_column(table):
+    return table.c.host if 'host' in table.c else None
+
+
+class DictionaryEncoder:
+    """Maps string values to small integer codes and back"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class HotWindow:
+    def __init__(self, db, partition_manager, window_hours=24, max_rows=5000000, refresh_interval=1.0):
+        self.db = db
+        self.partitions = partition_manager
+        self.window = timedelta(hours=window_hours)
+        self.max_rows = max_rows
+        self.refresh_interval = refresh_interval
+
+        self.levels = DictionaryEncoder()
+        self.sources = DictionaryEncoder()
+        self.hosts = DictionaryEncoder()
+        self._capacity = 0
+        self._size = 0
+        self._timestamps = np.empty(0, dtype=np.float64)
+        self._level_codes = np.empty(0, dtype=np.int16)
+        self._source_codes = np.empty(0, dtype=np.int32)
+        self._host_codes = np.empty(0, dtype=np.int32)
+
+        self.covered_since = None
+        self._last_id = 0
+        self._seal_generation = None
+        self._last_refresh = 0.0
+        self._lock = threading.RLock()
+
+        self.rows_gauge = metrics.REGISTRY.gauge('hot_window_rows', 'Rows held in the columnar hot window')
+        self.bytes_gauge = metrics.REGISTRY.gauge('hot_window_bytes', 'Bytes held by hot window columns')
+        self.fallbacks = metrics.REGISTRY.counter('hot_window_fallbacks_total',
+                                                  'Queries that fell back to the database')
+
+    def _grow(self, needed):
+        capacity = max(1024, self._capacity)
+        while capacity < needed:
+            capacity *= 2
+        if capacity == self._capacity:
+            return
+        for name in ('_timestamps', '_level_codes', '_source_codes', '_host_codes'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+        self._capacity = capacity
+
+    def append(self, rows):
+        """Append (timestamp, level, source, host) tuples"""
+        if not rows:
+            return
+        with self._lock:
+            count = len(rows)
+            self._grow(self._size + count)
+            end = self._size + count
+            self._timestamps[self._size:end] = [_seconds(row[0]) for row in rows]
+            self._level_codes[self._size:end] = [self.levels.encode(row[1]) for row in rows]
+            self._source_codes[self._size:end] = [self.sources.encode(row[2]) for row in rows]
+            self._host_codes[self._size:end] = [self.hosts.encode(row[3] or '') for row in rows]
+            self._size = end
+            self._enforce_cap()
+            self._update_gauges()
+
+    def _enforce_cap(self):
+        overflow = self._size - self.max_rows
+        if overflow > 0:
+            # Drop the oldest rows and stop claiming coverage for their range
+            order = np.argsort(self._timestamps[:self._size], kind='stable')
+            dropped_until = self._timestamps[order[overflow - 1]]
+            self._keep(self._timestamps[:self._size] > dropped_until)
+            self.covered_since = max(self.covered_since or datetime.min,
+                                     EPOCH + timedelta(seconds=float(dropped_until)))
+
+    def _keep(self, mask):
+        kept = int(mask.sum())
+        for name in ('_timestamps', '_level_codes', '_source_codes', '_host_codes'):
+            column = getattr(self, name)
+            column[:kept] = column[:self._size][mask]
+        self._size = kept
+
+    def trim(self):
+        """Drop rows that have aged out of the window"""
+        cutoff = datetime.now() - self.window
+        with self._lock:
+            mask = self._timestamps[:self._size] >= _seconds(cutoff)
+            if not mask.all():
+                self._keep(mask)
+            if self.covered_since is None or self.covered_since < cutoff:
+                self.covered_since = cutoff
+            self._update_gauges()
+
+    def _update_gauges(self):
+        self.rows_gauge.set(self._size)
+        self.bytes_gauge.set(sum(getattr(self, name).nbytes for name in
+                                 ('_timestamps', '_level_codes', '_source_codes', '_host_codes')))
+
+    def warm(self):
+        """Load the whole window from the database"""
+        since = datetime.now() - self.window
+        logs = self.partitions.source(since)
+        host = _host_column(logs)
+        columns = [logs.c.timestamp, logs.c.level, logs.c.source] + ([host] if host is not None else [])
+        generation = self.partitions.seal_generation
+        rows = self.db.session.execute(select(*columns).where(logs.c.timestamp >= since)).all()
+        base = self.partitions.base_table
+        with self._lock:
+            self._size = 0
+            self.append([(row[0], row[1], row[2], row[3] if host is not None else None) for row in rows])
+            self._last_id = self.db.session.execute(select(func.max(base.c.id))).scalar() or 0
+            self.covered_since = since
+            self._seal_generation = generation
+            self._last_refresh = time.monotonic()
+
+    def refresh(self, force=False):
+        """Pull rows written since the last refresh
+
+        Usually only the head table is read; after a seal the new rows may
+        already have moved into partitions, so every partition in the window is
+        read by id instead.
+        """
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        with self._lock:
+            if self.covered_since is None:
+                self.warm()
+                return
+            base = self.partitions.base_table
+            max_id = self.db.session.execute(select(func.max(base.c.id))).scalar() or 0
+            if max_id < self._last_id:
+                # Ids were reused after the head table emptied; reload to stay exact
+                self.warm()
+                return
+            generation = self.partitions.seal_generation
+            if generation != self._seal_generation:
+                logs = self.partitions.source(self.covered_since)
+                criteria = [logs.c.id > self._last_id, logs.c.timestamp >= self.covered_since]
+            else:
+                logs = base
+                criteria = [logs.c.id > self._last_id]
+            host = _host_column(logs)
+            columns = [logs.c.id, logs.c.timestamp, logs.c.level, logs.c.source] + \
+                ([host] if host is not None else [])
+            rows = self.db.session.execute(select(*columns).where(*criteria).order_by(logs.c.id)).all()
+            if rows:
+                self.append([(row[1], row[2], row[3], row[4] if host is not None else None) for row in rows])
+                self._last_id = rows[-1][0]
+            self._seal_generation = generation
+            self.trim()
+            self._last_refresh = time.monotonic()
+
+    def covers(self, since):
+        return self.covered_since is not None and since >= self.covered_since
+
+    def _mask(self, since):
+        return self._timestamps[:self._size] >= _seconds(since)
+
+    def level_source_counts(self, since):
+        """Return [(level, source, count)] for rows at or after since"""
+        with self._lock:
+            mask = self._mask(since)
+            levels = self._level_codes[:self._size][mask].astype(np.int64)
+            sources = self._source_codes[:self._size][mask].astype(np.int64)
+            combined = np.bincount(levels * len(self.sources) + sources,
+                                   minlength=len(self.levels) * len(self.sources))
+            results = []
+            for code in np.flatnonzero(combined):
+                level_code, source_code = divmod(int(code), len(self.sources))
+                results.append((self.levels.values[level_code], self.sources.values[source_code],
+                                int(combined[code])))
+            return results
+
+    def source_counts(self, since):
+        """Return {source: count} for rows at or after since"""
+        with self._lock:
+            counts = np.bincount(self._source_codes[:self._size][self._mask(since)], minlength=len(self.sources))
+            return {self.sources.values[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+    def hourly_level_counts(self, since):
+        """Return [(hour, level, count)] bucketed on the hour"""
+        with self._lock:
+            mask = self._mask(since)
+            timestamps = self._timestamps[:self._size][mask]
+            levels = self._level_codes[:self._size][mask].astype(np.int64)
+            if not len(timestamps):
+                return []
+            hours = (timestamps // 3600).astype(np.int64)
+            first_hour = int(hours.min())
+            buckets = hours - first_hour
+            span = int(buckets.max()) + 1
+            counts = np.bincount(buckets * len(self.levels) + levels, minlength=span * len(self.levels))
+            results = []
+            for code in np.flatnonzero(counts):
+                bucket, level_code = divmod(int(code), len(self.levels))
+                hour = EPOCH + timedelta(hours=first_hour + bucket)
+                results.append((hour, self.levels.values[level_code], int(counts[code])))
+            return results
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+HTTP Access-Log Analytics
+Parses apache and nginx access lines into typed request rows and keeps
+per-minute counters by endpoint and status class, so traffic and error-rate
+views read a few pre-aggregated rows instead of scanning raw logs. Minute
+buckets older than minute_retention_hours are folded into hourly buckets;
+request rows and hour buckets are deleted after their own retention.
+"""
+
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import (BigInteger, Column, DateTime, Integer, MetaData, String, Table, Text, func,
+                        select)
+
+import metrics
+import rollups
+from line_parser import parse_access_fields
+
+ACCESS_SOURCES = {'apache', 'nginx'}
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+COUNTERS = ('requests', 'bytes')
+
+# Path segments that are identifiers rather than routes
+ID_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F]{8,}|[0-9a-fA-F-]{36})$')
+
+
+def normalize_endpoint(path):
+    """Route of a request path: no query string, id segments collapsed"""
+    path = path.split('?', 1)[0].split('#', 1)[0] or '/'
+    segments = [':id' if ID_SEGMENT.match(segment) else segment for segment in path.split('/')]
+    return '/'.join(segments)[:255]
+
+
+def status_class(status):
+    return f"{status // 100}xx"
+
+
+def _rollup_table(name, metadata):
+    return Table(
+        name, metadata,
+        Column('bucket', DateTime, primary_key=True),
+        Column('endpoint', String(255), primary_key=True),
+        Column('status_class', String(3), primary_key=True),
+        Column('requests', BigInteger, nullable=False),
+        Column('bytes', BigInteger, nullable=False)
+    )
+
+
+class HttpAnalytics:
+    def __init__(self, db, store_requests=True, minute_retention_hours=48, request_retention_days=30,
+                 hour_retention_days=90):
+        """A retention of 0 days keeps those rows forever"""
+        self.db = db
+        self.store_requests = store_requests
+        self.minute_retention = timedelta(hours=minute_retention_hours)
+        self.request_retention = timedelta(days=request_retention_days)
+        self.hour_retention = timedelta(days=hour_retention_days)
+        self._lock = threading.Lock()
+
+        metadata = MetaData()
+        self.requests = Table(
+            'http_requests', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('timestamp', DateTime, nullable=False, index=True),
+            Column('source', String(100)),
+            Column('ip_address', String(45)),
+            Column('method', String(16)),
+            Column('endpoint', String(255), index=True),
+            Column('path', Text),
+            Column('status', Integer, index=True),
+            Column('bytes', BigInteger),
+            Column('referer', Text),
+            Column('user_agent', Text)
+        )
+        self.minute = _rollup_table('http_rollup_minute', metadata)
+        self.hour = _rollup_table('http_rollup_hour', metadata)
+        self.metadata = metadata
+
+        self.parsed = metrics.REGISTRY.counter('http_requests_parsed_total', 'Access-log lines parsed into requests')
+
+    def ensure_tables(self):
+        self.metadata.create_all(self.db.engine, checkfirst=True)
+
+    def _request(self, row):
+        if row.get('source') not in ACCESS_SOURCES:
+            return None
+        fields = parse_access_fields(row['message'])
+        if fields is None:
+            return None
+        return {
+            'timestamp': row['timestamp'],
+            'source': row['source'],
+            'ip_address': fields['ip_address'],
+            'method': fields['method'][:16],
+            'endpoint': normalize_endpoint(fields['endpoint']),
+            'path': fields['endpoint'],
+            'status': fields['status'],
+            'bytes': fields['bytes'],
+            'referer': fields['referer'],
+            'user_agent': fields['user_agent']
+        }
+
+    def observe(self, rows):
+        """Flush listener: store typed requests and bump the minute counters"""
+        requests = [request for request in map(self._request, rows) if request is not None]
+        if not requests:
+            return 0
+        counts = rollups.aggregate(
+            [{'bucket': rollups.bucket_start(request['timestamp'], 60), 'endpoint': request['endpoint'],
+              'status_class': status_class(request['status']), 'requests': 1, 'bytes': request['bytes']}
+             for request in requests],
+            ('bucket', 'endpoint', 'status_class'), COUNTERS
+        )
+        with self._lock, self.db.engine.begin() as connection:
+            if self.store_requests:
+                connection.execute(self.requests.insert(), requests)
+            rollups.upsert_add(connection, self.minute, counts, COUNTERS)
+        self.parsed.inc(len(requests))
+        return len(requests)
+
+    def compact(self):
+        """Rollup compactor: fold aged minute buckets into hour buckets"""
+        cutoff = rollups.bucket_start(datetime.now() - self.minute_retention, 3600)
+        with self._lock, self.db.engine.begin() as connection:
+            return rollups.compact(connection, self.minute, self.hour, cutoff, 3600, COUNTERS)
+
+    def expire(self, now=None):
+        """Retention policy: delete request rows and hour buckets past their retention"""
+        now = now or datetime.now()
+        deleted = 0
+        with self._lock, self.db.engine.begin() as connection:
+            if self.request_retention:
+                deleted += connection.execute(
+                    self.requests.delete().where(self.requests.c.timestamp < now - self.request_retention)
+                ).rowcount
+            if self.hour_retention:
+                deleted += connection.execute(
+                    self.hour.delete().where(self.hour.c.bucket < now - self.hour_retention)
+                ).rowcount
+        return deleted
+
+    def _select(self, names, since, until, endpoint=None):
+        """Run the same aggregate over the minute and hour buckets inside [since, until)"""
+        results = []
+        for table in (self.minute, self.hour):
+            lower, upper = rollups.inner_buckets(since, until, 60 if table is self.minute else 3600)
+            criteria = [table.c.bucket >= lower]
+            if upper is not None:
+                criteria.append(table.c.bucket < upper)
+            if endpoint:
+                criteria.append(table.c.endpoint == endpoint)
+            group_by = [table.c[name] for name in names]
+            results.extend(self.db.session.execute(
+                select(*group_by, func.sum(table.c.requests), func.sum(table.c.bytes))
+                .where(*criteria).group_by(*group_by)
+            ).all())
+        return results
+
+    def route_stats(self, since, until=None, limit=50):
+        """Requests, bytes and error rates per endpoint, busiest first"""
+        routes = {}
+        rows = self._select(['endpoint', 'status_class'], since, until)
+        for endpoint, klass, requests, size in rows:
+            route = routes.setdefault(endpoint, {'endpoint': endpoint, 'requests': 0, 'bytes': 0,
+                                                 **{name: 0 for name in STATUS_CLASSES}})
+            route['requests'] += int(requests)
+            route['bytes'] += int(size)
+            route[klass] = route.get(klass, 0) + int(requests)
+        for route in routes.values():
+            route['client_error_rate'] = route['4xx'] / route['requests'] if route['requests'] else 0.0
+            route['server_error_rate'] = route['5xx'] / route['requests'] if route['requests'] else 0.0
+        return sorted(routes.values(), key=lambda route: route['requests'], reverse=True)[:limit]
+
+    def timeline(self, since, until=None, endpoint=None):
+        """Requests per bucket and status class, optionally for one endpoint"""
+        rows = self._select(['bucket', 'status_class'], since, until, endpoint)
+        buckets = {}
+        for bucket, klass, requests, _ in rows:
+            entry = buckets.setdefault(bucket, {'bucket': bucket.isoformat(), 'requests': 0,
+                                                **{name: 0 for name in STATUS_CLASSES}})
+            entry['requests'] += int(requests)
+            entry[klass] = entry.get(klass, 0) + int(requests)
+        for entry in buckets.values():
+            entry['error_rate'] = entry['5xx'] / entry['requests'] if entry['requests'] else 0.0
+        return [buckets[bucket] for bucket in sorted(buckets)]
+
+    def recent_requests(self, since, status=None, endpoint=None, limit=100):
+        """Typed request rows, newest first"""
+        table = self.requests
+        criteria = [table.c.timestamp >= since]
+        if status is not None:
+            criteria.append(table.c.status == status)
+        if endpoint:
+            criteria.append(table.c.endpoint == endpoint)
+        rows = self.db.session.execute(
+            select(table).where(*criteria).order_by(table.c.timestamp.desc()).limit(limit)
+        ).all()
+        return [{**row._mapping, 'timestamp': row.timestamp.isoformat()} for row in rows]
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Group-Commit Ingest Buffer
+Collects log rows from every producer and writes them in one transaction per
+flush, flushing on whichever comes first: max_rows rows or max_delay_ms
+"""
+
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+
+import metrics
+
+# Pragmas applied to every SQLite connection: WAL lets readers run alongside
+# the single writer, and synchronous=NORMAL only fsyncs at checkpoints
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,
+    'mmap_size': 268435456,
+    'busy_timeout': 5000,
+    'wal_autocheckpoint': 10000,
+}
+
+
+def enable_sqlite_wal(engine, pragmas=None):
+    """Apply WAL and write-tuned pragmas to every new SQLite connection"""
+    if engine.dialect.name != 'sqlite':
+        return False
+    settings = dict(SQLITE_PRAGMAS, **(pragmas or {}))
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        for name, value in settings.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    # Connections already pooled were opened without the pragmas
+    engine.dispose()
+    return True
+
+
+class FlushError(RuntimeError):
+    """Some of the rows behind a ticket could not be written"""
+
+
+class IngestBuffer:
+    def __init__(self, app, db, table, max_rows=1000, max_delay_ms=200, max_pending=100000,
+                 max_retries=3, retry_delay_ms=100):
+        self.app = app
+        self.db = db
+        self.table = table
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay_ms / 1000.0
+        self.flush_listeners = []
+
+        self._rows = []
+        self._writes = []
+        self._first_added = None
+        self._submitted = 0
+        # Rows written or given up on; _failed holds the (start, end, batch)
+        # of every batch given up on so wait() can tell the two apart
+        self._settled = 0
+        self._failed = deque(maxlen=1000)
+        # Number of the batch being collected, and of the last one settled,
+        # so a ticket carrying writes but no rows still waits for its flush
+        self._batch = 1
+        self._flushed = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        self.depth = metrics.queue_depth('ingest_buffer')
+        self.batches = metrics.batch_size('commit')
+        self.rows_written = metrics.REGISTRY.counter('ingest_buffer_rows_total', 'Rows written by the ingest buffer')
+        self.flush_errors = metrics.REGISTRY.counter('ingest_buffer_flush_errors_total',
+                                                     'Ingest buffer flushes that failed')
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='ingest-buffer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Flush everything still buffered and stop the writer thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join()
+
+    def add(self, row):
+        return self.add_many([row])
+
+    def add_many(self, rows, writes=None):
+        """Queue rows for the next flush; returns a ticket for wait()
+
+        writes are callables run with the connection in the same transaction
+        as the rows, for bookkeeping that must commit together with them.
+        """
+        with self._condition:
+            while len(self._rows) >= self.max_pending and self._running:
+                # Back-pressure producers instead of growing without bound
+                self._condition.wait()
+            start = self._submitted
+            if not rows and not writes:
+                # Nothing to flush; settled once the batch already taken is
+                return start, start, self._batch - 1
+            was_empty = not self._rows and not self._writes
+            if was_empty:
+                self._first_added = time.monotonic()
+            self._rows.extend(rows)
+            self._writes.extend(writes or ())
+            self._submitted += len(rows)
+            self.depth.set(len(self._rows))
+            if was_empty or len(self._rows) >= self.max_rows:
+                # Wake the writer to start the delay timer or flush a full batch
+                self._condition.notify_all()
+            return start, self._submitted, self._batch
+
+    def wait(self, ticket, timeout=None):
+        """Block until the rows behind ticket have been written
+
+        Returns False on timeout and raises FlushError when the rows could not
+        be written.
+        """
+        start, end, batch = ticket
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._settled < end or self._flushed < batch:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            lost = sum(min(end, high) - max(start, low)
+                       for low, high, _batch in self._failed if low < end and high > start)
+            writes_lost = start == end and any(failed == batch for _low, _high, failed in self._failed)
+        if lost:
+            raise FlushError(f"{lost} of {end - start} rows could not be written")
+        if writes_lost:
+            raise FlushError("Writes could not be committed")
+        return True
+
+    def _take_batch(self):
+        """Wait until a flush is due and return the rows to write"""
+        with self._condition:
+            while self._running:
+                if len(self._rows) >= self.max_rows:
+                    break
+                if self._rows or self._writes:
+                    remaining = self._first_added + self.max_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait()
+            batch, writes, number = self._rows, self._writes, self._batch
+            self._rows = []
+            self._writes = []
+            self._first_added = None
+            if batch or writes:
+                self._batch += 1
+            self.depth.set(0)
+            self._condition.notify_all()
+            return batch, writes, number
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch, writes, number = self._take_batch()
+                if batch or writes:
+                    self._write(batch, writes, number)
+                with self._condition:
+                    if not self._running and not self._rows and not self._writes:
+                        return
+
+    def _insert(self, batch, writes):
+        with self.db.engine.connect() as connection:
+            transaction = connection.begin()
+            with metrics.stage_timer('insert', len(batch)):
+                if batch:
+                    connection.execute(self.table.insert(), batch)
+                for write in writes:
+                    write(connection)
+            with metrics.stage_timer('commit'):
+                transaction.commit()
+
+    def _write(self, batch, writes, number):
+        written = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._insert(batch, writes)
+                written = True
+                break
+            except Exception as e:
+                self.flush_errors.inc()
+                if attempt == self.max_retries:
+                    print(f"Ingest buffer flush error ({len(batch)} rows dropped): {e}")
+                else:
+                    print(f"Ingest buffer flush error, retrying: {e}")
+                    # Locked or briefly unavailable databases usually recover
+                    time.sleep(self.retry_delay * 2 ** attempt)
+
+        with self._condition:
+            if written:
+                self.batches.observe(len(batch))
+                self.rows_written.inc(len(batch))
+            else:
+                self._failed.append((self._settled, self._settled + len(batch), number))
+            self._settled += len(batch)
+            self._flushed = number
+            self._condition.notify_all()
+
+        if written and batch:
+            for listener in self.flush_listeners:
+                try:
+                    listener(batch)
+                except Exception as e:
+                    print(f"Ingest flush listener error: {e}")
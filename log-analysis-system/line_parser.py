@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Log Line Parser
+Turns single lines in the formats log_generator.py emits (standard, json,
+syslog, apache, nginx) into log_entries rows, detecting the format per line so
+mixed and streamed input needs no header
+"""
+
+import json
+import re
+from datetime import datetime
+
+from timestamp_parser import TimestampParser
+
+STANDARD_PATTERN = re.compile(r'^\[([^\]]+)\] \[(\w+)\] \[([^\]]*)\] \[([^\]]*)\] \[([^\]]*)\] (.*)$')
+ACCESS_PATTERN = re.compile(
+    r'^(\S+) \S+ (\S+) \[([^\]]+)\] "(\S+) (\S+)(?: [^"]*)?" (\d{3}) (\d+|-)'
+    r'(?: "([^"]*)" "([^"]*)")?'
+)
+SYSLOG_PATTERN = re.compile(
+    r'^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}|[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}) (\S+) ([\w.-]+)(?:\[\d+\])?: (.*)$'
+)
+
+LEVELS = {'DEBUG', 'INFO', 'WARNING', 'WARN', 'ERROR', 'CRITICAL', 'FATAL'}
+
+
+def parse_access_fields(line):
+    """HTTP fields of an apache/nginx access line, or None for other lines"""
+    match = ACCESS_PATTERN.match(line)
+    if match is None:
+        return None
+    ip, user, timestamp, method, endpoint, status, size, referer, agent = match.groups()
+    return {
+        'ip_address': ip,
+        'user': None if user == '-' else user,
+        'timestamp': timestamp,
+        'method': method,
+        'endpoint': endpoint,
+        'status': int(status),
+        'bytes': 0 if size == '-' else int(size),
+        'referer': None if referer in (None, '-') else referer,
+        'user_agent': agent
+    }
+
+
+def status_level(status):
+    """Log level for an HTTP status code"""
+    if status >= 500:
+        return 'ERROR'
+    if status >= 400:
+        return 'WARNING'
+    return 'INFO'
+
+
+class LineParser:
+    def __init__(self, timestamp_parser=None):
+        self.timestamps = timestamp_parser or TimestampParser()
+
+    def _timestamp(self, text):
+        try:
+            return self.timestamps.parse_any(text)
+        except ValueError:
+            return datetime.now()
+
+    def parse(self, line):
+        """Return a row dict for one line, or None for blank and comment lines"""
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.startswith('#'):
+            return None
+        if line.startswith('{'):
+            row = self._parse_json(line)
+            if row is not None:
+                return row
+        if line.startswith('['):
+            match = STANDARD_PATTERN.match(line)
+            if match:
+                timestamp, level, source, _host, _category, message = match.groups()
+                return self._row(timestamp, level, source, message)
+        match = ACCESS_PATTERN.match(line)
+        if match:
+            return self._parse_access(match, line)
+        match = SYSLOG_PATTERN.match(line)
+        if match:
+            timestamp, _host, service, message = match.groups()
+            return self._row(timestamp, self._guess_level(message), service, message)
+        return {
+            'timestamp': datetime.now(),
+            'level': self._guess_level(line),
+            'source': 'unknown',
+            'message': line,
+            'ip_address': None,
+            'user_agent': None
+        }
+
+    def parse_lines(self, lines):
+        """Parse an iterable of lines, skipping the ones that carry no entry"""
+        rows = []
+        for line in lines:
+            row = self.parse(line)
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    def _row(self, timestamp, level, source, message, ip_address=None, user_agent=None):
+        level = level.upper()
+        return {
+            'timestamp': self._timestamp(timestamp),
+            'level': 'WARNING' if level == 'WARN' else level,
+            'source': source or 'unknown',
+            'message': message,
+            'ip_address': ip_address,
+            'user_agent': user_agent
+        }
+
+    def _parse_json(self, line):
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or 'message' not in data:
+            return None
+        metadata = data.get('metadata') if isinstance(data.get('metadata'), dict) else {}
+        return self._row(
+            str(data.get('timestamp', '')), str(data.get('level', 'INFO')), data.get('source'),
+            str(data['message']), data.get('ip_address') or data.get('ip'),
+            data.get('user_agent') or metadata.get('user_agent')
+        )
+
+    def _parse_access(self, match, line):
+        ip, _user, timestamp, _method, _endpoint, status, _size, _referer, agent = match.groups()
+        source = 'nginx' if agent is not None else 'apache'
+        return self._row(timestamp, status_level(int(status)), source, line, ip, agent)
+
+    @staticmethod
+    def _guess_level(message):
+        head = message.split(' ', 1)[0].strip('[]:').upper()
+        if head in LEVELS:
+            return head
+        lowered = message.lower()
+        if 'error' in lowered or 'fail' in lowered:
+            return 'ERROR'
+        if 'warn' in lowered:
+            return 'WARNING'
+        return 'INFO'
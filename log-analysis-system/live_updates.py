@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Live Dashboard Updates
+Accumulates what each ingest flush adds (counts per hour and level, counts per
+source, sources seen for the first time, newly persisted alerts) and pushes
+it to connected dashboards as one delta frame at most max_fps times a second
+(max_fps 0 sends a frame as soon as anything is pending).
+Each frame is serialized once and shared by every subscriber, so server cost
+follows ingest rate rather than viewers x poll frequency.
+
+Frames are JSON objects with a 'type':
+  hello  - sent on connect; the client loads /api/stats and the charts once
+  delta  - seq, timeline [[hour, level, count]], sources {source: count},
+           new_sources [source], alerts [alert], total, levels {level: count}
+  resync - the client fell behind and dropped frames; reload from the API
+  ping   - keep-alive while nothing is being ingested
+"""
+
+import json
+import queue
+import threading
+import time
+
+import metrics
+import rollups
+
+
+class LiveSubscriber:
+    def __init__(self, max_frames):
+        self.frames = queue.Queue(maxsize=max_frames)
+        self.lagging = False
+
+    def offer(self, frame):
+        """Queue a frame; a full queue means the client is too slow to keep up"""
+        if self.lagging:
+            return False
+        try:
+            self.frames.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.lagging = True
+            return False
+
+    def next(self, timeout=None):
+        """Next frame to send, or None when nothing arrived within timeout"""
+        if self.lagging:
+            # Drop the backlog and tell the client to reload instead
+            while True:
+                try:
+                    self.frames.get_nowait()
+                except queue.Empty:
+                    break
+            self.lagging = False
+            return json.dumps({'type': 'resync'})
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LiveHub:
+    def __init__(self, max_fps=2, max_frames=32, max_known_sources=10000):
+        if max_fps < 0:
+            raise ValueError("max_fps must be 0 (unthrottled) or positive")
+        self.max_fps = max_fps
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.max_frames = max_frames
+        self.max_known_sources = max_known_sources
+        self._subscribers = set()
+        self._known_sources = set()
+        self._reset()
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pending = threading.Event()
+        self._thread = None
+
+        self.subscriber_gauge = metrics.REGISTRY.gauge('live_subscribers', 'Connected live dashboard clients')
+        self.frames_sent = metrics.REGISTRY.counter('live_frames_total', 'Delta frames broadcast to dashboards')
+        self.lagged = metrics.REGISTRY.counter('live_subscriber_resyncs_total',
+                                               'Dashboard clients told to resync after falling behind')
+
+    def _reset(self):
+        self._timeline = {}
+        self._sources = {}
+        self._levels = {}
+        self._new_sources = []
+        self._alerts = []
+        self._total = 0
+
+    def seed_sources(self, sources):
+        """Sources already stored, so they are not announced as new"""
+        with self._lock:
+            self._known_sources.update(sources)
+
+    def observe(self, rows):
+        """Flush listener: add the committed rows to the pending delta"""
+        with self._lock:
+            for row in rows:
+                hour = rollups.bucket_start(row['timestamp'], 3600)
+                level = row.get('level') or 'INFO'
+                source = row.get('source') or 'unknown'
+                self._timeline[(hour, level)] = self._timeline.get((hour, level), 0) + 1
+                self._sources[source] = self._sources.get(source, 0) + 1
+                self._levels[level] = self._levels.get(level, 0) + 1
+                if source not in self._known_sources:
+                    if len(self._known_sources) < self.max_known_sources:
+                        self._known_sources.add(source)
+                    self._new_sources.append(source)
+            self._total += len(rows)
+        self._pending.set()
+
+    def publish_alerts(self, alerts):
+        """Alert listener: queue newly persisted alerts for the next frame"""
+        with self._lock:
+            for alert in alerts:
+                created_at = alert.get('created_at')
+                self._alerts.append({
+                    'id': alert.get('id'),
+                    'type': alert.get('type'),
+                    'severity': alert.get('severity'),
+                    'message': alert.get('message'),
+                    'created_at': created_at.isoformat() if created_at is not None else None
+                })
+        self._pending.set()
+
+    def subscribe(self):
+        subscriber = LiveSubscriber(self.max_frames)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            self.subscriber_gauge.set(len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            self.subscriber_gauge.set(len(self._subscribers))
+
+    def hello(self):
+        with self._lock:
+            return json.dumps({'type': 'hello', 'seq': self._seq, 'max_fps': round(self.max_fps, 2)})
+
+    def _take_frame(self):
+        """Serialize and clear the pending delta, or None if nothing changed"""
+        with self._lock:
+            if not self._total and not self._alerts:
+                return None, []
+            self._seq += 1
+            frame = json.dumps({
+                'type': 'delta',
+                'seq': self._seq,
+                'timeline': [[hour.isoformat(), level, count]
+                             for (hour, level), count in sorted(self._timeline.items())],
+                'sources': self._sources,
+                'new_sources': list(dict.fromkeys(self._new_sources)),
+                'alerts': self._alerts,
+                'total': self._total,
+                'levels': self._levels
+            })
+            self._reset()
+            return frame, list(self._subscribers)
+
+    def broadcast(self):
+        frame, subscribers = self._take_frame()
+        if frame is None:
+            return 0
+        for subscriber in subscribers:
+            # Counted once when a client starts lagging, not per frame it misses
+            lagging = subscriber.lagging
+            if not subscriber.offer(frame) and not lagging:
+                self.lagged.inc()
+        self.frames_sent.inc()
+        return len(subscribers)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='live-hub', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._pending.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Idle until something is pending; with max_fps 0 that is the only wait
+            self._pending.wait()
+            self._pending.clear()
+            started = time.monotonic()
+            try:
+                self.broadcast()
+            except Exception as e:
+                print(f"Live broadcast error: {e}")
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
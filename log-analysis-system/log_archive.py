@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Tiered Log Retention
+Moves aged log rows out of the database in three tiers:
+  raw      - log_entries rows (and their partitions) for raw_days
+  archive  - gzip NDJSON segments on disk plus per-hour level x source counts,
+             until hour_days
+  rollup   - per-day level x source counts only, kept for day_days (0 = forever)
+Each archived interval is written to its segment file, counted into the hour
+rollup and deleted from the database in one transaction, so a crash never
+double-counts. Segments stay searchable by a slower scan that only opens the
+files whose time range overlaps the query.
+"""
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import (BigInteger, Column, DateTime, Integer, MetaData, String, Table, func, select)
+
+import log_export
+import metrics
+import rollups
+
+COUNTERS = ('count',)
+
+# Rows read per round trip while archiving an interval
+ARCHIVE_BATCH_SIZE = 5000
+
+
+def _rollup_table(name, metadata):
+    return Table(
+        name, metadata,
+        Column('bucket', DateTime, primary_key=True),
+        Column('level', String(20), primary_key=True),
+        Column('source', String(100), primary_key=True),
+        Column('count', BigInteger, nullable=False)
+    )
+
+
+class LogArchive:
+    def __init__(self, db, partition_manager, directory, raw_days=30, hour_days=90, day_days=0,
+                 interval_hours=24):
+        self.db = db
+        self.partitions = partition_manager
+        self.directory = directory
+        self.raw_days = raw_days
+        self.hour_days = hour_days
+        self.day_days = day_days
+        self.interval = timedelta(hours=interval_hours)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        metadata = MetaData()
+        self.segments = Table(
+            'archive_segments', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('path', String(255), nullable=False, unique=True),
+            Column('start', DateTime, nullable=False),
+            Column('end', DateTime, nullable=False),
+            Column('min_timestamp', DateTime, nullable=False, index=True),
+            Column('max_timestamp', DateTime, nullable=False, index=True),
+            Column('rows', Integer, nullable=False),
+            Column('bytes', BigInteger, nullable=False),
+            Column('archived_at', DateTime, nullable=False)
+        )
+        self.hour = _rollup_table('log_rollup_hour', metadata)
+        self.day = _rollup_table('log_rollup_day', metadata)
+        self.metadata = metadata
+
+        self.archived_rows = metrics.REGISTRY.counter('log_archived_rows_total',
+                                                      'Rows moved from the database into archive segments')
+        self.segment_count = metrics.REGISTRY.gauge('log_archive_segments', 'Archive segments on disk')
+        self.scanned = metrics.REGISTRY.counter('log_archive_segments_scanned_total',
+                                                'Archive segments opened by searches')
+
+    @property
+    def enabled(self):
+        return self.raw_days > 0
+
+    def ensure_tables(self):
+        self.metadata.create_all(self.db.engine, checkfirst=True)
+
+    def interval_start(self, timestamp):
+        return rollups.EPOCH + ((timestamp - rollups.EPOCH) // self.interval) * self.interval
+
+    def run(self, now=None):
+        """Apply every tier; returns rows archived from the database"""
+        if not self.enabled:
+            return 0
+        now = now or datetime.now()
+        with self._lock:
+            archived = self.archive_before(self.interval_start(now - timedelta(days=self.raw_days)))
+            self.downsample_before(rollups.bucket_start(now - timedelta(days=self.hour_days), 86400))
+            if self.day_days > 0:
+                cutoff = now - timedelta(days=self.day_days)
+                with self.db.engine.begin() as connection:
+                    connection.execute(self.day.delete().where(self.day.c.bucket < cutoff))
+            self.segment_count.set(self.db.session.execute(select(func.count()).select_from(self.segments)).scalar())
+        return archived
+
+    def archive_before(self, cutoff):
+        """Archive and delete every complete interval of raw rows before cutoff"""
+        oldest = [self.db.session.execute(select(func.min(table.c.timestamp))).scalar()
+                  for table in self.partitions.tables(end=cutoff)]
+        oldest = [timestamp for timestamp in oldest if timestamp is not None]
+        archived = 0
+        if oldest:
+            start = self.interval_start(min(oldest))
+            while start < cutoff:
+                end = start + self.interval
+                archived += self._archive_interval(start, end)
+                start = end
+        if self.partitions.enabled:
+            # Partitions emptied above can go; their bloom filters go with them
+            self.partitions.drop_before(cutoff)
+        self.archived_rows.inc(archived)
+        return archived
+
+    def _archive_interval(self, start, end):
+        tables = self.partitions.tables(start, end)
+        columns = log_export.EXPORT_COLUMNS
+        counts = {}
+        stats = {'rows': 0, 'min': None, 'max': None}
+        # Highest id archived per table; rows committed after the read stay for the next run
+        max_ids = {}
+
+        def tally(rows):
+            for row in rows:
+                timestamp, level, source = row[1], row[2], row[3]
+                key = (rollups.bucket_start(timestamp, 3600), (level or 'INFO')[:20], (source or 'unknown')[:100])
+                counts[key] = counts.get(key, 0) + 1
+                stats['rows'] += 1
+                stats['min'] = timestamp if stats['min'] is None else min(stats['min'], timestamp)
+                stats['max'] = timestamp if stats['max'] is None else max(stats['max'], timestamp)
+                yield row
+
+        def interval_rows():
+            for table in tables:
+                for row in self.db.session.execute(
+                    select(*[table.c[name] for name in columns])
+                    .where(table.c.timestamp >= start, table.c.timestamp < end)
+                    .execution_options(yield_per=ARCHIVE_BATCH_SIZE)
+                ):
+                    if row[0] > max_ids.get(table.name, 0):
+                        max_ids[table.name] = row[0]
+                    yield row
+
+        # A new file per run, so rows arriving late for an interval get their own segment
+        name = f"logs-{start.strftime('%Y%m%d%H')}-{datetime.now().strftime('%Y%m%d%H%M%S%f')}.ndjson.gz"
+        path = os.path.join(self.directory, name)
+        temp_path = path + '.tmp'
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            for chunk in log_export.ndjson_chunks(tally(interval_rows())):
+                f.write(chunk)
+        if not stats['rows']:
+            os.remove(temp_path)
+            return 0
+        os.replace(temp_path, path)
+
+        try:
+            connection = self.db.session.connection()
+            connection.execute(self.segments.insert().values(
+                path=name, start=start, end=end, min_timestamp=stats['min'], max_timestamp=stats['max'],
+                rows=stats['rows'], bytes=os.path.getsize(path), archived_at=datetime.now()
+            ))
+            rollups.upsert_add(connection, self.hour, [
+                {'bucket': bucket, 'level': level, 'source': source, 'count': count}
+                for (bucket, level, source), count in counts.items()
+            ], COUNTERS)
+            for table in tables:
+                if table.name in max_ids:
+                    connection.execute(table.delete().where(table.c.timestamp >= start, table.c.timestamp < end,
+                                                            table.c.id <= max_ids[table.name]))
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            os.remove(path)
+            raise
+        return stats['rows']
+
+    def downsample_before(self, cutoff):
+        """Fold hour rollups before cutoff into day rollups and drop their segments"""
+        with self.db.engine.begin() as connection:
+            folded = rollups.compact(connection, self.hour, self.day, cutoff, 86400, COUNTERS)
+            expired = connection.execute(
+                select(self.segments.c.id, self.segments.c.path).where(self.segments.c.end <= cutoff)
+            ).all()
+            if expired:
+                connection.execute(self.segments.delete().where(
+                    self.segments.c.id.in_([segment_id for segment_id, _ in expired])))
+        for _, name in expired:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+        return folded
+
+    def list_segments(self, since=None, until=None):
+        """Segments whose row time range overlaps [since, until), oldest first"""
+        table = self.segments
+        criteria = []
+        if since is not None:
+            criteria.append(table.c.max_timestamp >= since)
+        if until is not None:
+            criteria.append(table.c.min_timestamp < until)
+        rows = self.db.session.execute(select(table).where(*criteria).order_by(table.c.min_timestamp)).all()
+        return [dict(row._mapping) for row in rows]
+
+    def scan(self, since=None, until=None, level=None, source=None, contains=None, limit=100):
+        """Archived entries matching the filters, read from overlapping segments only"""
+        needle = contains.lower() if contains else None
+        since_text = since.isoformat() if since is not None else None
+        until_text = until.isoformat() if until is not None else None
+        results = []
+        for segment in self.list_segments(since, until):
+            self.scanned.inc()
+            try:
+                f = gzip.open(os.path.join(self.directory, segment['path']), 'rt', encoding='utf-8')
+            except FileNotFoundError:
+                # Expired by downsampling while this scan was running
+                continue
+            with f:
+                for line in f:
+                    record = json.loads(line)
+                    # ISO strings of naive timestamps sort like the timestamps
+                    if since_text is not None and record['timestamp'] < since_text:
+                        continue
+                    if until_text is not None and record['timestamp'] >= until_text:
+                        continue
+                    if level and record['level'] != level:
+                        continue
+                    if source and record['source'] != source:
+                        continue
+                    if needle and needle not in (record['message'] or '').lower():
+                        continue
+                    results.append(record)
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def counts(self, since, until=None, resolution='hour'):
+        """Level x source counts per bucket from the hour or day rollups"""
+        table = self.hour if resolution == 'hour' else self.day
+        criteria = [table.c.bucket >= since]
+        if until is not None:
+            criteria.append(table.c.bucket < until)
+        rows = self.db.session.execute(
+            select(table.c.bucket, table.c.level, table.c.source, table.c.count)
+            .where(*criteria).order_by(table.c.bucket)
+        ).all()
+        return [{'bucket': bucket.isoformat(), 'level': level, 'source': source, 'count': int(count)}
+                for bucket, level, source, count in rows]
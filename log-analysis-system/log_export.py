@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Log Export Streaming
+Generators that turn a streamed log query into NDJSON or CSV chunks,
+optionally gzip-compressed, without holding the result set in memory
+"""
+
+import csv
+import io
+import json
+import zlib
+
+EXPORT_COLUMNS = ['id', 'timestamp', 'level', 'source', 'message', 'ip_address', 'user_agent']
+
+# Flush output once this many bytes have been buffered
+CHUNK_SIZE = 64 * 1024
+
+
+def _serialize_row(row):
+    """Convert a result row into a plain dict of JSON-safe values"""
+    record = dict(zip(EXPORT_COLUMNS, row))
+    if record['timestamp'] is not None:
+        record['timestamp'] = record['timestamp'].isoformat()
+    return record
+
+
+def ndjson_chunks(rows, chunk_size=CHUNK_SIZE):
+    """Yield newline-delimited JSON in chunks of roughly chunk_size bytes"""
+    buffer = []
+    buffered = 0
+    for row in rows:
+        line = json.dumps(_serialize_row(row), separators=(',', ':')) + '\n'
+        buffer.append(line)
+        buffered += len(line)
+        if buffered >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_chunks(rows, chunk_size=CHUNK_SIZE):
+    """Yield CSV with a header row in chunks of roughly chunk_size bytes"""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        record = _serialize_row(row)
+        writer.writerow([record[column] for column in EXPORT_COLUMNS])
+        if output.tell() >= chunk_size:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+    if output.tell():
+        yield output.getvalue()
+
+
+def gzip_chunks(chunks, level=6):
+    """Gzip-compress a stream of text chunks"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    'ndjson': (ndjson_chunks, 'application/x-ndjson', 'ndjson'),
+    'csv': (csv_chunks, 'text/csv', 'csv'),
+}
+
+
+def export_stream(rows, fmt='ndjson', compress=False):
+    """Return (chunk generator, mimetype, file extension) for an export"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    encoder, mimetype, extension = FORMATS[fmt]
+    chunks = encoder(rows)
+    if compress:
+        return gzip_chunks(chunks), 'application/gzip', f"{extension}.gz"
+    return chunks, mimetype, extension
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Log Query Language
+Parses compact search queries such as
+
+    level:ERROR source:nginx host:web-0* "timeout" -ip:10.0.0.1 after:-2h
+
+and compiles them to one SQL statement over the partitions the time range
+touches. Equality and prefix terms become index-friendly comparisons, ip and
+user terms prune sealed partitions through the bloom index, and free text is
+matched against message. plan() reports how every term will be answered so
+queries that would scan the whole table can be rejected up front.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import inspect, select, union_all
+
+import metrics
+from timestamp_parser import TimestampParser
+
+# Query field -> log column
+FIELDS = {
+    'level': 'level',
+    'source': 'source',
+    'host': 'host',
+    'ip': 'ip_address',
+    'agent': 'user_agent',
+    'message': 'message',
+    'user': 'message',
+}
+
+TIME_FIELDS = {'after': 'since', 'since': 'since', 'before': 'until', 'until': 'until'}
+
+# Fields whose values are stored upper-case
+UPPERCASE_FIELDS = {'level'}
+
+RELATIVE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+TOKEN_PATTERN = re.compile(r'(-)?(?:([A-Za-z_]+):)?("(?:[^"\\]|\\.)*"|\S+)')
+RELATIVE_PATTERN = re.compile(r'^-?(\d+)([smhdw])$')
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Term:
+    """One predicate: field op value(s), optionally negated"""
+
+    def __init__(self, field, op, values, negate=False):
+        self.field = field
+        self.column = FIELDS[field]
+        self.op = op
+        self.values = values
+        self.negate = negate
+
+    def __repr__(self):
+        prefix = '-' if self.negate else ''
+        return f"{prefix}{self.field}:{self.op}:{','.join(self.values)}"
+
+
+class ParsedQuery:
+    def __init__(self):
+        self.terms = []
+        self.since = None
+        self.until = None
+        # Tables the query reads, filled in once by QueryCompiler
+        self.tables = None
+        # True when a time bound is relative to now (-2h, now), so results
+        # depend on when the query runs
+        self.relative = False
+
+    def keys(self):
+        """Bloom keys for the positive ip and user terms"""
+        from bloom_index import PartitionBloomIndex
+        keys = []
+        for term in self.terms:
+            if term.negate:
+                continue
+            if term.field == 'ip' and term.op == 'eq':
+                keys.extend(PartitionBloomIndex.ip_key(value) for value in term.values)
+            elif term.field == 'user':
+                keys.extend(PartitionBloomIndex.user_key(value) for value in term.values)
+        return keys
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1]), True
+    return value, False
+
+
+def is_relative_time(value):
+    return value == 'now' or RELATIVE_PATTERN.match(value) is not None
+
+
+def parse_time(value, now=None, parser=None):
+    """Parse a relative offset (-2h, 30m, now) or an absolute timestamp"""
+    now = now or datetime.now()
+    if value == 'now':
+        return now
+    relative = RELATIVE_PATTERN.match(value)
+    if relative:
+        amount, unit = relative.groups()
+        return now - timedelta(**{RELATIVE_UNITS[unit]: int(amount)})
+    try:
+        return (parser or TimestampParser()).parse_any(value)
+    except ValueError:
+        raise QueryError(f"Invalid time: {value!r}")
+
+
+def _value_term(field, value, quoted, negate):
+    values = [value] if quoted or field in ('message', 'user') else value.split(',')
+    if field in UPPERCASE_FIELDS:
+        values = [v.upper() for v in values]
+    if field in ('message', 'user'):
+        return Term(field, 'contains', values, negate)
+    if not quoted and len(values) == 1 and '*' in value:
+        if value.endswith('*') and '*' not in value[:-1]:
+            return Term(field, 'prefix', [value[:-1]], negate)
+        return Term(field, 'wildcard', values, negate)
+    return Term(field, 'eq' if len(values) == 1 else 'in', values, negate)
+
+
+def parse_query(query, filters=None, now=None, parser=None):
+    """Parse a query string (plus optional level/source/since/until filters)"""
+    parsed = ParsedQuery()
+    now = now or datetime.now()
+    for match in TOKEN_PATTERN.finditer(query or ''):
+        negate, field, raw = match.groups()
+        value, quoted = _unquote(raw)
+        if not value:
+            continue
+        if field and field.lower() not in FIELDS and field.lower() not in TIME_FIELDS:
+            # Not a field after all (http://host, "error: disk"): search for the text
+            value = f"{field}:{value}"
+            field = None
+        field = field.lower() if field else None
+        if field in TIME_FIELDS:
+            if negate:
+                raise QueryError(f"Time bounds cannot be negated: {match.group(0)}")
+            setattr(parsed, TIME_FIELDS[field], parse_time(value, now, parser))
+            parsed.relative = parsed.relative or is_relative_time(value)
+        elif field is None:
+            parsed.terms.append(Term('message', 'contains', [value], bool(negate)))
+        else:
+            parsed.terms.append(_value_term(field, value, quoted, bool(negate)))
+
+    for key, value in (filters or {}).items():
+        if not value:
+            continue
+        if key in TIME_FIELDS:
+            setattr(parsed, TIME_FIELDS[key], parse_time(value, now, parser))
+            parsed.relative = parsed.relative or is_relative_time(value)
+        elif key in FIELDS:
+            parsed.terms.append(_value_term(key, value, False, False))
+
+    if parsed.since and parsed.until and parsed.since >= parsed.until:
+        raise QueryError("after: must be earlier than before:")
+    return parsed
+
+
+def _prefix_upper(prefix):
+    """Smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class QueryCompiler:
+    def __init__(self, db, partition_manager, bloom_index=None):
+        self.db = db
+        self.partitions = partition_manager
+        self.bloom_index = bloom_index
+        self._indexed = None
+
+        self.full_scans = metrics.REGISTRY.counter('query_full_scans_total',
+                                                   'Queries planned without an index or time bound')
+        self.rejected = metrics.REGISTRY.counter('query_rejected_total', 'Queries rejected as full scans')
+
+    def indexed_columns(self):
+        """Columns that lead an index on the log table"""
+        if self._indexed is None:
+            base = self.partitions.base_table
+            inspector = inspect(self.db.engine)
+            if not inspector.has_table(base.name):
+                return set()
+            indexed = set(inspector.get_pk_constraint(base.name).get('constrained_columns', [])[:1])
+            for index in inspector.get_indexes(base.name):
+                if index['column_names'] and index['column_names'][0]:
+                    indexed.add(index['column_names'][0])
+            self._indexed = indexed
+        return self._indexed
+
+    def plan(self, parsed):
+        """Describe how each part of the query will be answered"""
+        indexed = self.indexed_columns()
+        columns = self.partitions.base_table.c
+        steps = []
+        warnings = []
+        driving = False
+
+        if parsed.since or parsed.until:
+            steps.append({
+                'term': 'time range',
+                'access': 'partition pruning' + (' + index on timestamp' if 'timestamp' in indexed else ''),
+            })
+            driving = True
+
+        for term in parsed.terms:
+            if term.column not in columns:
+                raise QueryError(f"Field {term.field} is not available on this log table")
+            if term.field == 'user' and not term.negate and self.bloom_index is not None:
+                access = 'bloom partition pruning + message scan'
+            elif term.negate or term.op in ('contains', 'wildcard'):
+                access = 'filter (scan of selected rows)'
+            elif term.column in indexed:
+                access = f"index on {term.column}" + (' (range)' if term.op == 'prefix' else '')
+                driving = True
+            else:
+                access = f"filter ({term.column} is not indexed)"
+            if term.field == 'ip' and term.op == 'eq' and not term.negate and self.bloom_index is not None:
+                access += ' + bloom partition pruning'
+            steps.append({'term': repr(term), 'access': access})
+            if term.op == 'wildcard':
+                warnings.append(f"{term.field}:{term.values[0]} has a leading or inner wildcard and cannot use an index")
+
+        full_scan = not driving
+        if full_scan:
+            warnings.append("No time bound or indexed term: every partition and row will be scanned; "
+                            "add after:/before: or an indexed field")
+
+        tables = [table.name for table in self._tables(parsed)]
+        return {
+            'steps': steps,
+            'tables': tables,
+            'indexed_columns': sorted(indexed),
+            'full_scan': full_scan,
+            'warnings': warnings,
+        }
+
+    def _tables(self, parsed):
+        """Tables to read, pruned by time and bloom filters once per parsed query"""
+        if parsed.tables is None:
+            keys = parsed.keys()
+            if keys and self.bloom_index is not None and self.partitions.enabled:
+                parsed.tables, _ = self.bloom_index.candidate_tables(keys, parsed.since, parsed.until)
+            else:
+                parsed.tables = self.partitions.tables(parsed.since, parsed.until)
+        return parsed.tables
+
+    def _source(self, parsed):
+        tables = self._tables(parsed)
+        if len(tables) == 1:
+            return tables[0]
+        return union_all(*[select(table) for table in tables]).subquery('log_window')
+
+    @staticmethod
+    def _criterion(term, column):
+        if term.op == 'eq':
+            clause = column == term.values[0]
+        elif term.op == 'in':
+            clause = column.in_(term.values)
+        elif term.op == 'prefix':
+            prefix = term.values[0]
+            clause = (column >= prefix) & (column < _prefix_upper(prefix)) if prefix else column.isnot(None)
+        elif term.op == 'wildcard':
+            escaped = term.values[0].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clause = column.like(escaped.replace('*', '%'), escape='\\')
+        else:
+            clause = column.contains(term.values[0], autoescape=True)
+        return ~clause if term.negate else clause
+
+    def compile(self, parsed, column_names, limit=100):
+        """Build the SELECT for a parsed query"""
+        logs = self._source(parsed)
+        criteria = []
+        if parsed.since:
+            criteria.append(logs.c.timestamp >= parsed.since)
+        if parsed.until:
+            criteria.append(logs.c.timestamp < parsed.until)
+        for term in parsed.terms:
+            criteria.append(self._criterion(term, logs.c[term.column]))
+        statement = select(*[logs.c[name] for name in column_names]).where(*criteria)
+        return statement.order_by(logs.c.timestamp.desc()).limit(limit)
+
+    def explain(self, statement):
+        """Ask the database for its plan of a compiled statement"""
+        engine = self.db.engine
+        compiled = statement.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True})
+        prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + str(compiled)).all()
+        return [' | '.join(str(value) for value in row) for row in rows]
+
+    def check(self, parsed, strict=False):
+        """Plan the query and refuse full scans when strict"""
+        plan = self.plan(parsed)
+        if plan['full_scan']:
+            self.full_scans.inc()
+            if strict:
+                self.rejected.inc()
+                raise QueryError(plan['warnings'][-1])
+        return plan
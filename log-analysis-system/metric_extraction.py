@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Metric Extraction
+Pulls numeric values out of log messages at ingest ("Slow database query:
+4200 ms", "Queue size growing: 812 items") and records them in per-minute
+log-scale histograms per metric and source. Percentiles are answered from the
+bucket counts, so latency and resource charts never rescan raw messages.
+Minute buckets are folded into hour buckets after minute_retention_hours and
+hour buckets are deleted after hour_retention_days.
+"""
+
+import json
+import math
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, MetaData, String, Table, func, select
+
+import metrics
+import rollups
+
+# Each bin spans 5% of its value, so percentiles are within ~2.5% of the truth
+GROWTH = 1.05
+LOG_GROWTH = math.log(GROWTH)
+MIN_VALUE = 0.001
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# Numeric fields in the message templates log_generator.py emits
+DEFAULT_METRIC_RULES = [
+    {'name': 'db_query_ms', 'contains': 'Slow database query', 'pattern': r'Slow database query: ([\d.]+) ms',
+     'unit': 'ms'},
+    {'name': 'db_query_ms', 'contains': 'Query executed in', 'pattern': r'Query executed in ([\d.]+) ms',
+     'unit': 'ms'},
+    {'name': 'response_time_ms', 'contains': 'Response time degraded', 'pattern': r'Response time degraded: ([\d.]+) ?ms',
+     'unit': 'ms'},
+    {'name': 'memory_percent', 'contains': 'High memory usage', 'pattern': r'High memory usage detected: ([\d.]+)%',
+     'unit': '%'},
+    {'name': 'memory_mb', 'contains': 'Memory usage:', 'pattern': r'Memory usage: ([\d.]+) MB', 'unit': 'MB'},
+    {'name': 'disk_percent', 'contains': 'Disk space running low', 'pattern': r'Disk space running low: ([\d.]+)%',
+     'unit': '%'},
+    {'name': 'queue_size', 'contains': 'Queue size growing', 'pattern': r'Queue size growing: (\d+) items',
+     'unit': 'items'},
+    {'name': 'connection_pool_size', 'contains': 'Connection pool size', 'pattern': r'Connection pool size: (\d+)',
+     'unit': 'connections'},
+]
+
+HISTOGRAM_COUNTERS = ('count',)
+SUMMARY_COUNTERS = ('count', 'total')
+
+
+def bin_for(value):
+    """Log-scale histogram bin of a value"""
+    return int(math.floor(math.log(max(value, MIN_VALUE)) / LOG_GROWTH))
+
+
+def bin_value(index):
+    """Representative value (geometric midpoint) of a bin"""
+    return GROWTH ** (index + 0.5)
+
+
+def percentiles(bins, quantiles=PERCENTILES):
+    """Quantile estimates from [(bin, count)] pairs"""
+    bins = sorted((int(index), int(count)) for index, count in bins if count)
+    total = sum(count for _, count in bins)
+    if not total:
+        return {quantile: None for quantile in quantiles}
+    results = {}
+    for quantile in quantiles:
+        rank = quantile * total
+        seen = 0
+        for index, count in bins:
+            seen += count
+            if seen >= rank:
+                results[quantile] = round(bin_value(index), 3)
+                break
+    return results
+
+
+class MetricRule:
+    def __init__(self, name, pattern, contains=None, unit='', scale=1.0):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.contains = contains
+        self.unit = unit
+        self.scale = scale
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def extract(self, message):
+        if self.contains is not None and self.contains not in message:
+            return None
+        match = self.pattern.search(message)
+        if match is None:
+            return None
+        try:
+            return float(match.group(1)) * self.scale
+        except (IndexError, ValueError):
+            return None
+
+
+class MetricExtractor:
+    def __init__(self, db, rules=None, minute_retention_hours=48, hour_retention_days=90):
+        """An hour_retention_days of 0 keeps hour buckets forever"""
+        self.db = db
+        self.rules = [rule if isinstance(rule, MetricRule) else MetricRule.from_dict(rule)
+                      for rule in (DEFAULT_METRIC_RULES if rules is None else rules)]
+        self.minute_retention = timedelta(hours=minute_retention_hours)
+        self.hour_retention = timedelta(days=hour_retention_days)
+        self._lock = threading.Lock()
+
+        self.metadata = MetaData()
+        self.minute_bins = self._bins_table('metric_bins_minute')
+        self.hour_bins = self._bins_table('metric_bins_hour')
+        self.minute_summary = self._summary_table('metric_summary_minute')
+        self.hour_summary = self._summary_table('metric_summary_hour')
+
+        self.samples = metrics.REGISTRY.counter('metric_samples_extracted_total',
+                                                'Numeric samples extracted from log messages')
+
+    @classmethod
+    def from_file(cls, db, path, **kwargs):
+        with open(path, 'r') as f:
+            return cls(db, json.load(f), **kwargs)
+
+    def _bins_table(self, name):
+        return Table(
+            name, self.metadata,
+            Column('bucket', DateTime, primary_key=True),
+            Column('metric', String(100), primary_key=True),
+            Column('source', String(100), primary_key=True),
+            Column('bin', Integer, primary_key=True),
+            Column('count', BigInteger, nullable=False)
+        )
+
+    def _summary_table(self, name):
+        return Table(
+            name, self.metadata,
+            Column('bucket', DateTime, primary_key=True),
+            Column('metric', String(100), primary_key=True),
+            Column('source', String(100), primary_key=True),
+            Column('count', BigInteger, nullable=False),
+            Column('total', Float, nullable=False)
+        )
+
+    def ensure_tables(self):
+        self.metadata.create_all(self.db.engine, checkfirst=True)
+
+    def units(self):
+        return {rule.name: rule.unit for rule in self.rules}
+
+    def observe(self, rows):
+        """Flush listener: extract samples and add them to the minute histograms"""
+        bins = []
+        summaries = []
+        for row in rows:
+            message = row.get('message') or ''
+            for rule in self.rules:
+                value = rule.extract(message)
+                if value is None:
+                    continue
+                bucket = rollups.bucket_start(row['timestamp'], 60)
+                source = (row.get('source') or 'unknown')[:100]
+                bins.append({'bucket': bucket, 'metric': rule.name, 'source': source,
+                             'bin': bin_for(value), 'count': 1})
+                summaries.append({'bucket': bucket, 'metric': rule.name, 'source': source,
+                                  'count': 1, 'total': value})
+        if not bins:
+            return 0
+        bins = rollups.aggregate(bins, ('bucket', 'metric', 'source', 'bin'), HISTOGRAM_COUNTERS)
+        summaries = rollups.aggregate(summaries, ('bucket', 'metric', 'source'), SUMMARY_COUNTERS)
+        with self._lock, self.db.engine.begin() as connection:
+            rollups.upsert_add(connection, self.minute_bins, bins, HISTOGRAM_COUNTERS)
+            rollups.upsert_add(connection, self.minute_summary, summaries, SUMMARY_COUNTERS)
+        self.samples.inc(len(summaries))
+        return len(summaries)
+
+    def compact(self):
+        """Rollup compactor: fold aged minute histograms into hour histograms"""
+        cutoff = rollups.bucket_start(datetime.now() - self.minute_retention, 3600)
+        with self._lock, self.db.engine.begin() as connection:
+            folded = rollups.compact(connection, self.minute_bins, self.hour_bins, cutoff, 3600,
+                                     HISTOGRAM_COUNTERS)
+            rollups.compact(connection, self.minute_summary, self.hour_summary, cutoff, 3600, SUMMARY_COUNTERS)
+        return folded
+
+    def expire(self, now=None):
+        """Retention policy: delete hour buckets older than hour_retention_days"""
+        if not self.hour_retention:
+            return 0
+        cutoff = (now or datetime.now()) - self.hour_retention
+        deleted = 0
+        with self._lock, self.db.engine.begin() as connection:
+            for table in (self.hour_bins, self.hour_summary):
+                deleted += connection.execute(table.delete().where(table.c.bucket < cutoff)).rowcount
+        return deleted
+
+    def _query(self, tables, columns, since, until, metric=None, source=None, aggregates=()):
+        results = []
+        for table, is_minute in tables:
+            lower, upper = rollups.inner_buckets(since, until, 60 if is_minute else 3600)
+            criteria = [table.c.bucket >= lower]
+            if upper is not None:
+                criteria.append(table.c.bucket < upper)
+            if metric:
+                criteria.append(table.c.metric == metric)
+            if source:
+                criteria.append(table.c.source == source)
+            group_by = [table.c[name] for name in columns]
+            results.extend(self.db.session.execute(
+                select(*group_by, *[func.sum(table.c[name]) for name in aggregates])
+                .where(*criteria).group_by(*group_by)
+            ).all())
+        return results
+
+    def summary(self, since, until=None, metric=None, source=None):
+        """Count, mean and percentiles per metric and source over a window"""
+        stats = {}
+        for name, src, count, total in self._query(
+                [(self.minute_summary, True), (self.hour_summary, False)], ['metric', 'source'],
+                since, until, metric, source, aggregates=('count', 'total')):
+            entry = stats.setdefault((name, src), {'count': 0, 'total': 0.0, 'bins': []})
+            entry['count'] += int(count)
+            entry['total'] += float(total)
+        for name, src, index, count in self._query(
+                [(self.minute_bins, True), (self.hour_bins, False)], ['metric', 'source', 'bin'],
+                since, until, metric, source, aggregates=('count',)):
+            stats.setdefault((name, src), {'count': 0, 'total': 0.0, 'bins': []})['bins'].append((index, count))
+
+        units = self.units()
+        results = []
+        for (name, src), entry in sorted(stats.items()):
+            quantiles = percentiles(entry['bins'])
+            results.append({
+                'metric': name,
+                'source': src,
+                'unit': units.get(name, ''),
+                'count': entry['count'],
+                'mean': round(entry['total'] / entry['count'], 3) if entry['count'] else None,
+                'p50': quantiles[0.5],
+                'p95': quantiles[0.95],
+                'p99': quantiles[0.99]
+            })
+        return results
+
+    def series(self, metric, since, until=None, source=None):
+        """Per-bucket count and percentiles for one metric"""
+        buckets = {}
+        for bucket, index, count in self._query(
+                [(self.minute_bins, True), (self.hour_bins, False)], ['bucket', 'bin'],
+                since, until, metric, source, aggregates=('count',)):
+            buckets.setdefault(bucket, []).append((index, count))
+        series = []
+        for bucket in sorted(buckets):
+            quantiles = percentiles(buckets[bucket])
+            series.append({
+                'bucket': bucket.isoformat(),
+                'count': sum(int(count) for _, count in buckets[bucket]),
+                'p50': quantiles[0.5],
+                'p95': quantiles[0.95],
+                'p99': quantiles[0.99]
+            })
+        return series
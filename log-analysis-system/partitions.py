@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Time-Partitioned Log Storage
+Splits the log table into fixed time partitions so window queries only touch
+the partitions their range overlaps and retention drops whole partitions.
+
+SQLite: the model's table is the live "head" partition; once an interval is
+complete its rows are sealed into a per-interval table (log_entries_p20250709).
+PostgreSQL: the model's table is expected to be declared PARTITION BY RANGE
+(timestamp); partitions are created ahead of time and the planner prunes them.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Index, MetaData, Table, func, inspect, select, text, union_all
+
+import metrics
+
+
+class PartitionManager:
+    def __init__(self, db, model, interval_hours=24, seal_grace_minutes=60, enabled=True):
+        self.db = db
+        self.base_table = model.__table__
+        self.base_name = self.base_table.name
+        self.interval = timedelta(hours=interval_hours)
+        self.seal_grace = timedelta(minutes=seal_grace_minutes)
+        self.enabled = enabled
+        self.name_format = '%Y%m%d' if interval_hours % 24 == 0 else '%Y%m%d%H'
+        self._name_pattern = re.compile(rf'^{re.escape(self.base_name)}_p(\d{{8}}(?:\d{{2}})?)$')
+        self._metadata = MetaData()
+        self._tables = {}
+        # [(start, name)] reflected from the schema, reset whenever a
+        # partition is created or dropped
+        self._partitions = None
+        # Bumped whenever rows are sealed out of the head table, so readers that
+        # follow the head table by id know to look in the partitions too
+        self.seal_generation = 0
+
+        # Callbacks notified with (name, table) after a partition is sealed and
+        # with (name) before one is dropped
+        self.seal_listeners = []
+        self.drop_listeners = []
+
+        self.partition_count = metrics.REGISTRY.gauge('log_partitions', 'Sealed log partitions')
+        self.sealed_rows = metrics.REGISTRY.counter('log_partition_sealed_rows_total',
+                                                    'Rows moved from the head table into partitions')
+        self.dropped = metrics.REGISTRY.counter('log_partitions_dropped_total',
+                                                'Partitions dropped by retention')
+
+    @property
+    def dialect(self):
+        return self.db.engine.dialect.name
+
+    def partition_start(self, timestamp):
+        """Floor a timestamp to the start of its partition interval"""
+        epoch = datetime(1970, 1, 1)
+        steps = (timestamp - epoch) // self.interval
+        return epoch + steps * self.interval
+
+    def partition_name(self, start):
+        return f"{self.base_name}_p{start.strftime(self.name_format)}"
+
+    def _parse_partition(self, name):
+        match = self._name_pattern.match(name)
+        if not match:
+            return None
+        suffix = match.group(1)
+        return datetime.strptime(suffix, '%Y%m%d%H' if len(suffix) == 10 else '%Y%m%d')
+
+    def table(self, name):
+        """Typed Table object for a partition with the base table's columns"""
+        table = self._tables.get(name)
+        if table is None:
+            columns = [Column(column.name, column.type) for column in self.base_table.columns]
+            table = Table(name, self._metadata, *columns)
+            self._tables[name] = table
+        return table
+
+    def list_partitions(self):
+        """Return [(start, name)] for every existing partition, oldest first"""
+        partitions = self._partitions
+        if partitions is None:
+            partitions = self._partitions = self._reflect_partitions()
+            self.partition_count.set(len(partitions))
+        return list(partitions)
+
+    def invalidate(self):
+        """Forget the cached partition list; the next lookup reflects the schema"""
+        self._partitions = None
+
+    def _reflect_partitions(self):
+        if self.dialect == 'postgresql':
+            rows = self.db.session.execute(text(
+                "SELECT child.relname FROM pg_inherits "
+                "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+                "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+                "WHERE parent.relname = :base"
+            ), {'base': self.base_name}).fetchall()
+            names = [row[0] for row in rows]
+        else:
+            names = inspect(self.db.engine).get_table_names()
+        partitions = []
+        for name in names:
+            start = self._parse_partition(name)
+            if start is not None:
+                partitions.append((start, name))
+        partitions.sort()
+        return partitions
+
+    def maintain(self):
+        """Seal completed intervals (SQLite) or pre-create upcoming partitions (PostgreSQL)"""
+        if not self.enabled:
+            return
+        # Picks up partitions created or dropped by other processes
+        self.invalidate()
+        if self.dialect == 'postgresql':
+            self.ensure_postgres_partitions()
+        else:
+            self.seal_completed()
+
+    def ensure_postgres_partitions(self, ahead=2):
+        """Create the current and next partitions of a natively partitioned table"""
+        partitioned = self.db.session.execute(text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON pt.partrelid = c.oid "
+            "WHERE c.relname = :base"
+        ), {'base': self.base_name}).first()
+        if not partitioned:
+            print(f"Table {self.base_name} is not declared PARTITION BY RANGE (timestamp); "
+                  f"skipping partition maintenance")
+            return
+        start = self.partition_start(datetime.now())
+        for step in range(ahead + 1):
+            lower = start + step * self.interval
+            upper = lower + self.interval
+            self.db.session.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{self.partition_name(lower)}" '
+                f'PARTITION OF "{self.base_name}" '
+                f"FOR VALUES FROM ('{lower.isoformat(sep=' ')}') TO ('{upper.isoformat(sep=' ')}')"
+            ))
+        self.db.session.commit()
+        self.invalidate()
+
+    def seal_completed(self):
+        """Move rows of every completed interval out of the head table"""
+        base = self.base_table
+        self.seed_ids()
+        oldest = self.db.session.execute(select(base.c.timestamp).order_by(base.c.timestamp).limit(1)).scalar()
+        if oldest is None:
+            return 0
+
+        anchor = self._head_anchor()
+        cutoff = self.partition_start(datetime.now() - self.seal_grace)
+        start = self.partition_start(oldest)
+        moved = 0
+        while start < cutoff:
+            end = start + self.interval
+            moved += self._seal_interval(start, end, anchor)
+            start = end
+        return moved
+
+    def _head_anchor(self):
+        """Highest id in the head table
+
+        SQLite hands out max(rowid) + 1, so an emptied head table would start
+        again at 1 and reuse ids already sealed into partitions. The row holding
+        the highest id therefore always stays in the head table; it is sealed
+        once a newer row has arrived.
+        """
+        return self.db.session.execute(select(func.max(self.base_table.c.id))).scalar()
+
+    def seed_ids(self):
+        """Keep ids increasing when the head table is empty but partitions are not
+
+        Moves the row with the highest id back from the partitions into the
+        head table, which is what the next insert's id is derived from.
+        """
+        if not self.enabled or self.dialect == 'postgresql' or self._head_anchor() is not None:
+            return
+        newest = None
+        for _, name in self.list_partitions():
+            table = self.table(name)
+            top = self.db.session.execute(select(func.max(table.c.id))).scalar()
+            if top is not None and (newest is None or top > newest[0]):
+                newest = (top, table)
+        if newest is None:
+            return
+        top, table = newest
+        columns = [column.name for column in self.base_table.columns]
+        self.db.session.execute(self.base_table.insert().from_select(
+            columns, select(*[table.c[name] for name in columns]).where(table.c.id == top)
+        ))
+        self.db.session.execute(table.delete().where(table.c.id == top))
+        self.db.session.commit()
+
+    def _seal_interval(self, start, end, anchor=None):
+        base = self.base_table
+        in_range = (base.c.timestamp >= start) & (base.c.timestamp < end)
+        if anchor is not None:
+            in_range = in_range & (base.c.id != anchor)
+        has_rows = self.db.session.execute(select(base.c.id).where(in_range).limit(1)).first()
+        if has_rows is None:
+            return 0
+
+        partition = self.table(self.partition_name(start))
+        connection = self.db.session.connection()
+        created = not inspect(connection).has_table(partition.name)
+        partition.create(connection, checkfirst=True)
+        Index(f"ix_{partition.name}_timestamp", partition.c.timestamp).create(connection, checkfirst=True)
+
+        columns = [column.name for column in base.columns]
+        result = self.db.session.execute(partition.insert().from_select(
+            columns, select(*[base.c[name] for name in columns]).where(in_range)
+        ))
+        self.db.session.execute(base.delete().where(in_range))
+        self.db.session.commit()
+        if created:
+            self.invalidate()
+        self.seal_generation += 1
+        self.sealed_rows.inc(result.rowcount)
+        for listener in self.seal_listeners:
+            listener(partition.name, partition)
+        return result.rowcount
+
+    def drop_before(self, cutoff):
+        """Drop every partition that ends at or before cutoff"""
+        dropped = 0
+        for start, name in self.list_partitions():
+            if start + self.interval <= cutoff:
+                for listener in self.drop_listeners:
+                    listener(name)
+                self.db.session.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+                self._tables.pop(name, None)
+                dropped += 1
+        if self.dialect != 'postgresql':
+            # Anything still unsealed in the head table is small; delete it
+            # directly, all but the id anchor (see _head_anchor)
+            base = self.base_table
+            expired = base.c.timestamp < cutoff
+            anchor = self._head_anchor()
+            if anchor is not None:
+                expired = expired & (base.c.id != anchor)
+            self.db.session.execute(base.delete().where(expired))
+        self.db.session.commit()
+        self.invalidate()
+        self.dropped.inc(dropped)
+        self.list_partitions()
+        return dropped
+
+    def tables(self, start=None, end=None):
+        """Head table plus every partition table that overlaps [start, end)"""
+        if not self.enabled or self.dialect == 'postgresql':
+            return [self.base_table]
+
+        tables = [self.base_table]
+        for partition_start, name in self.list_partitions():
+            partition_end = partition_start + self.interval
+            if start is not None and partition_end <= start:
+                continue
+            if end is not None and partition_start >= end:
+                continue
+            tables.append(self.table(name))
+        return tables
+
+    def source(self, start=None, end=None):
+        """Selectable covering only the partitions that overlap [start, end)"""
+        tables = self.tables(start, end)
+        if len(tables) == 1:
+            return self.base_table
+        return union_all(*[select(table) for table in tables]).subquery('log_window')
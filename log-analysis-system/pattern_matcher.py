@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Multi-Pattern Matcher
+Compiles alert and tagging rules into one Aho-Corasick automaton for literal
+patterns plus one combined regex for the rest, so each log line is scanned
+once and every matching rule id is returned
+"""
+
+import argparse
+import json
+import re
+import time
+from collections import deque
+
+# Rules for the security and performance events our log sources emit
+DEFAULT_RULES = [
+    {'id': 'security_breach', 'pattern': 'Security breach', 'severity': 'CRITICAL', 'alert': True},
+    {'id': 'ransomware', 'pattern': 'Ransomware', 'severity': 'CRITICAL', 'alert': True},
+    {'id': 'privilege_escalation', 'pattern': 'Privilege escalation', 'severity': 'CRITICAL', 'alert': True},
+    {'id': 'data_exfiltration', 'pattern': 'Data exfiltration', 'severity': 'CRITICAL', 'alert': True},
+    {'id': 'system_compromise', 'pattern': 'System compromise', 'severity': 'CRITICAL', 'alert': True},
+    {'id': 'unauthorized_access', 'pattern': 'Unauthorized access', 'severity': 'HIGH', 'alert': True},
+    {'id': 'multiple_failed_logins', 'pattern': 'Multiple failed login', 'severity': 'HIGH', 'alert': True},
+    {'id': 'failed_authentication', 'pattern': 'Failed authentication', 'severity': 'MEDIUM'},
+    {'id': 'permission_denied', 'pattern': 'Permission denied', 'severity': 'MEDIUM'},
+    {'id': 'data_corruption', 'pattern': 'Data corruption', 'severity': 'HIGH', 'alert': True},
+    {'id': 'service_unavailable', 'pattern': r'Service (completely )?unavailable|service unavailable',
+     'type': 'regex', 'severity': 'HIGH', 'alert': True},
+    {'id': 'slow_query', 'pattern': r'Slow database query: \d{4,} ms', 'type': 'regex', 'severity': 'MEDIUM'},
+    {'id': 'memory_pressure', 'pattern': r'High memory usage detected: 9\d%', 'type': 'regex', 'severity': 'MEDIUM'},
+]
+
+
+class Rule:
+    def __init__(self, id, pattern, type='literal', case_sensitive=False, severity='MEDIUM', alert=False):
+        if type not in ('literal', 'regex'):
+            raise ValueError(f"Unknown rule type: {type}")
+        self.id = id
+        self.pattern = pattern
+        self.type = type
+        self.case_sensitive = case_sensitive
+        self.severity = severity
+        self.alert = alert
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class AhoCorasick:
+    """Literal multi-pattern automaton; search() is one pass over the text"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+    def add(self, pattern, value):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = next_node
+        self._output[node] = self._output[node] + (value,)
+
+    def build(self):
+        """Compute failure links breadth-first and merge outputs along them"""
+        queue = deque(self._goto[0].values())
+        for node in queue:
+            self._fail[node] = 0
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                # Depth-one nodes fail back to the root, never to themselves
+                self._fail[child] = target if target != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def search(self, text):
+        """Return the set of values whose pattern occurs in text"""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+    def __len__(self):
+        return len(self._goto)
+
+
+class MultiPatternMatcher:
+    def __init__(self, rules=None):
+        self.rules = {}
+        self._literal_ci = AhoCorasick()
+        self._literal_cs = AhoCorasick()
+        self._has_ci = False
+        self._has_cs = False
+        self._regex_rules = []
+        self._combined = None
+        for rule in rules or []:
+            self.add_rule(rule if isinstance(rule, Rule) else Rule.from_dict(rule))
+        self.compile()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, 'r') as f:
+            return cls(json.load(f))
+
+    def add_rule(self, rule):
+        if rule.id in self.rules:
+            raise ValueError(f"Duplicate rule id: {rule.id}")
+        self.rules[rule.id] = rule
+        if rule.type == 'literal':
+            if rule.case_sensitive:
+                self._literal_cs.add(rule.pattern, rule.id)
+                self._has_cs = True
+            else:
+                self._literal_ci.add(rule.pattern.lower(), rule.id)
+                self._has_ci = True
+        else:
+            flags = 0 if rule.case_sensitive else re.IGNORECASE
+            self._regex_rules.append((rule.id, re.compile(rule.pattern, flags)))
+
+    def compile(self):
+        """Build the automata and the combined regex after rules are added"""
+        self._literal_ci.build()
+        self._literal_cs.build()
+        if self._regex_rules:
+            # Scoped inline flags keep each rule's case sensitivity inside one pattern
+            alternatives = []
+            for index, (_, pattern) in enumerate(self._regex_rules):
+                flag = '(?i:' if pattern.flags & re.IGNORECASE else '(?-i:'
+                alternatives.append(f"(?P<r{index}>{flag}{pattern.pattern}))")
+            self._combined = re.compile('|'.join(alternatives))
+        else:
+            self._combined = None
+
+    def match(self, line):
+        """Return the set of rule ids that match line"""
+        matched = set()
+        if self._has_ci:
+            matched |= self._literal_ci.search(line.lower())
+        if self._has_cs:
+            matched |= self._literal_cs.search(line)
+        if self._combined is not None:
+            matched |= self._match_regex(line)
+        return matched
+
+    def _match_regex(self, line):
+        matched = set()
+        position = 0
+        remaining = len(self._regex_rules)
+        while remaining and position <= len(line):
+            found = self._combined.search(line, position)
+            if found is None:
+                break
+            start = found.start()
+            first = int(found.lastgroup[1:])
+            # Alternatives before the winner failed at this position; later ones
+            # may also match here, so test just those directly
+            for index in range(first, len(self._regex_rules)):
+                rule_id, pattern = self._regex_rules[index]
+                if rule_id not in matched and (index == first or pattern.match(line, start)):
+                    matched.add(rule_id)
+                    remaining -= 1
+            position = start + 1
+        return matched
+
+    def match_many(self, lines):
+        """Yield (line, rule ids) for every line with at least one match"""
+        for line in lines:
+            matched = self.match(line)
+            if matched:
+                yield line, matched
+
+
+def benchmark(rule_count=300, lines=20000):
+    """Compare one-pass matching with testing every rule against every line"""
+    import random
+    words = ['timeout', 'user', 'login', 'database', 'cache', 'session', 'disk', 'queue', 'token', 'request']
+    rules = [dict(rule) for rule in DEFAULT_RULES]
+    while len(rules) < rule_count:
+        phrase = ' '.join(random.sample(words, 2)) + f" {len(rules)}"
+        rules.append({'id': f"rule_{len(rules)}", 'pattern': phrase})
+    matcher = MultiPatternMatcher(rules)
+    sample = [
+        "Security breach detected from IP 10.0.0.1",
+        "Slow database query: 4200 ms",
+        "User alice logged in successfully",
+        "Failed authentication attempt for user bob",
+    ]
+    text = [random.choice(sample) for _ in range(lines)]
+
+    start = time.perf_counter()
+    for line in text:
+        matcher.match(line)
+    one_pass = time.perf_counter() - start
+
+    compiled = [(rule['id'], re.compile(re.escape(rule['pattern']) if rule.get('type', 'literal') == 'literal'
+                                        else rule['pattern'], re.IGNORECASE)) for rule in rules]
+    start = time.perf_counter()
+    for line in text:
+        {rule_id for rule_id, pattern in compiled if pattern.search(line)}
+    per_rule = time.perf_counter() - start
+
+    print(f"Rules: {len(rules)}  lines: {lines:,}")
+    print(f"Per-rule scan:  {per_rule * 1000:.1f} ms")
+    print(f"Single pass:    {one_pass * 1000:.1f} ms ({per_rule / one_pass:.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the multi-pattern rule matcher")
+    parser.add_argument("-r", "--rules", type=int, default=300, help="Number of rules (default: 300)")
+    parser.add_argument("-n", "--lines", type=int, default=20000, help="Lines to scan (default: 20000)")
+    args = parser.parse_args()
+    benchmark(args.rules, args.lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Rollup Helpers
+Shared plumbing for pre-aggregated counter tables: every rollup table has a
+'bucket' timestamp column plus key columns as its primary key and additive
+counter columns, so rows can be merged with an increment-on-conflict upsert
+and folded from fine buckets into coarse ones
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(timestamp, seconds):
+    """Floor a naive datetime to a multiple of seconds since EPOCH"""
+    offset = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=offset - offset % seconds)
+
+
+def inner_buckets(since, until, seconds):
+    """[lower, upper) bounds selecting only the buckets that lie wholly inside [since, until)
+
+    A bucket straddling since or until would count events outside the range,
+    so it is left out rather than counted whole.
+    """
+    lower = bucket_start(since, seconds)
+    if lower < since:
+        lower += timedelta(seconds=seconds)
+    upper = None if until is None else bucket_start(until, seconds)
+    return lower, upper
+
+
+def upsert_add(connection, table, rows, counters):
+    """Insert rows, adding the counter columns onto rows that already exist"""
+    if not rows:
+        return
+    keys = [column.name for column in table.primary_key.columns]
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=keys,
+            set_={name: table.c[name] + statement.excluded[name] for name in counters}
+        )
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        match = [table.c[name] == row[name] for name in keys]
+        result = connection.execute(
+            table.update().where(*match).values({name: table.c[name] + row[name] for name in counters})
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(row))
+
+
+def aggregate(rows, key_names, counters):
+    """Sum counter fields of dict rows sharing the same key fields"""
+    merged = {}
+    for row in rows:
+        key = tuple(row[name] for name in key_names)
+        target = merged.get(key)
+        if target is None:
+            merged[key] = dict(row)
+        else:
+            for name in counters:
+                target[name] += row[name]
+    return list(merged.values())
+
+
+def compact(connection, source, target, cutoff, bucket_seconds, counters):
+    """Fold source buckets older than cutoff into target's coarser buckets"""
+    keys = [column.name for column in source.primary_key.columns]
+    rows = [dict(row._mapping) for row in connection.execute(
+        select(source).where(source.c.bucket < cutoff)
+    )]
+    if not rows:
+        return 0
+    for row in rows:
+        row['bucket'] = bucket_start(row['bucket'], bucket_seconds)
+    upsert_add(connection, target, aggregate(rows, keys, counters), counters)
+    connection.execute(source.delete().where(source.c.bucket < cutoff))
+    return len(rows)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Background Task Scheduler
+Runs independent periodic jobs (ingest, alerting, compaction, retention) on an
+asyncio loop, each with its own interval, jitter, timeout and overlap guard
+"""
+
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+class ScheduledTask:
+    def __init__(self, name, func, interval, jitter=0.0, timeout=None, run_immediately=True):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.run_immediately = run_immediately
+        self.running = False
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+        labels = {'task': name}
+        self.duration = metrics.REGISTRY.histogram('scheduler_task_duration_seconds',
+                                                   'Wall time per scheduled task run', labels=labels)
+        self.runs = metrics.REGISTRY.counter('scheduler_task_runs_total', 'Scheduled task runs', labels=labels)
+        self.failures = metrics.REGISTRY.counter('scheduler_task_failures_total',
+                                                 'Scheduled task runs that raised', labels=labels)
+        self.timeouts = metrics.REGISTRY.counter('scheduler_task_timeouts_total',
+                                                 'Scheduled task runs that exceeded their timeout', labels=labels)
+        self.skipped = metrics.REGISTRY.counter('scheduler_task_skipped_total',
+                                                'Runs skipped because the previous run was still active',
+                                                labels=labels)
+
+    def next_delay(self):
+        """Interval plus random jitter so tasks don't fire in lockstep"""
+        return self.interval + random.uniform(0, self.jitter)
+
+    def status(self):
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'running': self.running,
+            'last_run': self.last_run,
+            'last_duration': self.last_duration,
+            'last_error': self.last_error
+        }
+
+
+class TaskScheduler:
+    def __init__(self, max_workers=4):
+        self.tasks = {}
+        self.max_workers = max_workers
+        self._executor = None
+        self._loop = None
+        self._thread = None
+        self._stop_event = None
+        self._started = threading.Event()
+
+    def add_task(self, name, func, interval, jitter=0.0, timeout=None, run_immediately=True):
+        """Register a periodic task; func is a blocking callable run in a worker thread"""
+        self.tasks[name] = ScheduledTask(name, func, interval, jitter, timeout, run_immediately)
+        return self.tasks[name]
+
+    def start(self):
+        """Start the scheduler loop in a daemon thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='scheduler')
+        self._thread = threading.Thread(target=self._run_loop, name='task-scheduler', daemon=True)
+        self._thread.start()
+        self._started.wait()
+
+    def stop(self, timeout=30):
+        """Stop scheduling new runs and wait for in-flight runs to finish"""
+        if not self._loop or not self._thread:
+            return
+        self._loop.call_soon_threadsafe(self._stop_event.set)
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    def status(self):
+        return [task.status() for task in self.tasks.values()]
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._stop_event = asyncio.Event()
+        self._started.set()
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self):
+        runners = [asyncio.create_task(self._task_loop(task)) for task in self.tasks.values()]
+        await self._stop_event.wait()
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+
+    async def _task_loop(self, task):
+        if not task.run_immediately:
+            await asyncio.sleep(task.next_delay())
+        while True:
+            await self._run_once(task)
+            await asyncio.sleep(task.next_delay())
+
+    async def _run_once(self, task):
+        if task.running:
+            # The previous run timed out but its thread is still working
+            task.skipped.inc()
+            return
+
+        task.running = True
+        start = time.perf_counter()
+
+        def finished(_future):
+            task.running = False
+            task.last_duration = time.perf_counter() - start
+            task.duration.observe(task.last_duration)
+
+        future = self._loop.run_in_executor(self._executor, task.func)
+        future.add_done_callback(finished)
+        task.last_run = time.time()
+        task.runs.inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), task.timeout)
+            task.last_error = None
+        except asyncio.TimeoutError:
+            task.timeouts.inc()
+            task.last_error = f"timed out after {task.timeout}s"
+            print(f"Scheduled task {task.name} exceeded its {task.timeout}s timeout")
+        except asyncio.CancelledError:
+            # Shutting down: let the in-flight run finish before exiting
+            await asyncio.wait([future])
+            raise
+        except Exception as e:
+            task.failures.inc()
+            task.last_error = str(e)
+            print(f"Scheduled task {task.name} error: {e}")
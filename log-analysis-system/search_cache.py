@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Search Result Cache
+Bounded LRU cache for search results keyed by the normalized query and its
+filters, invalidated by an ingest watermark
+"""
+
+import threading
+from collections import OrderedDict
+
+import metrics
+
+
+def normalize_query(query, filters=None):
+    """Build a cache key from a search string and its filters"""
+    normalized = ' '.join(query.split())
+    filter_items = tuple(sorted((key, value) for key, value in (filters or {}).items() if value))
+    return normalized, filter_items
+
+
+class SearchCache:
+    def __init__(self, max_entries=512, serve_stale=False):
+        self.max_entries = max_entries
+        self.serve_stale = serve_stale
+        self.watermark = 0
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+        self.hits = metrics.REGISTRY.counter('search_cache_hits_total', 'Search cache hits')
+        self.stale_hits = metrics.REGISTRY.counter('search_cache_stale_hits_total',
+                                                   'Search cache hits served stale while refreshing')
+        self.misses = metrics.REGISTRY.counter('search_cache_misses_total', 'Search cache misses')
+        self.evictions = metrics.REGISTRY.counter('search_cache_evictions_total',
+                                                  'Search cache LRU evictions')
+        self.size = metrics.REGISTRY.gauge('search_cache_entries', 'Entries held by the search cache')
+
+    def bump_watermark(self):
+        """Mark every cached result as older than the latest ingest"""
+        with self._lock:
+            self.watermark += 1
+
+    def get_or_compute(self, key, compute):
+        """Return the cached result for key, computing it on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                watermark, result = entry
+                if watermark == self.watermark:
+                    self._entries.move_to_end(key)
+                    self.hits.inc()
+                    return result
+                if self.serve_stale:
+                    self._entries.move_to_end(key)
+                    self.stale_hits.inc()
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, compute), daemon=True).start()
+                    return result
+            self.misses.inc()
+            watermark = self.watermark
+
+        result = compute()
+        self._store(key, watermark, result)
+        return result
+
+    def _refresh(self, key, compute):
+        """Recompute a stale entry in the background"""
+        try:
+            with self._lock:
+                watermark = self.watermark
+            self._store(key, watermark, compute())
+        except Exception as e:
+            print(f"Search cache refresh error: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, watermark, result):
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and existing[0] > watermark:
+                # A slower computation finished after a fresher one was stored
+                return
+            self._entries[key] = (watermark, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions.inc()
+            self.size.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size.set(0)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Online Sessionization
+Groups access-log requests into client sessions as they are ingested: one
+session per user (or per IP when the request is anonymous), closed after an
+inactivity gap. Open sessions live in a bounded LRU; each closed session is
+written as one summary row, and sessions that look like abuse raise alerts.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, String, Table, Text, select
+
+import metrics
+from http_analytics import normalize_endpoint
+from line_parser import parse_access_fields
+
+MAX_TRACKED_ENDPOINTS = 200
+
+
+class ClientSession:
+    def __init__(self, key_type, client, ip_address, timestamp):
+        self.key_type = key_type
+        self.client = client
+        self.ip_address = ip_address
+        self.start = timestamp
+        self.end = timestamp
+        self.requests = 0
+        self.errors = 0
+        self.endpoints = set()
+        self.touched = time.monotonic()
+
+    def add(self, timestamp, endpoint, status):
+        self.start = min(self.start, timestamp)
+        self.end = max(self.end, timestamp)
+        self.requests += 1
+        if status >= 400:
+            self.errors += 1
+        if len(self.endpoints) < MAX_TRACKED_ENDPOINTS:
+            self.endpoints.add(endpoint)
+        self.touched = time.monotonic()
+
+    def to_dict(self):
+        return {
+            'key_type': self.key_type,
+            'client': self.client,
+            'ip_address': self.ip_address,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'duration_seconds': int((self.end - self.start).total_seconds()),
+            'requests': self.requests,
+            'errors': self.errors,
+            'distinct_endpoints': len(self.endpoints),
+            'endpoints': sorted(self.endpoints),
+            'open': True
+        }
+
+
+class Sessionizer:
+    def __init__(self, db, gap_seconds=1800, max_sessions=100000, max_requests=1000,
+                 max_error_ratio=0.5, max_endpoints=50, on_suspicious=None):
+        self.db = db
+        self.gap = timedelta(seconds=gap_seconds)
+        self.max_sessions = max_sessions
+        self.max_requests = max_requests
+        self.max_error_ratio = max_error_ratio
+        self.max_endpoints = max_endpoints
+        self.on_suspicious = on_suspicious
+        self._open = OrderedDict()
+        self._closed = []
+        self._watermark = None
+        self._lock = threading.Lock()
+
+        metadata = MetaData()
+        self.table = Table(
+            'client_sessions', metadata,
+            Column('id', Integer, primary_key=True),
+            Column('key_type', String(8), nullable=False),
+            Column('client', String(100), nullable=False),
+            Column('ip_address', String(45)),
+            Column('start', DateTime, nullable=False, index=True),
+            Column('end', DateTime, nullable=False, index=True),
+            Column('duration_seconds', Integer, nullable=False),
+            Column('requests', Integer, nullable=False),
+            Column('errors', Integer, nullable=False),
+            Column('distinct_endpoints', Integer, nullable=False),
+            Column('endpoints', Text),
+            Column('suspicious', Boolean, nullable=False, default=False),
+            Column('reasons', String(255)),
+            Index('ix_client_sessions_client_start', 'client', 'start')
+        )
+        self.metadata = metadata
+
+        self.closed_counter = metrics.REGISTRY.counter('sessions_closed_total', 'Client sessions closed')
+        self.evicted = metrics.REGISTRY.counter('sessions_evicted_total',
+                                                'Open sessions closed early to stay under the LRU cap')
+        self.open_gauge = metrics.REGISTRY.gauge('sessions_open', 'Client sessions currently open')
+
+    def ensure_table(self):
+        self.metadata.create_all(self.db.engine, checkfirst=True)
+
+    def observe(self, rows):
+        """Flush listener: add access-log requests to their client's session"""
+        with self._lock:
+            for row in rows:
+                if row.get('source') not in ('apache', 'nginx'):
+                    continue
+                fields = parse_access_fields(row['message'])
+                if fields is None:
+                    continue
+                self._add(row['timestamp'], fields)
+            self.open_gauge.set(len(self._open))
+            closed, self._closed = self._closed, []
+        self._persist(closed)
+
+    def _add(self, timestamp, fields):
+        key_type, client = ('user', fields['user']) if fields['user'] else ('ip', fields['ip_address'])
+        key = (key_type, client)
+        if self._watermark is None or timestamp > self._watermark:
+            # One line stamped in the future must not close every open session
+            self._watermark = min(timestamp, datetime.now())
+
+        session = self._open.get(key)
+        if session is not None and not session.start - self.gap <= timestamp <= session.end + self.gap:
+            # Too far after the session, or (backfilled) too far before it
+            self._close(key)
+            session = None
+        if session is None:
+            while len(self._open) >= self.max_sessions:
+                # Least recently active client goes first
+                self._close(next(iter(self._open)))
+                self.evicted.inc()
+            session = ClientSession(key_type, client[:100], fields['ip_address'], timestamp)
+            self._open[key] = session
+        else:
+            self._open.move_to_end(key)
+        session.add(timestamp, normalize_endpoint(fields['endpoint']), fields['status'])
+
+    def _close(self, key):
+        session = self._open.pop(key)
+        self._closed.append(session)
+        self.closed_counter.inc()
+
+    def sweep(self):
+        """Close sessions idle for the gap, by event time or by wall-clock inactivity"""
+        idle_before = time.monotonic() - self.gap.total_seconds()
+        with self._lock:
+            cutoff = self._watermark - self.gap if self._watermark is not None else None
+            for key in [key for key, session in self._open.items()
+                        if session.touched < idle_before or (cutoff is not None and session.end < cutoff)]:
+                self._close(key)
+            self.open_gauge.set(len(self._open))
+            closed, self._closed = self._closed, []
+        self._persist(closed)
+        return len(closed)
+
+    def flush_all(self):
+        """Close every open session, e.g. at shutdown"""
+        with self._lock:
+            for key in list(self._open):
+                self._close(key)
+            closed, self._closed = self._closed, []
+        self._persist(closed)
+
+    def _reasons(self, session):
+        reasons = []
+        if session.requests >= self.max_requests:
+            reasons.append(f"{session.requests} requests")
+        if session.requests >= 20 and session.errors / session.requests >= self.max_error_ratio:
+            reasons.append(f"{session.errors}/{session.requests} errors")
+        if len(session.endpoints) >= self.max_endpoints:
+            reasons.append(f"{len(session.endpoints)}+ distinct endpoints")
+        return reasons
+
+    def _persist(self, sessions):
+        if not sessions:
+            return
+        rows = []
+        for session in sessions:
+            reasons = self._reasons(session)
+            rows.append({
+                'key_type': session.key_type,
+                'client': session.client,
+                'ip_address': session.ip_address,
+                'start': session.start,
+                'end': session.end,
+                'duration_seconds': int((session.end - session.start).total_seconds()),
+                'requests': session.requests,
+                'errors': session.errors,
+                'distinct_endpoints': len(session.endpoints),
+                'endpoints': ','.join(sorted(session.endpoints)),
+                'suspicious': bool(reasons),
+                'reasons': '; '.join(reasons)[:255] or None
+            })
+            if reasons and self.on_suspicious is not None:
+                self.on_suspicious(session, reasons)
+        try:
+            with self.db.engine.begin() as connection:
+                connection.execute(self.table.insert(), rows)
+        except Exception as e:
+            print(f"Session persist error ({len(rows)} sessions dropped): {e}")
+
+    def open_sessions(self, client=None):
+        with self._lock:
+            return [session.to_dict() for session in self._open.values()
+                    if client is None or session.client == client]
+
+    def sessions(self, since, client=None, suspicious=False, limit=100):
+        """Closed session summaries active at or after since, newest first"""
+        table = self.table
+        criteria = [table.c.end >= since]
+        if client:
+            criteria.append(table.c.client == client)
+        if suspicious:
+            criteria.append(table.c.suspicious.is_(True))
+        rows = self.db.session.execute(
+            select(table).where(*criteria).order_by(table.c.start.desc()).limit(limit)
+        ).all()
+        results = []
+        for row in rows:
+            data = dict(row._mapping)
+            data['start'] = row.start.isoformat()
+            data['end'] = row.end.isoformat()
+            data['endpoints'] = row.endpoints.split(',') if row.endpoints else []
+            data['open'] = False
+            results.append(data)
+        return results
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Fast Timestamp Parser
+Decodes the fixed timestamp layouts our log formats use by slicing fixed
+offsets instead of calling datetime.strptime per line. The date part is cached
+per prefix, so a file full of lines from the same day only parses the date once.
+
+Layouts:
+    iso     2025-07-09 14:03:08        (standard, json, syslog from log_generator.py)
+    apache  09/Jul/2025:14:03:08 +0000 (Common/Combined Log Format)
+    syslog  Jul  9 14:03:08            (RFC 3164, no year)
+
+Results are naive local times like the rest of the store: an apache UTC offset
+is converted to the local offset at that instant, and a syslog date more than
+a day in the future is taken to be from last year.
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+
+MONTHS = {name: index for index, name in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1)}
+
+EPOCH = datetime(1970, 1, 1)
+
+STRPTIME_FORMATS = {
+    'iso': '%Y-%m-%d %H:%M:%S',
+    'apache': '%d/%b/%Y:%H:%M:%S',
+    'syslog': '%b %d %H:%M:%S',
+}
+
+
+class TimestampParser:
+    def __init__(self, max_cached_dates=4096, default_year=None):
+        self.max_cached_dates = max_cached_dates
+        self.default_year = default_year
+        self._dates = {}
+        self._local_offsets = {}
+        self._today = None
+
+    def _date(self, prefix, decode):
+        """Return (year, month, day, epoch seconds at midnight) for a date prefix"""
+        cached = self._dates.get(prefix)
+        if cached is None:
+            year, month, day = decode(prefix)
+            midnight = datetime(year, month, day)
+            cached = (year, month, day, int((midnight - EPOCH).total_seconds()))
+            if len(self._dates) >= self.max_cached_dates:
+                self._dates.clear()
+            self._dates[prefix] = cached
+        return cached
+
+    @staticmethod
+    def _decode_iso_date(prefix):
+        return int(prefix[0:4]), int(prefix[5:7]), int(prefix[8:10])
+
+    @staticmethod
+    def _decode_apache_date(prefix):
+        return int(prefix[7:11]), MONTHS[prefix[3:6]], int(prefix[0:2])
+
+    def _decode_syslog_date(self, prefix):
+        if self.default_year:
+            return self.default_year, MONTHS[prefix[0:3]], int(prefix[4:6])
+        now = datetime.now()
+        month, day = MONTHS[prefix[0:3]], int(prefix[4:6])
+        year = now.year
+        if datetime(year, month, day) > now + timedelta(days=1):
+            # Dec 31 read on Jan 1
+            year -= 1
+        return year, month, day
+
+    def _local_offset(self, utc_epoch):
+        """Local UTC offset in seconds at an instant, cached per hour"""
+        hour = utc_epoch // 3600
+        offset = self._local_offsets.get(hour)
+        if offset is None:
+            if len(self._local_offsets) >= self.max_cached_dates:
+                self._local_offsets.clear()
+            offset = time.localtime(hour * 3600).tm_gmtoff
+            self._local_offsets[hour] = offset
+        return offset
+
+    def _apache_shift(self, text, naive_epoch):
+        """Seconds to add to an apache timestamp to move it from its %z offset to local time"""
+        if len(text) < 26 or text[20] != ' ' or text[21] not in '+-':
+            return 0
+        zone = text[22:26]
+        if not zone.isdigit():
+            raise ValueError(f"Malformed UTC offset: {text!r}")
+        offset = (int(zone[0:2]) * 3600 + int(zone[2:4]) * 60) * (-1 if text[21] == '-' else 1)
+        return self._local_offset(naive_epoch - offset) - offset
+
+    def _split(self, text, fmt):
+        """Return (date fields, hour, minute, second, seconds to shift to local time)"""
+        if fmt == 'iso':
+            date = self._date(text[:10], self._decode_iso_date)
+            clock = text[11:19]
+        elif fmt == 'apache':
+            date = self._date(text[:11], self._decode_apache_date)
+            clock = text[12:20]
+        elif fmt == 'syslog':
+            if not self.default_year:
+                today = int(time.time() // 86400)
+                if today != self._today:
+                    # Which year a syslog date falls in depends on today's date
+                    self._dates.clear()
+                    self._today = today
+            date = self._date(text[:6], self._decode_syslog_date)
+            clock = text[7:15]
+        else:
+            raise ValueError(f"Unknown timestamp format: {fmt}")
+        if clock[2] != ':' or clock[5] != ':':
+            raise ValueError(f"Malformed timestamp: {text!r}")
+        hour, minute, second = int(clock[0:2]), int(clock[3:5]), int(clock[6:8])
+        if hour > 23 or minute > 59 or second > 59:
+            raise ValueError(f"Malformed timestamp: {text!r}")
+        shift = 0
+        if fmt == 'apache':
+            shift = self._apache_shift(text, date[3] + hour * 3600 + minute * 60 + second)
+        return date, hour, minute, second, shift
+
+    def parse(self, text, fmt='iso'):
+        """Parse a timestamp into a naive local datetime"""
+        (year, month, day, _), hour, minute, second, shift = self._split(text, fmt)
+        parsed = datetime(year, month, day, hour, minute, second)
+        return parsed + timedelta(seconds=shift) if shift else parsed
+
+    def parse_epoch(self, text, fmt='iso'):
+        """Parse a timestamp into integer seconds since 1970-01-01 (naive local)"""
+        (_, _, _, midnight), hour, minute, second, shift = self._split(text, fmt)
+        return midnight + hour * 3600 + minute * 60 + second + shift
+
+    def parse_column(self, values, fmt='iso'):
+        """Parse a sequence of timestamps into a list of epoch integers"""
+        parse_epoch = self.parse_epoch
+        return [parse_epoch(value, fmt) for value in values]
+
+    @staticmethod
+    def detect_format(text):
+        """Guess the layout of a timestamp string"""
+        if len(text) >= 19 and text[4] == '-' and text[7] == '-':
+            return 'iso'
+        if len(text) >= 20 and text[2] == '/' and text[6] == '/':
+            return 'apache'
+        if len(text) >= 15 and text[:3] in MONTHS and text[3] == ' ':
+            return 'syslog'
+        return None
+
+    def parse_any(self, text):
+        """Parse any supported layout, falling back to fromisoformat"""
+        fmt = self.detect_format(text)
+        if fmt == 'iso' and len(text) > 19:
+            # Fractional seconds or a UTC offset: leave those to the C parser
+            fmt = None
+        if fmt is not None:
+            try:
+                return self.parse(text, fmt)
+            except (ValueError, KeyError):
+                pass
+        parsed = datetime.fromisoformat(text)
+        if parsed.tzinfo is not None:
+            # Same as an apache offset: move to local time and drop the zone
+            parsed = parsed.astimezone().replace(tzinfo=None)
+        return parsed
+
+
+def epoch_to_datetime(epoch):
+    """Convert an integer epoch column value back to a naive datetime"""
+    return EPOCH + timedelta(seconds=epoch)
+
+
+def benchmark(lines=200000):
+    """Compare the fixed-offset parser with strptime for each layout"""
+    now = datetime.now().replace(microsecond=0)
+    samples = {
+        'iso': [(now - timedelta(seconds=i * 7)).strftime('%Y-%m-%d %H:%M:%S') for i in range(lines)],
+        'apache': [(now - timedelta(seconds=i * 7)).strftime('%d/%b/%Y:%H:%M:%S') + ' +0000'
+                   for i in range(lines)],
+        'syslog': [(now - timedelta(seconds=i * 7)).strftime('%b %d %H:%M:%S') for i in range(lines)],
+    }
+    print(f"Lines per format: {lines:,}")
+    for fmt, values in samples.items():
+        parser = TimestampParser(default_year=now.year)
+        layout = STRPTIME_FORMATS[fmt]
+        width = len(now.strftime(layout))
+
+        start = time.perf_counter()
+        for value in values:
+            datetime.strptime(value[:width], layout)
+        strptime_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for value in values:
+            parser.parse(value, fmt)
+        fast_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parser.parse_column(values, fmt)
+        epoch_time = time.perf_counter() - start
+
+        print(f"{fmt:7} strptime {strptime_time * 1000:8.1f} ms | "
+              f"fast {fast_time * 1000:7.1f} ms ({strptime_time / fast_time:4.1f}x) | "
+              f"epoch column {epoch_time * 1000:7.1f} ms ({strptime_time / epoch_time:4.1f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fast timestamp parser against strptime")
+    parser.add_argument("-n", "--lines", type=int, default=200000, help="Timestamps per format (default: 200000)")
+    args = parser.parse_args()
+    benchmark(args.lines)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@ Main Flask Web Application for Network Automation Toolkit
 Provides web interface for device management and automation tasks
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response
 import json
 import os
 from datetime import datetime
@@ -28,18 +28,24 @@ def dashboard():
 
 @app.route('/api/devices')
 def get_devices():
-    """Get list of discovered devices"""
-    devices = discovery.load_inventory()
-    return jsonify(devices)
+    """Get list of discovered devices, optionally filtered by hostname, vendor or subnet"""
+    hostname = request.args.get('hostname')
+    vendor = request.args.get('vendor')
+    subnet = request.args.get('subnet')
+    if hostname or vendor or subnet:
+        return jsonify(discovery.store.find(hostname=hostname, vendor=vendor, subnet=subnet))
+    # Serialized once per inventory write
+    return Response(discovery.store.snapshot().json, mimetype='application/json')
 
 @app.route('/api/discover', methods=['POST'])
 def start_discovery():
     """Start network discovery"""
     data = request.get_json()
     networks = data.get('networks', ['192.168.1.0/24'])
+    full = data.get('full', False)
     
     def run_discovery():
-        discovery.discover_network(networks)
+        discovery.discover_network(networks, full=full)
         discovery.save_inventory()
     
     # Run discovery in background thread
@@ -54,17 +60,12 @@ def start_backup():
     data = request.get_json()
     device_ips = data.get('devices', [])
     
-    # Load device inventory
-    all_devices = discovery.load_inventory()
-    
-    # Filter devices to backup
-    devices_to_backup = []
-    for device in all_devices:
-        if device['ip'] in device_ips:
-            # Add connection credentials (should be from secure storage)
-            device['username'] = 'admin'
-            device['password'] = 'cisco123'  # In production, use secure credential management
-            devices_to_backup.append(device)
+    # Look up the devices to backup
+    devices_to_backup = discovery.store.get_many(device_ips)
+    for device in devices_to_backup:
+        # Add connection credentials (should be from secure storage)
+        device['username'] = 'admin'
+        device['password'] = 'cisco123'  # In production, use secure credential management
     
     def run_backup():
         backup_mgr.backup_multiple_devices(devices_to_backup)
@@ -84,16 +85,11 @@ def start_deployment():
     device_variables = data.get('variables', {})
     dry_run = data.get('dry_run', True)
     
-    # Load device inventory
-    all_devices = discovery.load_inventory()
-    
-    # Filter devices for deployment
-    devices_to_deploy = []
-    for device in all_devices:
-        if device['ip'] in device_ips:
-            device['username'] = 'admin'
-            device['password'] = 'cisco123'
-            devices_to_deploy.append(device)
+    # Look up the devices for deployment
+    devices_to_deploy = discovery.store.get_many(device_ips)
+    for device in devices_to_deploy:
+        device['username'] = 'admin'
+        device['password'] = 'cisco123'
     
     def run_deployment():
         results = deployment_mgr.bulk_deploy(
@@ -177,7 +173,7 @@ def get_logs():
 @app.route('/api/system-status')
 def system_status():
     """Get system status information"""
-    devices = discovery.load_inventory()
+    inventory = discovery.store.snapshot()
     
     # Count backups
     backup_count = 0
@@ -191,11 +187,11 @@ def system_status():
     
     status = {
         'timestamp': datetime.now().isoformat(),
-        'discovered_devices': len(devices),
+        'discovered_devices': len(inventory.devices),
         'backup_count': backup_count,
         'template_count': template_count,
         'system_uptime': 'Running',
-        'last_discovery': 'Never' if not devices else max(device.get('discovered_at', '') for device in devices)
+        'last_discovery': inventory.last_discovery or 'Never'
     }
     
     return jsonify(status)
@@ -4,77 +4,101 @@ Network Device Discovery Module
 Discovers network devices using SNMP and CDP protocols
 """
 
-import socket
-import subprocess
+import asyncio
 import ipaddress
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from pysnmp.hlapi import *
 import json
+import threading
 from datetime import datetime
+from ping_engine import AsyncPinger
+from snmp_client import AsyncSnmpClient
+from inventory_store import InventoryStore
+
+# Standard SNMP OIDs
+SYSTEM_OIDS = {
+    'hostname': '1.3.6.1.2.1.1.5.0',      # sysName
+    'description': '1.3.6.1.2.1.1.1.0',   # sysDescr
+    'uptime': '1.3.6.1.2.1.1.3.0',        # sysUpTime
+    'contact': '1.3.6.1.2.1.1.4.0',       # sysContact
+    'location': '1.3.6.1.2.1.1.6.0'       # sysLocation
+}
+
+# Cheap change-detection probe, read with the system OIDs on a full collection
+PROBE_OIDS = {
+    'uptime': '1.3.6.1.2.1.1.3.0',                # sysUpTime
+    'object_id': '1.3.6.1.2.1.1.2.0',             # sysObjectID
+    'engine_id': '1.3.6.1.6.3.10.2.1.1.0',        # snmpEngineID
+    'if_number': '1.3.6.1.2.1.2.1.0',             # ifNumber
+    'if_table_last_change': '1.3.6.1.2.1.31.1.5.0'  # ifTableLastChange
+}
+
+# ifTable and ifXTable columns collected per interface
+INTERFACE_COLUMNS = {
+    'description': '1.3.6.1.2.1.2.2.1.2',     # ifDescr
+    'type': '1.3.6.1.2.1.2.2.1.3',            # ifType
+    'mtu': '1.3.6.1.2.1.2.2.1.4',             # ifMtu
+    'speed': '1.3.6.1.2.1.2.2.1.5',           # ifSpeed
+    'mac': '1.3.6.1.2.1.2.2.1.6',             # ifPhysAddress
+    'admin_status': '1.3.6.1.2.1.2.2.1.7',    # ifAdminStatus
+    'status': '1.3.6.1.2.1.2.2.1.8',          # ifOperStatus
+    'last_change': '1.3.6.1.2.1.2.2.1.9',     # ifLastChange
+    'name': '1.3.6.1.2.1.31.1.1.1.1',         # ifName
+    'high_speed': '1.3.6.1.2.1.31.1.1.1.15',  # ifHighSpeed
+    'alias': '1.3.6.1.2.1.31.1.1.1.18'        # ifAlias
+}
+
+IF_STATUS = {1: 'up', 2: 'down', 3: 'testing', 4: 'unknown', 5: 'dormant', 6: 'notPresent', 7: 'lowerLayerDown'}
 
 class NetworkDiscovery:
-    def __init__(self, community="public", timeout=2, retries=1):
+    def __init__(self, community="public", timeout=2, retries=1, ping_timeout=1.0, ping_window=4096,
+                 snmp_in_flight=256, max_repetitions=25, inventory_path="network_inventory.db"):
         self.community = community
         self.timeout = timeout
         self.retries = retries
+        self.snmp = AsyncSnmpClient(community, timeout=timeout, retries=retries, max_in_flight=snmp_in_flight,
+                                    max_repetitions=max_repetitions)
         self.discovered_devices = []
+        self.store = InventoryStore(inventory_path)
+        self.last_run_stats = {}
+        self.pinger = AsyncPinger(timeout=ping_timeout, window=ping_window)
+        self.ping_rtts = {}
+        # The SNMP client, the pinger and last_run_stats belong to one run at a time
+        self._run_lock = threading.Lock()
+
+    def _run(self, coroutine):
+        """Run coroutine on a fresh loop and close the SNMP engine before the loop goes
+
+        Runs from other threads (e.g. overlapping /api/discover requests) wait
+        their turn rather than sharing the engine across loops.
+        """
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                self.snmp.close()
+
+        with self._run_lock:
+            return asyncio.run(run())
 
     def ping_sweep(self, network):
         """Perform ping sweep to find active hosts"""
-        active_hosts = []
+        return self._run(self.ping_sweep_async(network))
+
+    async def ping_sweep_async(self, network):
         network_obj = ipaddress.ip_network(network, strict=False)
-        
-        def ping_host(ip):
-            try:
-                # Ping command varies by OS
-                import platform
-                if platform.system().lower() == "windows":
-                    cmd = ["ping", "-n", "1", "-w", "1000", str(ip)]
-                else:
-                    cmd = ["ping", "-c", "1", "-W", "1", str(ip)]
-                
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    return str(ip)
-            except Exception:
-                pass
-            return None
-
-        # Use ThreadPoolExecutor for concurrent pings
-        with ThreadPoolExecutor(max_workers=50) as executor:
-            future_to_ip = {executor.submit(ping_host, ip): ip for ip in network_obj.hosts()}
-            
-            for future in as_completed(future_to_ip):
-                result = future.result()
-                if result:
-                    active_hosts.append(result)
-                    print(f"Active host found: {result}")
 
-        return active_hosts
+        def on_reply(ip, rtt):
+            print(f"Active host found: {ip}" + (f" ({rtt} ms)" if rtt is not None else ""))
 
-    def snmp_query(self, target, oid):
-        """Query SNMP OID from target device"""
-        try:
-            for (errorIndication, errorStatus, errorIndex, varBinds) in nextCmd(
-                SnmpEngine(),
-                CommunityData(self.community),
-                UdpTransportTarget((target, 161), timeout=self.timeout, retries=self.retries),
-                ContextData(),
-                ObjectType(ObjectIdentity(oid)),
-                lexicographicMode=False):
-
-                if errorIndication:
-                    break
-                elif errorStatus:
-                    break
-                else:
-                    for varBind in varBinds:
-                        return str(varBind[1])
-        except Exception as e:
-            return None
+        rtts = await self.pinger.sweep_async(network_obj.hosts(), on_reply=on_reply)
+        self.ping_rtts.update(rtts)
+        return sorted(rtts, key=ipaddress.ip_address)
 
     def get_device_info(self, ip):
         """Get comprehensive device information via SNMP"""
+        return self._run(self.get_device_info_async(ip))
+
+    async def get_device_info_async(self, ip):
+        """Device information from one multi-varbind GET plus the interface table"""
         device_info = {
             'ip': ip,
             'hostname': None,
@@ -84,25 +108,21 @@ class NetworkDiscovery:
             'os_version': None,
             'uptime': None,
             'interfaces': [],
+            'rtt_ms': self.ping_rtts.get(ip),
             'discovered_at': datetime.now().isoformat()
         }
 
-        # Standard SNMP OIDs
-        oids = {
-            'hostname': '1.3.6.1.2.1.1.5.0',      # sysName
-            'description': '1.3.6.1.2.1.1.1.0',   # sysDescr
-            'uptime': '1.3.6.1.2.1.1.3.0',        # sysUpTime
-            'contact': '1.3.6.1.2.1.1.4.0',       # sysContact
-            'location': '1.3.6.1.2.1.1.6.0'       # sysLocation
-        }
-
         print(f"Querying device: {ip}")
-        
-        # Query basic system information
-        for key, oid in oids.items():
-            value = self.snmp_query(ip, oid)
-            if value and value != "None":
-                device_info[key] = value
+
+        # Query basic system information and the change-detection probe together
+        values = await self.snmp.get(ip, list(dict.fromkeys([*SYSTEM_OIDS.values(), *PROBE_OIDS.values()])))
+        if values is None:
+            return device_info
+        for key, oid in SYSTEM_OIDS.items():
+            if oid in values:
+                device_info[key] = str(values[oid])
+        device_info.update(self._probe_state(values))
+        device_info['last_seen'] = device_info['discovered_at']
 
         # Parse vendor/model from description
         if device_info['description']:
@@ -117,76 +137,178 @@ class NetworkDiscovery:
                 device_info['vendor'] = 'Arista'
 
         # Get interface information
-        device_info['interfaces'] = self.get_interface_info(ip)
+        device_info['interfaces'] = await self.get_interface_info_async(ip)
 
         return device_info
 
     def get_interface_info(self, ip):
         """Get interface information from device"""
+        return self._run(self.get_interface_info_async(ip))
+
+    async def get_interface_info_async(self, ip):
+        """Walk the ifTable and ifXTable columns with GETBULK"""
         interfaces = []
-        
-        # Interface description OID base
-        if_descr_oid = '1.3.6.1.2.1.2.2.1.2'
-        if_status_oid = '1.3.6.1.2.1.2.2.1.8'
-        
+
         try:
-            # Query interface descriptions
-            for i in range(1, 25):  # Check first 24 interfaces
-                descr = self.snmp_query(ip, f"{if_descr_oid}.{i}")
-                status = self.snmp_query(ip, f"{if_status_oid}.{i}")
-                
-                if descr and descr != "None":
-                    interfaces.append({
-                        'index': i,
-                        'description': descr,
-                        'status': 'up' if status == '1' else 'down'
-                    })
+            table = await self.snmp.walk(ip, list(INTERFACE_COLUMNS.values()))
+            if table is None:
+                return interfaces
+            columns = {key: table[oid] for key, oid in INTERFACE_COLUMNS.items()}
+            for index in sorted(columns['description']):
+                row = {key: values.get(index) for key, values in columns.items()}
+                interfaces.append(self._interface(index, row))
         except Exception as e:
             print(f"Error getting interface info for {ip}: {e}")
 
         return interfaces
 
-    def discover_network(self, networks):
-        """Discover all devices in given networks"""
-        all_devices = []
-        
+    @staticmethod
+    def _interface(index, row):
+        """Interface dict from one ifTable/ifXTable row"""
+        def number(key):
+            return int(row[key]) if row[key] is not None else None
+
+        speed = number('speed')
+        high_speed = number('high_speed')
+        mac = row['mac'].asOctets() if row['mac'] is not None else b''
+        return {
+            'index': index[0] if len(index) == 1 else '.'.join(str(part) for part in index),
+            'description': str(row['description']),
+            'name': str(row['name']) if row['name'] is not None else None,
+            'alias': str(row['alias']) if row['alias'] is not None else None,
+            'status': IF_STATUS.get(number('status'), 'down') if row['status'] is not None else 'down',
+            'admin_status': IF_STATUS.get(number('admin_status')) if row['admin_status'] is not None else None,
+            'type': number('type'),
+            'mtu': number('mtu'),
+            # ifSpeed saturates at 4.29 Gb/s; ifHighSpeed is already in Mb/s
+            'speed_mbps': high_speed if high_speed else (speed // 1000000 if speed is not None else None),
+            'mac': ':'.join(f"{octet:02x}" for octet in mac) or None,
+            'last_change': number('last_change')
+        }
+
+    @staticmethod
+    def _probe_state(values):
+        """Comparable fields of a probe response"""
+        def number(key):
+            value = values.get(PROBE_OIDS[key])
+            return int(value) if value is not None else None
+
+        engine_id = values.get(PROBE_OIDS['engine_id'])
+        object_id = values.get(PROBE_OIDS['object_id'])
+        return {
+            'uptime_ticks': number('uptime'),
+            'object_id': str(object_id) if object_id is not None else None,
+            'engine_id': engine_id.asOctets().hex() if engine_id is not None else None,
+            'if_number': number('if_number'),
+            'if_table_last_change': number('if_table_last_change')
+        }
+
+    @staticmethod
+    def _change_reason(cached, state):
+        """Why a cached device needs a full re-collect, or None if it is unchanged"""
+        if cached.get('object_id') != state['object_id']:
+            return 'changed'
+        if state['uptime_ticks'] is None or cached.get('uptime_ticks') is None:
+            return 'changed'
+        if state['uptime_ticks'] < cached['uptime_ticks']:
+            return 'rebooted'
+        for key in ('if_number', 'if_table_last_change'):
+            if cached.get(key) != state[key]:
+                return 'changed'
+        return None
+
+    async def _collect(self, ip, reason):
+        """Full collection; a host that did not answer with a sysName counts as unreachable"""
+        device_info = await self.get_device_info_async(ip)
+        if not device_info.get('hostname'):
+            return None, 'unreachable'
+        return device_info, reason
+
+    async def refresh_device(self, ip, cache, known_ips):
+        """Probe a known device and re-collect only if it was replaced, rebooted or changed
+
+        cache is keyed by (ip, engine_id), so a different device answering on
+        a known ip is never matched against the old one's state.
+        """
+        if ip not in known_ips:
+            return await self._collect(ip, 'new')
+        values = await self.snmp.get(ip, list(PROBE_OIDS.values()))
+        if values is None:
+            return None, 'unreachable'
+        state = self._probe_state(values)
+        cached = cache.get((ip, state['engine_id']))
+        if cached is None:
+            return await self._collect(ip, 'replaced')
+        reason = self._change_reason(cached, state)
+        if reason is not None:
+            return await self._collect(ip, reason)
+        device_info = dict(cached)
+        device_info.update(state)
+        device_info['uptime'] = str(state['uptime_ticks'])
+        device_info['rtt_ms'] = self.ping_rtts.get(ip)
+        device_info['last_seen'] = datetime.now().isoformat()
+        return device_info, 'unchanged'
+
+    async def refresh_devices(self, ips, cache):
+        """Refresh every host concurrently against the (ip, engine_id) device cache"""
+        known_ips = {ip for ip, _engine_id in cache}
+        results = await asyncio.gather(*(self.refresh_device(ip, cache, known_ips) for ip in ips),
+                                       return_exceptions=True)
+        refreshed = []
+        for ip, result in zip(ips, results):
+            if isinstance(result, Exception):
+                print(f"Error processing device {ip}: {result}")
+                continue
+            device_info, reason = result
+            self.last_run_stats[reason] = self.last_run_stats.get(reason, 0) + 1
+            if device_info is not None:
+                refreshed.append(device_info)
+        return refreshed
+
+    def discover_network(self, networks, full=False):
+        """Discover all devices in given networks
+
+        Devices already in the inventory get one probe and are only
+        re-collected when new, rebooted or changed; full=True re-collects all.
+        """
+        return self._run(self.discover_network_async(networks, full))
+
+    async def discover_network_async(self, networks, full=False):
+        """Sweep and probe every network on the running loop, sharing one SNMP engine"""
+        if not self.discovered_devices:
+            self.load_inventory()
+        cache = {} if full else {(device['ip'], device.get('engine_id')): device for device in self.discovered_devices}
+        scanned = [ipaddress.ip_network(network, strict=False) for network in networks]
+        # Devices outside the scanned networks are kept as they are
+        all_devices = [device for device in self.discovered_devices
+                       if not any(ipaddress.ip_address(device['ip']) in network for network in scanned)]
+        self.last_run_stats = {}
+
         for network in networks:
             print(f"Scanning network: {network}")
-            active_hosts = self.ping_sweep(network)
+            active_hosts = await self.ping_sweep_async(network)
             
             print(f"Found {len(active_hosts)} active hosts in {network}")
             
-            # Query each active host via SNMP
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                future_to_ip = {executor.submit(self.get_device_info, ip): ip 
-                               for ip in active_hosts}
-                
-                for future in as_completed(future_to_ip):
-                    try:
-                        device_info = future.result()
-                        if device_info and device_info.get('hostname'):
-                            all_devices.append(device_info)
-                            print(f"Discovered device: {device_info['hostname']} ({device_info['ip']})")
-                    except Exception as e:
-                        print(f"Error processing device: {e}")
+            # Probe every active host via SNMP, hundreds in flight at once
+            for device_info in await self.refresh_devices(active_hosts, cache):
+                if device_info.get('hostname'):
+                    all_devices.append(device_info)
+                    print(f"Discovered device: {device_info['hostname']} ({device_info['ip']})")
 
+        print(f"Rediscovery summary: {self.last_run_stats}")
         self.discovered_devices = all_devices
         return all_devices
 
-    def save_inventory(self, filename="network_inventory.json"):
-        """Save discovered devices to JSON file"""
-        with open(filename, 'w') as f:
-            json.dump(self.discovered_devices, f, indent=2)
-        print(f"Inventory saved to {filename}")
+    def save_inventory(self):
+        """Save discovered devices to the inventory store in one transaction"""
+        self.store.replace(self.discovered_devices)
+        print(f"Inventory saved to {self.store.path}")
 
-    def load_inventory(self, filename="network_inventory.json"):
-        """Load device inventory from JSON file"""
-        try:
-            with open(filename, 'r') as f:
-                self.discovered_devices = json.load(f)
-            return self.discovered_devices
-        except FileNotFoundError:
-            return []
+    def load_inventory(self):
+        """Load device inventory from the store's cached snapshot"""
+        self.discovered_devices = list(self.store.all_devices())
+        return self.discovered_devices
 
 def main():
     """Main discovery function"""
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Device Inventory Store
+Keeps the discovered device inventory in SQLite, indexed by ip, hostname,
+vendor and subnet, and written with atomic upserts. Reads are answered from an
+in-memory snapshot that is rebuilt only when the write generation stored in
+the database moves, so other processes' writes are picked up too.
+"""
+
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    ip TEXT PRIMARY KEY,
+    engine_id TEXT,
+    hostname TEXT,
+    vendor TEXT,
+    subnet TEXT,
+    discovered_at TEXT,
+    last_seen TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_devices_hostname ON devices (hostname);
+CREATE INDEX IF NOT EXISTS ix_devices_vendor ON devices (vendor);
+CREATE INDEX IF NOT EXISTS ix_devices_subnet ON devices (subnet);
+CREATE INDEX IF NOT EXISTS ix_devices_discovered_at ON devices (discovered_at);
+CREATE TABLE IF NOT EXISTS inventory_meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO inventory_meta (key, value) VALUES ('generation', 0);
+"""
+
+UPSERT = """
+INSERT INTO devices (ip, engine_id, hostname, vendor, subnet, discovered_at, last_seen, data)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (ip) DO UPDATE SET
+    engine_id = excluded.engine_id,
+    hostname = excluded.hostname,
+    vendor = excluded.vendor,
+    subnet = excluded.subnet,
+    discovered_at = excluded.discovered_at,
+    last_seen = excluded.last_seen,
+    data = excluded.data
+"""
+
+
+class InventorySnapshot:
+    def __init__(self, generation, devices):
+        self.generation = generation
+        self.devices = devices
+        self.by_ip = {device['ip']: device for device in devices}
+        self.last_discovery = max((device.get('discovered_at') or '' for device in devices), default=None) or None
+        self.json = json.dumps(devices)
+
+
+class InventoryStore:
+    def __init__(self, path="network_inventory.db", legacy_json="network_inventory.json", subnet_prefix=24):
+        self.path = path
+        self.subnet_prefix = subnet_prefix
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        if legacy_json and os.path.exists(legacy_json) and self.count() == 0:
+            self._import_json(legacy_json)
+
+    def _import_json(self, filename):
+        """One-time import of the inventory file written by earlier versions"""
+        try:
+            with open(filename, 'r') as f:
+                devices = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not import {filename}: {e}")
+            return
+        self.upsert(devices)
+        print(f"Imported {len(devices)} devices from {filename}")
+
+    def subnet(self, ip):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        prefix = self.subnet_prefix if address.version == 4 else 64
+        return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+    def _row(self, device):
+        return (device['ip'], device.get('engine_id'), device.get('hostname'), device.get('vendor'),
+                self.subnet(device['ip']), device.get('discovered_at'), device.get('last_seen'),
+                json.dumps(device))
+
+    def _write(self, statements):
+        """Run statements and bump the generation in one transaction"""
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, parameters, many in statements:
+                    if many:
+                        connection.executemany(sql, parameters)
+                    else:
+                        connection.execute(sql, parameters)
+                connection.execute("UPDATE inventory_meta SET value = value + 1 WHERE key = 'generation'")
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def upsert(self, devices):
+        """Insert or update devices by ip"""
+        self._write([(UPSERT, [self._row(device) for device in devices], True)])
+
+    def replace(self, devices):
+        """Make the inventory exactly devices: upsert them and delete every other ip"""
+        self._write([
+            ("CREATE TEMP TABLE IF NOT EXISTS seen_ips (ip TEXT PRIMARY KEY)", (), False),
+            ("DELETE FROM seen_ips", (), False),
+            ("INSERT OR IGNORE INTO seen_ips (ip) VALUES (?)", [(device['ip'],) for device in devices], True),
+            (UPSERT, [self._row(device) for device in devices], True),
+            ("DELETE FROM devices WHERE ip NOT IN (SELECT ip FROM seen_ips)", (), False)
+        ])
+
+    def delete(self, ips):
+        self._write([("DELETE FROM devices WHERE ip = ?", [(ip,) for ip in ips], True)])
+
+    def generation(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT value FROM inventory_meta WHERE key = 'generation'").fetchone()[0]
+
+    def snapshot(self):
+        """Current snapshot, reloaded only when the write generation has moved"""
+        generation = self.generation()
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.generation == generation:
+            return snapshot
+        with self._lock:
+            # Generation and rows read in one transaction so they agree
+            self._connection.execute("BEGIN")
+            try:
+                generation = self._connection.execute(
+                    "SELECT value FROM inventory_meta WHERE key = 'generation'").fetchone()[0]
+                rows = self._connection.execute("SELECT data FROM devices ORDER BY ip").fetchall()
+            finally:
+                self._connection.execute("COMMIT")
+        snapshot = InventorySnapshot(generation, [json.loads(row['data']) for row in rows])
+        self._snapshot = snapshot
+        return snapshot
+
+    def all_devices(self):
+        """Every device; the dicts are shared with the cache and must not be modified"""
+        return self.snapshot().devices
+
+    def get_many(self, ips):
+        """Copies of the devices with the given ips, safe to modify"""
+        by_ip = self.snapshot().by_ip
+        return [json.loads(json.dumps(by_ip[ip])) for ip in ips if ip in by_ip]
+
+    def find(self, hostname=None, vendor=None, subnet=None):
+        """Devices matching every given field, looked up through the indexes"""
+        criteria = []
+        parameters = []
+        for column, value in (('hostname', hostname), ('vendor', vendor), ('subnet', subnet)):
+            if value:
+                criteria.append(f"{column} = ?")
+                parameters.append(value)
+        if not criteria:
+            return self.all_devices()
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT ip FROM devices WHERE {' AND '.join(criteria)} ORDER BY ip", parameters).fetchall()
+        by_ip = self.snapshot().by_ip
+        return [by_ip[row['ip']] for row in rows if row['ip'] in by_ip]
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM devices").fetchone()[0]
+
+    def last_discovery(self):
+        return self.snapshot().last_discovery
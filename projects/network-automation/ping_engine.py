@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Asyncio Ping Engine
+Sweeps hosts with ICMP echo using a bounded in-flight window instead of one
+ping process per host. Uses unprivileged ICMP datagram sockets where the
+kernel allows them (Linux net.ipv4.ping_group_range, macOS) and falls back to
+async ping subprocesses elsewhere. Reports the round-trip time of every host
+that answered.
+"""
+
+import asyncio
+import ipaddress
+import platform
+import re
+import socket
+import struct
+import time
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+RTT_PATTERN = re.compile(r'time[=<]\s*([\d.]+)\s*ms', re.IGNORECASE)
+
+
+def checksum(data):
+    """RFC 1071 Internet checksum"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def echo_request(sequence, payload=b'netauto!'):
+    """ICMP echo request; the kernel replaces the identifier on datagram sockets"""
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, 0, sequence)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum(header + payload), 0, sequence) + payload
+
+
+def parse_echo_reply(data):
+    """Sequence number of an echo reply, or None for anything else"""
+    if len(data) >= 20 and data[0] >> 4 == 4:
+        # macOS delivers the IP header too
+        data = data[(data[0] & 0x0f) * 4:]
+    if len(data) < 8:
+        return None
+    icmp_type, _code, _checksum, _identifier, sequence = struct.unpack('!BBHHH', data[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return sequence
+
+
+class AsyncPinger:
+    def __init__(self, timeout=1.0, window=4096, subprocess_window=256, use_sockets=True):
+        self.timeout = timeout
+        self.window = window
+        self.subprocess_window = subprocess_window
+        self.use_sockets = use_sockets
+        self.method = None
+        self._pending = {}
+        self._sequence = 0
+
+    def sweep(self, hosts):
+        """Ping every host; returns {ip: rtt_ms} for the hosts that answered
+
+        rtt_ms is None when a host answered a ping subprocess whose output
+        carried no round-trip time
+        """
+        return asyncio.run(self.sweep_async(hosts))
+
+    async def sweep_async(self, hosts, on_reply=None):
+        hosts = [str(host) for host in hosts]
+        sock = self._open_socket() if self.use_sockets else None
+        if sock is not None:
+            self.method = 'icmp-socket'
+            # The ICMP socket is IPv4 only; other hosts take the subprocess window
+            ipv4 = [ip for ip in hosts if ipaddress.ip_address(ip).version == 4]
+            others = [ip for ip in hosts if ipaddress.ip_address(ip).version != 4]
+            try:
+                results = await self._run(ipv4, self._ping_socket, sock, self.window, on_reply)
+            finally:
+                asyncio.get_running_loop().remove_reader(sock.fileno())
+                sock.close()
+                self._pending.clear()
+            if others:
+                results.update(await self._run(others, self._ping_subprocess, None, self.subprocess_window,
+                                               on_reply))
+            return results
+        self.method = 'subprocess'
+        return await self._run(hosts, self._ping_subprocess, None, self.subprocess_window, on_reply)
+
+    async def _run(self, hosts, ping, sock, window, on_reply):
+        if sock is not None:
+            asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable, sock)
+        semaphore = asyncio.Semaphore(window)
+        results = {}
+
+        async def probe(ip):
+            async with semaphore:
+                rtt = await ping(ip, sock)
+            if rtt is not False:
+                results[ip] = rtt
+                if on_reply is not None:
+                    on_reply(ip, rtt)
+
+        await asyncio.gather(*(probe(ip) for ip in hosts))
+        return results
+
+    @staticmethod
+    def _open_socket():
+        """Unprivileged ICMP datagram socket, or None when the kernel refuses one"""
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+        except (OSError, AttributeError):
+            return None
+        sock.setblocking(False)
+        return sock
+
+    def _on_readable(self, sock):
+        while True:
+            try:
+                data, address = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            sequence = parse_echo_reply(data)
+            if sequence is None:
+                continue
+            future = self._pending.pop((address[0], sequence), None)
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+
+    async def _ping_socket(self, ip, sock):
+        loop = asyncio.get_running_loop()
+        self._sequence = (self._sequence + 1) & 0xffff
+        key = (ip, self._sequence)
+        future = loop.create_future()
+        self._pending[key] = future
+        sent = time.perf_counter()
+        try:
+            await loop.sock_sendto(sock, echo_request(self._sequence), (ip, 0))
+            received = await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, OSError):
+            return False
+        finally:
+            self._pending.pop(key, None)
+        return round((received - sent) * 1000, 3)
+
+    def _ping_command(self, ip):
+        if platform.system().lower() == "windows":
+            return ["ping", "-n", "1", "-w", str(int(self.timeout * 1000)), ip]
+        return ["ping", "-c", "1", "-W", str(max(1, round(self.timeout))), ip]
+
+    async def _ping_subprocess(self, ip, _sock):
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *self._ping_command(ip), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+            )
+            output, _ = await process.communicate()
+        except OSError:
+            return False
+        if process.returncode != 0:
+            return False
+        match = RTT_PATTERN.search(output.decode(errors='replace'))
+        return float(match.group(1)) if match else None
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Async SNMP Client
+Reads many OIDs from many devices concurrently over one SNMP engine per event
+loop: each device is asked for all of its scalars in a single multi-varbind
+GET, tables are walked column-parallel with GETBULK, and a semaphore bounds
+how many requests are in flight at once.
+"""
+
+import asyncio
+
+from pysnmp.hlapi.asyncio import (CommunityData, ContextData, ObjectIdentity, ObjectType, SnmpEngine,
+                                  UdpTransportTarget, bulkCmd, getCmd)
+from pysnmp.proto.rfc1905 import EndOfMibView, NoSuchInstance, NoSuchObject
+
+MISSING_VALUES = (NoSuchObject, NoSuchInstance, EndOfMibView)
+
+
+class AsyncSnmpClient:
+    def __init__(self, community="public", timeout=2, retries=1, max_in_flight=256, max_repetitions=25, port=161):
+        self.community = community
+        self.timeout = timeout
+        self.retries = retries
+        self.max_in_flight = max_in_flight
+        self.max_repetitions = max_repetitions
+        self.port = port
+        self._engine = None
+        self._loop = None
+        self._semaphore = None
+
+    def _session(self):
+        """Engine and in-flight limit for the running loop, created once per loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self.close()
+            self._loop = loop
+            self._engine = SnmpEngine()
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._engine, self._semaphore
+
+    def close(self):
+        """Close the engine's dispatcher and its UDP socket
+
+        Call from inside the loop the engine ran on, once its requests are done.
+        """
+        engine = self._engine
+        self._engine = self._loop = self._semaphore = None
+        if engine is None or engine.transportDispatcher is None:
+            return
+        try:
+            engine.transportDispatcher.closeDispatcher()
+        except RuntimeError:
+            # Its loop is already closed; the socket goes with the engine
+            pass
+
+    def target(self, ip):
+        return UdpTransportTarget((ip, self.port), timeout=self.timeout, retries=self.retries)
+
+    async def get(self, ip, oids):
+        """GET every OID in one request; returns {oid: value} or None when unreachable
+
+        OIDs the agent does not implement are left out of the result.
+        """
+        engine, semaphore = self._session()
+        async with semaphore:
+            try:
+                error_indication, error_status, error_index, var_binds = await getCmd(
+                    engine, CommunityData(self.community), self.target(ip), ContextData(),
+                    *[ObjectType(ObjectIdentity(oid)) for oid in oids], lookupMib=False
+                )
+            except Exception as e:
+                print(f"SNMP GET error for {ip}: {e}")
+                return None
+        if error_indication:
+            return None
+        if error_status:
+            print(f"SNMP GET error for {ip}: {error_status.prettyPrint()} at {error_index}")
+            return None
+        values = {}
+        for oid, (_name, value) in zip(oids, var_binds):
+            if isinstance(value, MISSING_VALUES):
+                continue
+            values[oid] = value
+        return values
+
+    async def walk(self, ip, columns, max_repetitions=None):
+        """Walk table columns side by side with GETBULK
+
+        Returns {column: {index: value}}, index being the OID suffix after the
+        column as a tuple, or None when the device did not answer. Each request
+        asks for the next max_repetitions rows of every column not yet exhausted.
+        """
+        engine, semaphore = self._session()
+        max_repetitions = max_repetitions or self.max_repetitions
+        prefixes = {column: tuple(int(part) for part in column.split('.')) for column in columns}
+        cursors = dict(prefixes)
+        results = {column: {} for column in columns}
+        active = list(columns)
+
+        while active:
+            async with semaphore:
+                try:
+                    error_indication, error_status, error_index, var_bind_table = await bulkCmd(
+                        engine, CommunityData(self.community), self.target(ip), ContextData(),
+                        0, max_repetitions,
+                        *[ObjectType(ObjectIdentity(cursors[column])) for column in active], lookupMib=False
+                    )
+                except Exception as e:
+                    print(f"SNMP GETBULK error for {ip}: {e}")
+                    return None
+            if error_indication:
+                return None
+            if error_status:
+                print(f"SNMP GETBULK error for {ip}: {error_status.prettyPrint()} at {error_index}")
+                return None
+
+            finished = set()
+            progressed = set()
+            for row in var_bind_table:
+                for column, (name, value) in zip(active, row):
+                    if column in finished:
+                        continue
+                    name = tuple(name)
+                    prefix = prefixes[column]
+                    if (isinstance(value, MISSING_VALUES) or name[:len(prefix)] != prefix
+                            or name <= cursors[column]):
+                        # Left the column, or an agent that does not advance
+                        finished.add(column)
+                        continue
+                    results[column][name[len(prefix):]] = value
+                    cursors[column] = name
+                    progressed.add(column)
+            active = [column for column in active if column not in finished and column in progressed]
+        return results